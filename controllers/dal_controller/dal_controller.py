@@ -3,6 +3,7 @@
 import sys
 import os
 import math
+import time
 import socket
 import struct
 
@@ -13,10 +14,12 @@ sys.path.insert(0, os.path.dirname(__file__))
 from controller import Supervisor, Keyboard
 from robot_drivers import get_driver
 from utils.protocol import (
-    POSITION_PORT, CAMERA_PORT,
-    pack_position, pack_camera,
+    POSITION_PORT, CAMERA_PORT, METRICS_PORT_BASE,
+    pack_position, pack_camera, pack_stamp,
     CAMERA_HEADER_SIZE
 )
+from utils.step_profiler import make_profiler
+from utils.metrics import make_metrics
 
 robot = Supervisor()
 timestep = int(robot.getBasicTimeStep())
@@ -79,7 +82,26 @@ print()
 
 step_count = 0
 cam_step = 0
+pos_seq = 0   # STAMP sequence numbers, per stream
+cam_seq = 0
+prof = make_profiler(driver.ROBOT_ID, robot_name)  # no-op unless DAL_PROFILE is set
+
+# Metrics (no-op unless DAL_METRICS is set); loop counters are read only when scraped
+metrics = make_metrics('dal_controller', METRICS_PORT_BASE + driver.ROBOT_ID, driver.ROBOT_ID)
+metrics.counter('dal_steps_total', 'Control steps completed').set_function(lambda: step_count)
+m_step = metrics.histogram('dal_step_seconds', 'Controller work per step, outside robot.step()')
+m_packets = metrics.counter('dal_packets_sent_total', 'Sensor packets stamped for sending', ('stream',))
+m_packets.labels('position').set_function(lambda: pos_seq)
+m_packets.labels('camera').set_function(lambda: cam_seq)
+m_bytes = metrics.counter('dal_bytes_sent_total', 'Sensor bytes sent', ('stream',))
+m_pos_bytes, m_cam_bytes = m_bytes.labels('position'), m_bytes.labels('camera')
+m_send_errors = metrics.counter('dal_send_errors_total', 'Sensor packets that failed to send')
+
+prof.start()
 while robot.step(timestep) != -1:
+    prof.lap('sim')
+    step_start = time.perf_counter()
+    step_wall = time.time()   # STAMP reference: receivers measure latency from here
     step_count += 1
     pos = robot_node.getPosition()
     heading = get_heading()
@@ -87,12 +109,17 @@ while robot.step(timestep) != -1:
     lidar_ranges = []
     if lidar is not None:
         lidar_ranges = list(lidar.getRangeImage())
+    prof.lap('sensors')
 
     try:
         data = pack_position(driver.ROBOT_ID, pos[0], pos[1], heading, lidar_ranges)
+        data += pack_stamp(pos_seq, step_wall, robot.getTime())
         pos_sock.sendto(data, VIZ_ADDR)
+        m_pos_bytes.inc(len(data))
     except Exception:
-        pass
+        m_send_errors.inc()
+    pos_seq += 1
+    prof.lap('udp_pos')
 
     cam_step += 1
     if camera is not None and cam_step % 4 == 0:
@@ -108,10 +135,14 @@ while robot.step(timestep) != -1:
                     raw[dst + 2] = img[src]
 
                 payload = pack_camera(driver.ROBOT_ID, cam_w, cam_h, bytes(raw))
+                payload += pack_stamp(cam_seq, step_wall, robot.getTime())
+                cam_seq += 1
                 if len(payload) <= MAX_CAM_UDP:
                     cam_sock.sendto(payload, CAM_ADDR)
+                    m_cam_bytes.inc(len(payload))
         except Exception:
-            pass
+            m_send_errors.inc()
+    prof.lap('camera')
 
     if step_count % 200 == 0:
         print(f"[{robot_name}] X={pos[0]:.2f} Y={pos[1]:.2f} H={math.degrees(heading):.0f}deg "
@@ -133,3 +164,6 @@ while robot.step(timestep) != -1:
         driver.turn_right()
     else:
         driver.stop()
+    prof.lap('teleop')
+    prof.end_step()
+    m_step.observe(time.perf_counter() - step_start)
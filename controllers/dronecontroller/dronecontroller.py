@@ -1,11 +1,30 @@
-"""Simple Mavic controller: takeoff and hover at a fixed point."""
+"""Mavic controller: PID hover + TCP WAYPOINT/PATH navigation with altitude, 3D pose streaming."""
 
-from controller import Robot
 import sys
-try:
-    import numpy as np
-except ImportError:
-    sys.exit("Warning: 'numpy' module not found.")
+import os
+import re
+import math
+import time
+import socket
+import select
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, project_root)
+
+from controller import Robot
+from utils.protocol import (
+    POSITION_PORT, COMMAND_PORT_BASE, METRICS_PORT_BASE, ROBOT_MAVIC,
+    pack_position3d, pack_stamp,
+    send_reached_ack, parse_waypoint3d_command,
+    parse_path_command, parse_path3d_command
+)
+from utils.metrics import make_metrics
+
+TWO_PI = 2.0 * math.pi
+
+STATE_HOLD = 0        # hover at the current target
+STATE_NAVIGATING = 1  # single waypoint, REACHED on arrival
+STATE_PATH = 2        # sequential waypoints, REACHED after the last one
 
 
 def clamp(value, value_min, value_max):
@@ -18,10 +37,22 @@ class MavicController(Robot):
     K_VERTICAL_P = 2.0
     K_ROLL_P = 40.0
     K_PITCH_P = 25.0
+    K_XY = 0.5
+    TILT_MAX_XY = 0.55
+    DAMP_XY = 2.0
+
+    DISTANCE_TOLERANCE = 0.30  # meters, horizontal
+    ALTITUDE_TOLERANCE = 0.20  # meters
+    DEFAULT_ALTITUDE = 1.0
 
     def __init__(self):
         Robot.__init__(self)
         self.time_step = int(self.getBasicTimeStep())
+        self.dt = self.time_step * 0.001
+
+        name = self.getName()
+        m = re.search(r'(\d+)$', name)
+        self.robot_id = int(m.group(1)) if m else ROBOT_MAVIC
 
         self.imu = self.getDevice("inertial unit")
         self.imu.enable(self.time_step)
@@ -45,7 +76,7 @@ class MavicController(Robot):
             motor.setPosition(float('inf'))
             motor.setVelocity(1)
 
-        self.target_altitude = 1.0
+        self.target_altitude = self.DEFAULT_ALTITUDE
         self.target_x = 0.0
         self.target_y = 0.0
         self.step_count = 0
@@ -53,26 +84,198 @@ class MavicController(Robot):
         self.prev_x = None
         self.prev_y = None
 
+        self.state = STATE_HOLD
+        self.path = []
+        self.path_idx = 0
+
+        # Sensor streaming
+        self.pos_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.viz_addr = ('localhost', POSITION_PORT)
+
+        # TCP server for waypoint commands
+        cmd_port = COMMAND_PORT_BASE + self.robot_id
+        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_sock.bind(('localhost', cmd_port))
+        self.server_sock.listen(1)
+        self.server_sock.setblocking(False)
+        self.planner_conn = None
+        self.conn_buffer = ""
+
+        print(f"\n=== Mavic Controller [{name}] ===")
+        print(f"Robot ID: {self.robot_id}")
+        print(f"TCP server listening on port {cmd_port}")
+        print(f"Streaming 3D pose to UDP :{POSITION_PORT}")
+
+        # Metrics (no-op unless DAL_METRICS is set)
+        self.metrics = make_metrics('dronecontroller', METRICS_PORT_BASE + self.robot_id, self.robot_id)
+        self.metrics.counter('dal_steps_total', 'Control steps completed').set_function(lambda: self.step_count)
+        self.m_step = self.metrics.histogram('dal_step_seconds', 'Controller work per step, outside robot.step()')
+        self.m_pos_packets = self.metrics.counter('dal_packets_sent_total', 'Sensor packets stamped for sending',
+                                                  ('stream',)).labels('position')
+        self.m_pos_bytes = self.metrics.counter('dal_bytes_sent_total', 'Sensor bytes sent',
+                                                ('stream',)).labels('position')
+        self.m_send_errors = self.metrics.counter('dal_send_errors_total', 'Sensor packets that failed to send')
+        self.m_commands = self.metrics.counter('dal_commands_received_total', 'Command lines (tcp) and datagrams (udp)',
+                                               ('transport',)).labels('tcp')
+        self.metrics.gauge('dal_planner_connected', '1 while a planner is connected').set_function(
+            lambda: int(self.planner_conn is not None))
+        self.metrics.gauge('dal_nav_state', 'Navigation state (0 hold, 1 waypoint, 2 path)').set_function(
+            lambda: self.state)
+
+    # ── Planner link ──────────────────────────────────────────────────────────
+    def set_target(self, x, y, z):
+        self.target_x = x
+        self.target_y = y
+        if z is not None:
+            self.target_altitude = z
+
+    def drop_planner(self):
+        self.planner_conn.close()
+        self.planner_conn = None
+        self.conn_buffer = ""
+        self.state = STATE_HOLD
+
+    def poll_commands(self):
+        if self.planner_conn is None:
+            readable, _, _ = select.select([self.server_sock], [], [], 0)
+            if readable:
+                self.planner_conn, addr = self.server_sock.accept()
+                self.planner_conn.setblocking(False)
+                self.conn_buffer = ""
+                print(f"Planner connected from {addr}")
+            return
+
+        try:
+            readable, _, _ = select.select([self.planner_conn], [], [], 0)
+            if not readable:
+                return
+            data = self.planner_conn.recv(4096)
+            if not data:
+                print("Planner disconnected — holding position")
+                self.drop_planner()
+                return
+            self.conn_buffer += data.decode('utf-8')
+            while '\n' in self.conn_buffer:
+                line, self.conn_buffer = self.conn_buffer.split('\n', 1)
+                self.m_commands.inc()
+                self.handle_line(line)
+        except BlockingIOError:
+            pass
+        except Exception as e:
+            print(f"TCP error: {e}")
+            self.drop_planner()
+
+    def handle_line(self, line):
+        path = parse_path3d_command(line)
+        if path is None:
+            flat = parse_path_command(line)
+            if flat:
+                path = [(x, y, None) for x, y in flat]
+        if path:
+            self.path = path
+            self.path_idx = 0
+            self.set_target(*path[0])
+            self.state = STATE_PATH
+            print(f"[PATH] Received {len(path)} waypoints, starting at wp 1: {path[0]}")
+            return
+        waypoint = parse_waypoint3d_command(line)
+        if waypoint:
+            self.set_target(*waypoint)
+            self.state = STATE_NAVIGATING
+            print(f"New waypoint: ({self.target_x:.2f}, {self.target_y:.2f}, {self.target_altitude:.2f})")
+
+    def send_ack(self):
+        if self.planner_conn is not None:
+            try:
+                send_reached_ack(self.planner_conn, self.target_x, self.target_y)
+            except Exception as e:
+                print(f"Failed to send ACK: {e}")
+
+    def check_arrival(self, distance, altitude):
+        if self.state == STATE_HOLD:
+            return
+        if distance >= self.DISTANCE_TOLERANCE or abs(self.target_altitude - altitude) >= self.ALTITUDE_TOLERANCE:
+            return
+        if self.state == STATE_PATH and self.path_idx < len(self.path) - 1:
+            self.path_idx += 1
+            self.set_target(*self.path[self.path_idx])
+            print(f"[SWITCH] now targeting wp {self.path_idx + 1}: {self.path[self.path_idx]}")
+            return
+        print(f"Reached ({self.target_x:.2f}, {self.target_y:.2f}, {self.target_altitude:.2f})")
+        self.send_ack()
+        self.state = STATE_HOLD
+        self.path = []
+
+    # ── Control loop ──────────────────────────────────────────────────────────
     def run(self):
-        while self.step(self.time_step) != -1:
+        # Bind per-step lookups once; the loop body is pure float math on locals
+        step = self.step
+        time_step = self.time_step
+        dt = self.dt
+        get_rpy = self.imu.getRollPitchYaw
+        get_gps = self.gps.getValues
+        get_gyro = self.gyro.getValues
+        fl_set = self.front_left_motor.setVelocity
+        fr_set = self.front_right_motor.setVelocity
+        rl_set = self.rear_left_motor.setVelocity
+        rr_set = self.rear_right_motor.setVelocity
+        sendto = self.pos_sock.sendto
+        wall_time = time.time
+        sim_time = self.getTime
+        seq = 0
+        perf = time.perf_counter
+        observe_step = self.m_step.observe
+        count_packet = self.m_pos_packets.inc
+        count_bytes = self.m_pos_bytes.inc
+        count_error = self.m_send_errors.inc
+        viz_addr = self.viz_addr
+        robot_id = self.robot_id
+        cos = math.cos
+        sin = math.sin
+        atan2 = math.atan2
+        sqrt = math.sqrt
+        pi = math.pi
+        k_thrust = self.K_VERTICAL_THRUST
+        k_offset = self.K_VERTICAL_OFFSET
+        k_vert = self.K_VERTICAL_P
+        k_roll = self.K_ROLL_P
+        k_pitch = self.K_PITCH_P
+        k_xy = self.K_XY
+        tilt_max = self.TILT_MAX_XY
+        damp_xy = self.DAMP_XY
+
+        while step(time_step) != -1:
+            step_start = perf()
+            step_wall = wall_time()
             self.step_count += 1
-            roll, pitch, yaw = self.imu.getRollPitchYaw()
-            x_pos, y_pos, altitude = self.gps.getValues()
-            roll_acceleration, pitch_acceleration, _ = self.gyro.getValues()
+            roll, pitch, yaw = get_rpy()
+            x_pos, y_pos, altitude = get_gps()
+            roll_acceleration, pitch_acceleration, _ = get_gyro()
+
+            try:
+                count_bytes(sendto(pack_position3d(robot_id, x_pos, y_pos, altitude, roll, pitch, yaw)
+                                   + pack_stamp(seq, step_wall, sim_time()), viz_addr))
+            except Exception:
+                count_error()
+            count_packet()
+            seq += 1
+
+            self.poll_commands()
 
             dx = self.target_x - x_pos
             dy = self.target_y - y_pos
-            distance = np.sqrt(dx * dx + dy * dy)
+            distance = sqrt(dx * dx + dy * dy)
+            self.check_arrival(distance, altitude)
 
-            if self.prev_x is not None and self.prev_y is not None:
-                dt = self.time_step * 0.001
+            cy = cos(yaw)
+            sy = sin(yaw)
+
+            if self.prev_x is not None:
                 vx = (x_pos - self.prev_x) / dt
                 vy = (y_pos - self.prev_y) / dt
-                vx_body = vx * np.cos(yaw) + vy * np.sin(yaw)
-                vy_body = -vx * np.sin(yaw) + vy * np.cos(yaw)
-                damp_xy = 2.0
-                pitch_damp = clamp(-vx_body * damp_xy, -0.3, 0.3)
-                roll_damp = clamp(-vy_body * damp_xy, -0.3, 0.3)
+                pitch_damp = clamp(-(vx * cy + vy * sy) * damp_xy, -0.3, 0.3)
+                roll_damp = clamp(-(-vx * sy + vy * cy) * damp_xy, -0.3, 0.3)
             else:
                 pitch_damp = 0.0
                 roll_damp = 0.0
@@ -81,60 +284,41 @@ class MavicController(Robot):
 
             altitude_error = self.target_altitude - altitude
             if self.prev_altitude is not None:
-                dt = self.time_step * 0.001
                 vertical_velocity = (altitude - self.prev_altitude) / dt
                 damping = clamp(-vertical_velocity * 3.0, -8, 8)
             else:
                 damping = 0.0
             self.prev_altitude = altitude
 
-            clamped_error = clamp(altitude_error + self.K_VERTICAL_OFFSET, -1, 1)
-            vertical_input = clamp(self.K_VERTICAL_P * clamped_error + damping, -10, 10)
-
-            yaw_target = np.arctan2(dy, dx)
-            yaw_error = yaw_target - yaw
-            while yaw_error > np.pi:
-                yaw_error -= 2 * np.pi
-            while yaw_error < -np.pi:
-                yaw_error += 2 * np.pi
+            clamped_error = clamp(altitude_error + k_offset, -1, 1)
+            vertical_input = clamp(k_vert * clamped_error + damping, -10, 10)
 
+            yaw_error = (atan2(dy, dx) - yaw + pi) % TWO_PI - pi
             if distance > 0.05:
                 yaw_disturbance = clamp(yaw_error * 0.4, -0.4, 0.4)
             else:
                 yaw_disturbance = clamp(yaw_error * 0.2, -0.2, 0.2)
 
-            K_XY = 0.5
-            TILT_MAX_XY = 0.55
-            dx_body = dx * np.cos(yaw) + dy * np.sin(yaw)
-            dy_body = -dx * np.sin(yaw) + dy * np.cos(yaw)
-            pitch_disturbance = clamp(K_XY * dx_body + pitch_damp, -TILT_MAX_XY, TILT_MAX_XY)
-            roll_disturbance = clamp(-K_XY * dy_body + roll_damp, -TILT_MAX_XY, TILT_MAX_XY)
+            dx_body = dx * cy + dy * sy
+            dy_body = -dx * sy + dy * cy
+            pitch_disturbance = clamp(k_xy * dx_body + pitch_damp, -tilt_max, tilt_max)
+            roll_disturbance = clamp(-k_xy * dy_body + roll_damp, -tilt_max, tilt_max)
 
-            roll_input = clamp(self.K_ROLL_P * clamp(roll, -1, 1) + roll_acceleration + roll_disturbance, -20, 20)
-            pitch_input = clamp(self.K_PITCH_P * clamp(pitch, -1, 1) + pitch_acceleration + pitch_disturbance, -20, 20)
+            roll_input = clamp(k_roll * clamp(roll, -1, 1) + roll_acceleration + roll_disturbance, -20, 20)
+            pitch_input = clamp(k_pitch * clamp(pitch, -1, 1) + pitch_acceleration + pitch_disturbance, -20, 20)
             yaw_input = clamp(yaw_disturbance, -5, 5)
 
-            base_thrust = self.K_VERTICAL_THRUST + vertical_input
-            
-            front_left = base_thrust - yaw_input + pitch_input - roll_input
-            front_right = base_thrust + yaw_input + pitch_input + roll_input
-            rear_left = base_thrust + yaw_input - pitch_input - roll_input
-            rear_right = base_thrust - yaw_input - pitch_input + roll_input
-
-            front_left = clamp(front_left, 1, 576)
-            front_right = clamp(front_right, 1, 576)
-            rear_left = clamp(rear_left, 1, 576)
-            rear_right = clamp(rear_right, 1, 576)
+            base_thrust = k_thrust + vertical_input
 
-            self.front_left_motor.setVelocity(front_left)
-            self.front_right_motor.setVelocity(-front_right)
-            self.rear_left_motor.setVelocity(-rear_left)
-            self.rear_right_motor.setVelocity(rear_right)
+            fl_set(clamp(base_thrust - yaw_input + pitch_input - roll_input, 1, 576))
+            fr_set(-clamp(base_thrust + yaw_input + pitch_input + roll_input, 1, 576))
+            rl_set(-clamp(base_thrust + yaw_input - pitch_input - roll_input, 1, 576))
+            rr_set(clamp(base_thrust - yaw_input - pitch_input + roll_input, 1, 576))
 
             if self.step_count % 50 == 0:
-                vvel = (altitude - self.prev_altitude) / (self.time_step * 0.001) if self.step_count > 1 else 0
                 print(f"  Pos: ({x_pos:.2f}, {y_pos:.2f}) target: ({self.target_x:.2f}, {self.target_y:.2f}) "
-                      f"dist: {distance:.2f} Alt: {altitude:.2f}m dx: {dx:.2f} dy: {dy:.2f}")
+                      f"dist: {distance:.2f} Alt: {altitude:.2f}m (target {self.target_altitude:.2f}m)")
+            observe_step(perf() - step_start)
 
 
 robot = MavicController()
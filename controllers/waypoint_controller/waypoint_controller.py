@@ -3,6 +3,7 @@
 import sys
 import os
 import math
+import time
 import socket
 import select
 
@@ -14,11 +15,21 @@ sys.path.insert(0, os.path.dirname(__file__))
 from controller import Supervisor
 from robot_drivers import get_driver
 from utils.protocol import (
-    POSITION_PORT, CAMERA_PORT, WAYPOINT_PORT,
-    pack_position, pack_camera,
+    POSITION_PORT, CAMERA_PORT, COMMAND_PORT_BASE, VELOCITY_PORT_BASE, METRICS_PORT_BASE,
+    pack_position, pack_camera, pack_stamp,
     send_reached_ack, parse_waypoint_command, parse_path_command,
+    parse_append_command, parse_replace_from_command, parse_cancel_command,
+    parse_progress_interval_command, send_progress_ack,
+    parse_velocity_command, unpack_velocity,
     CAMERA_HEADER_SIZE
 )
+from utils.local_avoidance import VectorFieldHistogram
+from utils.step_profiler import make_profiler
+from utils.metrics import make_metrics
+from utils.heading_cache import (
+    heading_cache_key, load_heading_offset, save_heading_offset,
+    MIN_CALIBRATION_DISPLACEMENT
+)
 
 # Constants
 DISTANCE_TOLERANCE = 0.30  # meters
@@ -29,11 +40,18 @@ TURN_THRESHOLD = 0.4  # radians
 STATE_IDLE = 0
 STATE_NAVIGATING = 1
 STATE_PATH_FOLLOWING = 2  # continuous path following with pure pursuit
+STATE_VELOCITY = 3        # streamed VEL commands, stopped by watchdog
 
 # Pure pursuit constants
 LOOKAHEAD_DISTANCE = 0.3     # meters — how far ahead on path to aim for
 WAYPOINT_SWITCH_DIST = 0.3   # meters — how close before advancing to next waypoint
 
+# Reactive obstacle avoidance (VFH over the live LIDAR scan)
+AVOIDANCE_ENABLED = True
+
+# Velocity mode constants
+VEL_TIMEOUT = 0.25  # seconds of simulation time without a VEL command before stopping
+
 # Initialize Webots
 robot = Supervisor()
 timestep = int(robot.getBasicTimeStep())
@@ -64,6 +82,11 @@ for lname in LIDAR_NAMES:
 if lidar is None:
     print("No LIDAR found.")
 
+avoider = None
+if lidar is not None and AVOIDANCE_ENABLED:
+    avoider = VectorFieldHistogram(lidar_num_points, lidar.getFov(), lidar.getMaxRange(), timestep)
+    print(f"Obstacle avoidance enabled (budget {avoider.budget * 1e6:.0f} us/step)")
+
 # Setup Camera
 camera = None
 cam_w, cam_h = 0, 0
@@ -87,7 +110,7 @@ CAM_ADDR = ('localhost', CAMERA_PORT)
 MAX_CAM_UDP = 60000
 
 # Setup TCP server for waypoint commands
-cmd_port = WAYPOINT_PORT + driver.ROBOT_ID
+cmd_port = COMMAND_PORT_BASE + driver.ROBOT_ID
 server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 server_sock.bind(('localhost', cmd_port))
@@ -98,6 +121,13 @@ print(f"TCP server listening on port {cmd_port}")
 planner_conn = None
 conn_buffer = ""  # Buffer for incomplete TCP messages
 
+# Setup UDP socket for streamed velocity commands
+vel_port = VELOCITY_PORT_BASE + driver.ROBOT_ID
+vel_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+vel_sock.bind(('localhost', vel_port))
+vel_sock.setblocking(False)
+print(f"UDP velocity commands on port {vel_port}")
+
 
 # Heading helpers
 def get_heading():
@@ -115,31 +145,40 @@ def angle_diff(a, b):
     return d
 
 
-# Heading calibration
-print("Calibrating heading...")
-pos_before = robot_node.getPosition()
-heading_before = get_heading()
-
-# Drive forward briefly
-if is_youbot:
-    for w in [driver.w1, driver.w2, driver.w3, driver.w4]:
-        w.setVelocity(SPEED)
+# Heading calibration — cached per robot model, drive forward only on a cache miss
+cal_key = heading_cache_key(robot, robot_node)
+HEADING_OFFSET = load_heading_offset(cal_key)
+if HEADING_OFFSET is not None:
+    print(f"Heading offset (cached): {math.degrees(HEADING_OFFSET):.1f} deg")
 else:
-    for w in [driver.fl, driver.fr, driver.bl, driver.br]:
-        w.setVelocity(SPEED)
-
-for _ in range(15):
+    print("Calibrating heading...")
+    pos_before = robot_node.getPosition()
+    heading_before = get_heading()
+
+    # Drive forward briefly
+    if is_youbot:
+        for w in [driver.w1, driver.w2, driver.w3, driver.w4]:
+            w.setVelocity(SPEED)
+    else:
+        for w in [driver.fl, driver.fr, driver.bl, driver.br]:
+            w.setVelocity(SPEED)
+
+    for _ in range(15):
+        robot.step(timestep)
+
+    driver.stop()
     robot.step(timestep)
 
-driver.stop()
-robot.step(timestep)
-
-pos_after = robot_node.getPosition()
-dx_cal = pos_after[0] - pos_before[0]
-dy_cal = pos_after[1] - pos_before[1]
-actual_forward = math.atan2(dy_cal, dx_cal)
-HEADING_OFFSET = angle_diff(heading_before, actual_forward)
-print(f"Heading offset: {math.degrees(HEADING_OFFSET):.1f} deg")
+    pos_after = robot_node.getPosition()
+    dx_cal = pos_after[0] - pos_before[0]
+    dy_cal = pos_after[1] - pos_before[1]
+    actual_forward = math.atan2(dy_cal, dx_cal)
+    HEADING_OFFSET = angle_diff(heading_before, actual_forward)
+    print(f"Heading offset: {math.degrees(HEADING_OFFSET):.1f} deg")
+    if math.hypot(dx_cal, dy_cal) >= MIN_CALIBRATION_DISPLACEMENT:
+        save_heading_offset(cal_key, HEADING_OFFSET)
+    else:
+        print("Robot barely moved during calibration — offset not cached")
 
 
 def corrected_heading():
@@ -163,16 +202,70 @@ def set_differential(left, right):
     driver.br.setVelocity(right)
 
 
+MAX_WHEEL_SPEED = min(w.getMaxVelocity() for w in driver.wheels)
+
+
+def apply_velocity(vx, vy, omega):
+    """Drive with a body-frame velocity command, scaled down to respect wheel limits."""
+    if is_youbot:
+        peak = abs(vx) + abs(vy) + abs(omega)
+    else:
+        peak = abs(vx) + abs(omega)
+    scale = MAX_WHEEL_SPEED / peak if peak > MAX_WHEEL_SPEED else 1.0
+    if is_youbot:
+        set_mecanum(vx * scale, vy * scale, omega * scale)
+    else:
+        set_differential((vx - omega) * scale, (vx + omega) * scale)
+
+
+def steer_toward(world_angle, heading, goal_distance, lidar_ranges):
+    """Drive toward world_angle, deflected around obstacles in the current scan."""
+    local_angle = world_angle - heading
+    speed = SPEED
+    if avoider is not None and lidar_ranges:
+        local_angle, scale = avoider.steer(lidar_ranges, angle_diff(0.0, local_angle), goal_distance)
+        world_angle = heading + local_angle
+        speed = SPEED * scale
+
+    if is_youbot:
+        if speed == 0.0:
+            # Boxed in: rotate in place toward the most open beam
+            set_mecanum(0, 0, math.copysign(SPEED, local_angle))
+            return local_angle
+        # Mecanum: strafe directly toward target
+        vx = speed * math.cos(local_angle)
+        vy = speed * math.sin(local_angle)
+        set_mecanum(vx, vy, 0)
+    else:
+        # Differential: turn to face target, then drive
+        err = angle_diff(heading, world_angle)
+        turn = max(-SPEED, min(SPEED, -TURN_GAIN * err))
+
+        if abs(err) > TURN_THRESHOLD:
+            # Pure turning
+            set_differential(turn, -turn)
+        else:
+            # Forward with arc
+            set_differential(speed + turn * 0.3, speed - turn * 0.3)
+    return local_angle
+
+
 # Navigation state
 state = STATE_IDLE
 target_x = None
 target_y = None
 
+# Velocity mode state
+vel_cmd = (0.0, 0.0, 0.0)
+vel_stamp = 0.0  # simulation time of the last VEL command
+
 # Continuous path following state
 path = []
 path_idx = 0
 last_lookahead_idx = -1  # track lookahead changes for debug prints
 last_phase = ""           # track phase changes for debug prints
+progress_interval = 0.0   # seconds between PROGRESS acks (0 = off until PROGRESS_INTERVAL arrives)
+progress_stamp = -math.inf  # simulation time of the last PROGRESS ack
 
 
 def get_lookahead_point(robot_x, robot_y):
@@ -189,9 +282,32 @@ print("=" * 50)
 
 step_count = 0
 cam_step = 0
+pos_seq = 0   # STAMP sequence numbers, per stream
+cam_seq = 0
+prof = make_profiler(driver.ROBOT_ID, robot_name)  # no-op unless DAL_PROFILE is set
+
+# Metrics (no-op unless DAL_METRICS is set); loop counters are read only when scraped
+metrics = make_metrics('waypoint_controller', METRICS_PORT_BASE + driver.ROBOT_ID, driver.ROBOT_ID)
+metrics.counter('dal_steps_total', 'Control steps completed').set_function(lambda: step_count)
+m_step = metrics.histogram('dal_step_seconds', 'Controller work per step, outside robot.step()')
+m_packets = metrics.counter('dal_packets_sent_total', 'Sensor packets stamped for sending', ('stream',))
+m_packets.labels('position').set_function(lambda: pos_seq)
+m_packets.labels('camera').set_function(lambda: cam_seq)
+m_bytes = metrics.counter('dal_bytes_sent_total', 'Sensor bytes sent', ('stream',))
+m_pos_bytes, m_cam_bytes = m_bytes.labels('position'), m_bytes.labels('camera')
+m_send_errors = metrics.counter('dal_send_errors_total', 'Sensor packets that failed to send')
+m_commands = metrics.counter('dal_commands_received_total', 'Command lines (tcp) and datagrams (udp)', ('transport',))
+m_tcp_commands, m_udp_commands = m_commands.labels('tcp'), m_commands.labels('udp')
+metrics.gauge('dal_planner_connected', '1 while a planner is connected').set_function(lambda: int(planner_conn is not None))
+metrics.gauge('dal_nav_state', 'Navigation state (0 idle, 1 waypoint, 2 path, 3 velocity)').set_function(lambda: state)
+
+prof.start()
 
 # Main control loop
 while robot.step(timestep) != -1:
+    prof.lap('sim')
+    step_start = time.perf_counter()
+    step_wall = time.time()   # STAMP reference: receivers measure latency from here
     step_count += 1
 
     # Get current position and heading
@@ -203,12 +319,17 @@ while robot.step(timestep) != -1:
     lidar_ranges = []
     if lidar is not None:
         lidar_ranges = list(lidar.getRangeImage())
+    prof.lap('sensors')
 
     try:
         data = pack_position(driver.ROBOT_ID, x, y, heading, lidar_ranges)
+        data += pack_stamp(pos_seq, step_wall, robot.getTime())
         pos_sock.sendto(data, VIZ_ADDR)
+        m_pos_bytes.inc(len(data))
     except Exception:
-        pass
+        m_send_errors.inc()
+    pos_seq += 1
+    prof.lap('udp_pos')
 
     # Stream camera over UDP (lower rate)
     cam_step += 1
@@ -222,8 +343,11 @@ while robot.step(timestep) != -1:
                 b = bgra[0::4]
                 raw = bytes(val for rgb in zip(r, g, b) for val in rgb)
                 payload = pack_camera(driver.ROBOT_ID, cam_w, cam_h, raw)
+                payload += pack_stamp(cam_seq, step_wall, robot.getTime())
+                cam_seq += 1
                 if len(payload) <= MAX_CAM_UDP:
                     cam_sock.sendto(payload, CAM_ADDR)
+                    m_cam_bytes.inc(len(payload))
                 else:
                     if cam_step == 16:
                         print(f"[CAM] Payload too large: {len(payload)} bytes (max {MAX_CAM_UDP}) — reduce camera resolution")
@@ -231,8 +355,10 @@ while robot.step(timestep) != -1:
                 if cam_step == 16:
                     print(f"[CAM] getImage() returned empty/None — camera may not be rendering")
         except Exception as e:
+            m_send_errors.inc()
             if cam_step <= 32:
                 print(f"[CAM] Exception sending camera: {e}")
+    prof.lap('camera')
 
     # Check for new planner connection (non-blocking)
     if planner_conn is None:
@@ -241,6 +367,7 @@ while robot.step(timestep) != -1:
             planner_conn, addr = server_sock.accept()
             planner_conn.setblocking(False)
             conn_buffer = ""
+            progress_interval = 0.0  # each planner opts in to PROGRESS acks
             print(f"Planner connected from {addr}")
 
     # Check for incoming waypoint commands (non-blocking)
@@ -264,6 +391,7 @@ while robot.step(timestep) != -1:
                     # Look for complete lines
                     while '\n' in conn_buffer:
                         line, conn_buffer = conn_buffer.split('\n', 1)
+                        m_tcp_commands.inc()
                         new_path = parse_path_command(line)
                         if new_path:
                             path = new_path
@@ -272,6 +400,55 @@ while robot.step(timestep) != -1:
                             state = STATE_PATH_FOLLOWING
                             print(f"[PATH] Received {len(path)} waypoints, starting at wp 1: {path[0]}")
                             continue
+                        # APPEND / REPLACE_FROM edit the path in place so pure pursuit keeps going;
+                        # on an idle robot they start a new path like PATH
+                        appended = parse_append_command(line)
+                        replaced = None if appended else parse_replace_from_command(line)
+                        if appended or replaced:
+                            following = state == STATE_PATH_FOLLOWING and bool(path)
+                            if not following:
+                                path = []
+                                path_idx = 0
+                            if appended:
+                                path = path + appended
+                                verb = f"Appended {len(appended)}"
+                            else:
+                                cut = min(replaced[0], len(path))
+                                path = path[:cut] + replaced[1]
+                                path_idx = min(path_idx, cut)
+                                verb = f"Replaced wp {cut + 1}+ with {len(replaced[1])}"
+                            last_lookahead_idx = -1
+                            state = STATE_PATH_FOLLOWING
+                            print(f"[PATH] {verb} waypoints — {len(path)} total, "
+                                  f"targeting wp {path_idx + 1}: {path[path_idx]}")
+                            continue
+                        if parse_cancel_command(line):
+                            print(f"[PATH] Cancelled at ({x:.2f}, {y:.2f})")
+                            driver.stop()
+                            state = STATE_IDLE
+                            path = []
+                            path_idx = 0
+                            last_lookahead_idx = -1
+                            target_x = None
+                            target_y = None
+                            continue
+                        interval = parse_progress_interval_command(line)
+                        if interval is not None:
+                            progress_interval = interval
+                            progress_stamp = -math.inf
+                            if interval > 0:
+                                print(f"[PATH] Progress acks every {interval:.2f}s")
+                            else:
+                                print("[PATH] Progress acks off")
+                            continue
+                        vel = parse_velocity_command(line)
+                        if vel:
+                            if state != STATE_VELOCITY:
+                                print("[VEL] Velocity mode (TCP)")
+                            vel_cmd = vel
+                            vel_stamp = robot.getTime()
+                            state = STATE_VELOCITY
+                            continue
                         waypoint = parse_waypoint_command(line)
                         if waypoint:
                             target_x, target_y = waypoint
@@ -287,6 +464,24 @@ while robot.step(timestep) != -1:
             state = STATE_IDLE
             driver.stop()
 
+    # Drain streamed velocity commands, keep only the newest (non-blocking)
+    while True:
+        try:
+            data = vel_sock.recv(64)
+        except BlockingIOError:
+            break
+        except Exception:
+            break
+        m_udp_commands.inc()
+        vel = unpack_velocity(data)
+        if vel and vel[0] == driver.ROBOT_ID:
+            if state != STATE_VELOCITY:
+                print("[VEL] Velocity mode (UDP)")
+            vel_cmd = vel[1:]
+            vel_stamp = robot.getTime()
+            state = STATE_VELOCITY
+    prof.lap('commands')
+
     # Navigate to waypoint
     if state == STATE_NAVIGATING and target_x is not None:
         dx = target_x - x
@@ -311,30 +506,21 @@ while robot.step(timestep) != -1:
         else:
             # Drive toward waypoint
             world_angle = math.atan2(dy, dx)
-            local_angle = world_angle - heading
-
-            if is_youbot:
-                # Mecanum: strafe directly toward target
-                vx = SPEED * math.cos(local_angle)
-                vy = SPEED * math.sin(local_angle)
-                set_mecanum(vx, vy, 0)
-            else:
-                # Differential: turn to face target, then drive
-                err = angle_diff(heading, world_angle)
-                turn = max(-SPEED, min(SPEED, -TURN_GAIN * err))
-
-                if abs(err) > TURN_THRESHOLD:
-                    # Pure turning
-                    set_differential(turn, -turn)
-                else:
-                    # Forward with arc
-                    set_differential(SPEED + turn * 0.3, SPEED - turn * 0.3)
+            local_angle = steer_toward(world_angle, heading, distance, lidar_ranges)
 
             # Progress logging
             if step_count % 100 == 0:
                 print(f"  Navigating: pos=({x:.2f},{y:.2f}) dist={distance:.2f}m "
                       f"angle={math.degrees(local_angle):.0f}deg")
     elif state == STATE_PATH_FOLLOWING and path:
+        # Periodic PROGRESS ack so a planner can stream the next leg before the path runs out
+        if (progress_interval > 0 and planner_conn is not None
+                and robot.getTime() - progress_stamp >= progress_interval):
+            progress_stamp = robot.getTime()
+            try:
+                send_progress_ack(planner_conn, path_idx, len(path), x, y)
+            except Exception as e:
+                print(f"Failed to send PROGRESS: {e}")
         cx, cy = path[path_idx]
         dist_to_current = math.sqrt((cx - x) ** 2 + (cy - y) ** 2)
 
@@ -382,18 +568,20 @@ while robot.step(timestep) != -1:
             dx = lx - x
             dy = ly - y
             world_angle = math.atan2(dy, dx)
-            local_angle = world_angle - heading
-
-            if is_youbot:
-                vx = SPEED * math.cos(local_angle)
-                vy = SPEED * math.sin(local_angle)
-                set_mecanum(vx, vy, 0)
-            else:
-                err = angle_diff(heading, world_angle)
-                turn = max(-SPEED, min(SPEED, -TURN_GAIN * err))
-                if abs(err) > TURN_THRESHOLD:
-                    set_differential(turn, -turn)
-                else:
-                    set_differential(SPEED + turn * 0.3, SPEED - turn * 0.3)
+            steer_toward(world_angle, heading, math.sqrt(dx * dx + dy * dy), lidar_ranges)
+    elif state == STATE_VELOCITY:
+        if robot.getTime() - vel_stamp > VEL_TIMEOUT:
+            driver.stop()
+            print(f"[VEL] No command for {VEL_TIMEOUT:.2f}s — watchdog stop")
+            state = STATE_IDLE
+        else:
+            apply_velocity(*vel_cmd)
     elif state == STATE_IDLE:
         driver.stop()
+    prof.lap('nav')
+    prof.end_step()
+    m_step.observe(time.perf_counter() - step_start)
+
+    if avoider is not None and step_count % 1000 == 0:
+        print(f"[AVOID] cost={avoider.cost_ema * 1e6:.0f}us budget={avoider.budget * 1e6:.0f}us "
+              f"stride={avoider.stride}")
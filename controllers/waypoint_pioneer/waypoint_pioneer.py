@@ -1,6 +1,16 @@
-from controller import Supervisor
+import sys
+import os
 import math
 
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, project_root)
+
+from controller import Supervisor
+from utils.heading_cache import (
+    heading_cache_key, load_heading_offset, save_heading_offset,
+    MIN_CALIBRATION_DISPLACEMENT
+)
+
 WAYPOINTS = [
     (-1.0, 2.0),
     (-1.0, 8.0),
@@ -54,22 +64,29 @@ def set_differential(left, right):
     wheels[3].setVelocity(right)
 
 
-# --- Heading calibration ---
-print("Calibrating heading...")
-pos_before = robot_node.getPosition()
-heading_before = get_heading()
-for w in wheels:
-    w.setVelocity(SPEED)
-for _ in range(15):
+# --- Heading calibration (cached per robot model) ---
+cal_key = heading_cache_key(robot, robot_node)
+HEADING_OFFSET = load_heading_offset(cal_key)
+if HEADING_OFFSET is not None:
+    print(f"  Heading offset (cached): {math.degrees(HEADING_OFFSET):.1f} deg")
+else:
+    print("Calibrating heading...")
+    pos_before = robot_node.getPosition()
+    heading_before = get_heading()
+    for w in wheels:
+        w.setVelocity(SPEED)
+    for _ in range(15):
+        robot.step(timestep)
+    stop()
     robot.step(timestep)
-stop()
-robot.step(timestep)
-pos_after = robot_node.getPosition()
-dx_cal = pos_after[0] - pos_before[0]
-dy_cal = pos_after[1] - pos_before[1]
-actual_forward = math.atan2(dy_cal, dx_cal)
-HEADING_OFFSET = angle_diff(heading_before, actual_forward)
-print(f"  Heading offset: {math.degrees(HEADING_OFFSET):.1f} deg")
+    pos_after = robot_node.getPosition()
+    dx_cal = pos_after[0] - pos_before[0]
+    dy_cal = pos_after[1] - pos_before[1]
+    actual_forward = math.atan2(dy_cal, dx_cal)
+    HEADING_OFFSET = angle_diff(heading_before, actual_forward)
+    print(f"  Heading offset: {math.degrees(HEADING_OFFSET):.1f} deg")
+    if math.hypot(dx_cal, dy_cal) >= MIN_CALIBRATION_DISPLACEMENT:
+        save_heading_offset(cal_key, HEADING_OFFSET)
 
 
 def corrected_heading():
@@ -0,0 +1,292 @@
+"""Cooperative planner: prioritized space-time A* over a shared reservation table.
+
+Usage:
+    python planners/cooperative_planner.py <map_prefix> <missions.json>
+
+missions.json maps robot IDs to a start position and a list of goals:
+    {"0": {"start": [0.0, -2.0], "goals": [[3.0, -6.0], [-3.0, -6.0]]},
+     "3": {"start": [3.0, -2.0], "goals": [[-3.0, -2.0]]}}
+
+Robots are planned in ID order on a coarse grid (CELL_SIZE). Each plan claims
+(cell, time window) slots so later robots route or wait around it. A plan is
+sent as PATH legs split at its wait points. The next leg is released only
+when its scheduled departure step arrives. Claims are dropped as REACHED
+acks come in.
+"""
+
+import sys
+import os
+import json
+import time
+import socket
+import heapq
+import selectors
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.protocol import (
+    WAYPOINT_PORT,
+    send_path_command,
+    parse_reached_ack
+)
+from utils.occupancy_grid import OccupancyGrid
+from planners.grid_planner import blocked_mask, downsample_any, distance_field, nearest_free
+from planners.reservation_table import ReservationTable
+
+HOST = 'localhost'
+
+CELL_SIZE = 0.5        # meters — one reservation cell, roughly one robot footprint
+STEP_DURATION = 1.5    # seconds a robot is scheduled to spend crossing one cell
+SLACK = 1              # steps of schedule error tolerated on either side of a claim
+HORIZON_FACTOR = 3     # search up to this many times the free-space step count
+
+
+class CoopGrid:
+    """Coarse planning grid shared by every robot: flat padded cell indices."""
+
+    def __init__(self, grid, cell_size=CELL_SIZE):
+        factor = max(1, int(round(cell_size / grid.resolution)))
+        self.blocked = downsample_any(blocked_mask(grid), factor)
+        self.res = grid.resolution * factor
+        self.x_min = grid.x_min
+        self.y_min = grid.y_min
+        self.rows, self.cols = self.blocked.shape
+        self.W = self.cols + 2
+        padded = np.zeros((self.rows + 2, self.W), dtype=np.uint8)
+        padded[1:-1, 1:-1] = ~self.blocked
+        self.walk = padded.ravel().tolist()
+        self.num_cells = len(self.walk)
+        W = self.W
+        # (offset, orthogonal a, orthogonal b); index 0 is waiting in place
+        self.moves = [(0, 0, 0)] + [(d, d, d) for d in (1, -1, W, -W)]
+        self.moves += [(dr * W + dc, dr * W, dc) for dr in (1, -1) for dc in (1, -1)]
+        self._h_cache = {}
+
+    def cell(self, wx, wy):
+        col = min(self.cols - 1, max(0, int((wx - self.x_min) / self.res)))
+        row = min(self.rows - 1, max(0, int((wy - self.y_min) / self.res)))
+        free = nearest_free(self.blocked, row, col)
+        if free is None:
+            return None
+        return (free[0] + 1) * self.W + (free[1] + 1)
+
+    def world(self, i):
+        r, c = divmod(i, self.W)
+        return (self.x_min + (c - 0.5) * self.res, self.y_min + (r - 0.5) * self.res)
+
+    def heuristic(self, goal):
+        """Steps-to-goal ignoring other robots (diagonal = one step), cached per goal."""
+        h = self._h_cache.get(goal)
+        if h is None:
+            r, c = divmod(goal, self.W)
+            field = distance_field(self.blocked, [(r - 1, c - 1)], diagonal_cost=1.0)
+            padded = np.full((self.rows + 2, self.W), np.inf)
+            padded[1:-1, 1:-1] = field
+            h = self._h_cache[goal] = padded.ravel().tolist()
+        return h
+
+
+def space_time_astar(cg, table, robot_id, start, goal, start_t):
+    """Plan start -> goal avoiding other robots' claims. Returns cells per step (waits repeat a cell) or None."""
+    h = cg.heuristic(goal)
+    if h[start] == float('inf'):
+        return None
+    horizon = start_t + int(HORIZON_FACTOR * h[start]) + 20
+    n = cg.num_cells
+    walk = cg.walk
+    moves = cg.moves
+
+    inf = float('inf')
+    start_key = start_t * n + start
+    parent = {start_key: None}
+    g = {start_key: 0}
+    heap = [(h[start], 0, start_key)]
+    while heap:
+        _, gk, key = heapq.heappop(heap)
+        if gk > g[key]:
+            continue
+        t, i = divmod(key, n)
+        if i == goal and table.free_after(goal, t, robot_id):
+            cells = []
+            while key is not None:
+                cells.append(key % n)
+                key = parent[key]
+            cells.reverse()
+            return cells
+        if t >= horizon:
+            continue
+        for off, a, b in moves:
+            j = i + off
+            if not (walk[j] and walk[i + a] and walk[i + b]):
+                continue
+            if not table.can_move(i, j, t, robot_id):
+                continue
+            nkey = key + n + off
+            ng = gk + 1
+            if ng < g.get(nkey, inf):
+                g[nkey] = ng
+                parent[nkey] = key
+                heapq.heappush(heap, (ng + h[j], ng, nkey))
+    return None
+
+
+def split_legs(cells, start_t):
+    """Split a timed cell list at waits -> [(depart_step, [cells...]), ...]."""
+    legs = []
+    leg = [cells[0]]
+    depart = start_t
+    for k in range(1, len(cells)):
+        if cells[k] == cells[k - 1]:
+            if len(leg) > 1:
+                legs.append((depart, leg))
+            leg = [cells[k]]
+            depart = start_t + k
+        else:
+            leg.append(cells[k])
+    if len(leg) > 1:
+        legs.append((depart, leg))
+    return legs
+
+
+class RobotLink:
+    def __init__(self, robot_id, mission):
+        self.robot_id = robot_id
+        self.pos = tuple(mission['start'])
+        self.goals = [tuple(gp) for gp in mission['goals']]
+        self.legs = []          # pending (depart_step, cells)
+        self.leg_end_t = 0      # scheduled step at which the current leg ends
+        self.moving = False
+        self.retry_at = 0.0     # monotonic time of the next replan attempt when blocked
+        self.sock = None
+        self.buffer = ""
+
+
+def plan_next_goal(cg, table, link):
+    """Plan link's next goal from its current position; True if legs were queued."""
+    while link.goals:
+        goal_xy = link.goals[0]
+        start = cg.cell(*link.pos)
+        goal = cg.cell(*goal_xy)
+        if start is None or goal is None:
+            print(f"  Robot {link.robot_id}: {goal_xy} is not on the map — skipping")
+            link.goals.pop(0)
+            continue
+        now = table.now()
+        if start == goal:
+            print(f"✓ Robot {link.robot_id} already at goal {goal_xy}")
+            link.goals.pop(0)
+            continue
+        table.unpark(link.robot_id)
+        cells = space_time_astar(cg, table, link.robot_id, start, goal, now)
+        if cells is None:
+            table.park(link.robot_id, start, now)
+            link.retry_at = time.monotonic() + STEP_DURATION
+            print(f"  Robot {link.robot_id}: no conflict-free path to {goal_xy} yet — retrying")
+            return False
+        table.reserve_path(link.robot_id, cells, now)
+        link.legs = split_legs(cells, now)
+        waits = len(cells) - 1 - sum(len(leg) - 1 for _, leg in link.legs)
+        print(f"  Robot {link.robot_id}: {len(cells) - 1} steps to {goal_xy} "
+              f"({len(link.legs)} legs, {waits} waits), table={len(table)} slots")
+        return True
+    return False
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    grid = OccupancyGrid.load_snapshot(sys.argv[1])
+    with open(sys.argv[2]) as f:
+        missions = json.load(f)
+
+    cg = CoopGrid(grid)
+    table = ReservationTable(cg.num_cells, STEP_DURATION, SLACK)
+    print(f"=== Cooperative Planner ===")
+    print(f"Planning grid: {cg.cols}x{cg.rows} cells at {cg.res:.2f}m, {STEP_DURATION}s per step")
+
+    sel = selectors.DefaultSelector()
+    links = {}
+    for rid in sorted(missions, key=int):
+        link = RobotLink(int(rid), missions[rid])
+        port = WAYPOINT_PORT + link.robot_id
+        try:
+            link.sock = socket.create_connection((HOST, port))
+        except OSError as e:
+            print(f"ERROR: Could not connect to robot {rid} on port {port}: {e}")
+            continue
+        link.sock.setblocking(False)
+        sel.register(link.sock, selectors.EVENT_READ, link)
+        links[link.robot_id] = link
+        start = cg.cell(*link.pos)
+        if start is not None:
+            table.park(link.robot_id, start, 0)
+        else:
+            print(f"  Robot {rid}: start {link.pos} is not on the map — not reserved")
+        print(f"Connected to robot {rid} on port {port}")
+
+    # Prioritized planning: lower IDs claim first, later robots plan around them
+    for link in links.values():
+        plan_next_goal(cg, table, link)
+
+    while any(link.goals for link in links.values()):
+        now = table.now()
+        for link in links.values():
+            if link.moving:
+                continue
+            if not link.legs and link.goals and time.monotonic() >= link.retry_at:
+                plan_next_goal(cg, table, link)
+            if link.legs and link.legs[0][0] <= now:
+                depart, cells = link.legs.pop(0)
+                link.leg_end_t = depart + len(cells) - 1
+                try:
+                    send_path_command(link.sock, [cg.world(c) for c in cells[1:]])
+                    link.moving = True
+                except OSError as e:
+                    print(f"ERROR: Robot {link.robot_id}: {e}")
+                    link.goals = []
+
+        for key, _ in sel.select(timeout=0.1):
+            link = key.data
+            try:
+                data = link.sock.recv(4096)
+            except OSError:
+                data = b''
+            if not data:
+                print(f"Robot {link.robot_id} disconnected")
+                sel.unregister(link.sock)
+                table.release_robot(link.robot_id)
+                link.goals = []
+                link.legs = []
+                link.moving = False
+                continue
+            link.buffer += data.decode('utf-8')
+            while '\n' in link.buffer:
+                line, link.buffer = link.buffer.split('\n', 1)
+                reached = parse_reached_ack(line)
+                if not reached:
+                    continue
+                link.pos = reached
+                link.moving = False
+                table.release(link.robot_id, max(link.leg_end_t, table.now()))
+                if not link.legs and link.goals:
+                    print(f"✓ Robot {link.robot_id} reached goal {link.goals[0]}")
+                    link.goals.pop(0)
+                    cell = cg.cell(*reached)
+                    if cell is not None:
+                        table.park(link.robot_id, cell, table.now())
+
+        table.prune(table.now() - 2 * SLACK)
+
+    print("=" * 50)
+    print("All missions complete!")
+    for link in links.values():
+        link.sock.close()
+
+
+if __name__ == '__main__':
+    main()
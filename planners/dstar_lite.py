@@ -0,0 +1,461 @@
+"""D* Lite: incremental replanning on a live OccupancyGrid, pushes a new PATH only when the route changes.
+
+Usage:
+    python planners/dstar_lite.py <world> <robot_id> <goal_x> <goal_y> [--map <map_prefix>]
+    python planners/dstar_lite.py --selfcheck [<scenarios>]
+
+Binds UDP :5555 (stop slam_viz first) and maps the robot's LIDAR into an
+OccupancyGrid, starting from an optional prior snapshot. Unknown space is
+treated as free. After each scan the inflated obstacle mask is refreshed
+only around the scan's box (refresh_mask), and the cells that flipped are
+handed to DStarLite.update_cells. The planner keeps its g/rhs values between
+calls and repairs only the part of the search those cells affect.
+
+--selfcheck edits random grids cell by cell and compares every repaired
+search against a fresh distance_field from the goal.
+"""
+
+import sys
+import os
+import json
+import math
+import time
+import heapq
+import random
+import socket
+import struct
+import selectors
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.protocol import (
+    POSITION_PORT,
+    WAYPOINT_PORT,
+    unpack_position,
+    send_path_command,
+    parse_reached_ack
+)
+from utils.occupancy_grid import OccupancyGrid
+from planners.grid_planner import (
+    SQRT2, ROBOT_RADIUS, prepare_mask, refresh_mask, nearest_free, distance_field
+)
+from planners.path_processing import process_path
+
+HOST = 'localhost'
+
+GRID_RESOLUTION = 0.15   # meters — same as slam_viz
+LIDAR_ANGLE_MIN = math.pi
+REPLAN_INTERVAL = 0.5    # seconds — map changes are batched between repairs
+REJOIN_CELLS = 5         # a new path that merges into the sent one this soon counts as unchanged
+
+# Integer edge costs, so keys built from g, rhs, h and km compare exactly: float sums
+# drift by an ulp (an accumulated km plus sqrt(2) steps) and a tied key would then
+# look larger, ending compute() with a stale g[start]
+COST_STRAIGHT = 10000
+COST_DIAGONAL = round(COST_STRAIGHT * SQRT2)   # 14142, within 0.001% of sqrt(2)
+
+SELFCHECK_SCENARIOS = 150
+SELFCHECK_SIZE = 24      # cells per side of the random grids
+SELFCHECK_EDITS = 6      # edit batches per scenario, each followed by a repair
+
+
+class DStarLite:
+    """D* Lite (Koenig & Likhachev) on an 8-connected grid, no corner cutting.
+
+    Searches backwards from the goal, so moving the robot only shifts the
+    heuristic (km); changed cells re-open just the vertices around them.
+    Costs are integers, COST_STRAIGHT per cell and COST_DIAGONAL per diagonal
+    step; divided by COST_STRAIGHT they match distance_field and
+    JumpPointPlanner (1 straight, sqrt(2) diagonal) to within 0.001%.
+    """
+
+    def __init__(self, blocked, start, goal):
+        rows, cols = blocked.shape
+        self.rows = rows
+        self.cols = cols
+        self.W = W = cols + 2
+        padded = np.zeros((rows + 2, W), dtype=np.uint8)
+        padded[1:-1, 1:-1] = ~blocked
+        self.free = padded.ravel().tolist()
+        n = len(self.free)
+        inf = float('inf')
+        self.g = [inf] * n
+        self.rhs = [inf] * n
+        # (offset, cost, orthogonal a, orthogonal b); straight moves check themselves twice
+        self.moves = [(d, COST_STRAIGHT, d, d) for d in (1, -1, W, -W)]
+        self.moves += [(dr * W + dc, COST_DIAGONAL, dr * W, dc) for dr in (1, -1) for dc in (1, -1)]
+
+        self.start = self._idx(*start)
+        self.goal = self._idx(*goal)
+        self.km = 0
+        self.open = []
+        self.open_key = {}
+        self.expanded = 0
+        self.rhs[self.goal] = 0
+        self._push(self.goal)
+
+    def _idx(self, row, col):
+        return (int(row) + 1) * self.W + (int(col) + 1)
+
+    def _rc(self, i):
+        r, c = divmod(i, self.W)
+        return r - 1, c - 1
+
+    def _h(self, a, b):
+        dr = abs(a // self.W - b // self.W)
+        dc = abs(a % self.W - b % self.W)
+        return COST_STRAIGHT * max(dr, dc) + (COST_DIAGONAL - COST_STRAIGHT) * min(dr, dc)
+
+    def _key(self, i):
+        m = min(self.g[i], self.rhs[i])
+        return (m + self._h(self.start, i) + self.km, m)
+
+    def _push(self, i):
+        key = self._key(i)
+        self.open_key[i] = key
+        heapq.heappush(self.open, (key[0], key[1], i))
+
+    def _top(self):
+        """Smallest live (key, vertex) in the open list; stale heap entries are dropped."""
+        open_list = self.open
+        while open_list:
+            k1, k2, i = open_list[0]
+            if self.open_key.get(i) == (k1, k2):
+                return (k1, k2), i
+            heapq.heappop(open_list)
+        return None
+
+    def _update_vertex(self, u):
+        free = self.free
+        g = self.g
+        if u != self.goal:
+            best = float('inf')
+            if free[u]:
+                for off, cost, a, b in self.moves:
+                    v = u + off
+                    if free[v] and free[u + a] and free[u + b]:
+                        c = cost + g[v]
+                        if c < best:
+                            best = c
+            self.rhs[u] = best
+        if g[u] != self.rhs[u]:
+            self._push(u)
+        else:
+            self.open_key.pop(u, None)
+
+    def cost(self):
+        """Path cost from the start in cells (inf if unreachable); valid after compute()."""
+        return self.g[self.start] / COST_STRAIGHT
+
+    def compute(self):
+        """Repair the search until the start is consistent. Returns True if a path exists."""
+        g = self.g
+        rhs = self.rhs
+        moves = self.moves
+        start = self.start
+        while True:
+            top = self._top()
+            if top is None:
+                break
+            k_old, u = top
+            if not (k_old < self._key(start) or rhs[start] != g[start]):
+                break
+            self.expanded += 1
+            k_new = self._key(u)
+            if k_old < k_new:
+                self._push(u)
+            elif g[u] > rhs[u]:
+                g[u] = rhs[u]
+                self.open_key.pop(u, None)
+                for off, _, _, _ in moves:
+                    self._update_vertex(u + off)
+            else:
+                g[u] = float('inf')
+                self._update_vertex(u)
+                for off, _, _, _ in moves:
+                    self._update_vertex(u + off)
+        return g[start] < float('inf')
+
+    def update_start(self, start):
+        """The robot moved to start (row, col)."""
+        i = self._idx(*start)
+        if i != self.start:
+            self.km += self._h(self.start, i)
+            self.start = i
+
+    def update_cells(self, rows, cols, blocked):
+        """Apply new blocked states for cells (rows[k], cols[k]). Returns the number that changed."""
+        changed = []
+        free = self.free
+        for r, c, b in zip(rows, cols, blocked):
+            i = self._idx(r, c)
+            value = 0 if b else 1
+            if free[i] != value:
+                free[i] = value
+                changed.append(i)
+        # A cell's state sets the cost of every edge touching it and of the diagonals
+        # cutting its corners — all of which leave the cell or one of its 8 neighbours
+        touched = set(changed)
+        for i in changed:
+            for off, _, _, _ in self.moves:
+                touched.add(i + off)
+        for i in touched:
+            if self.free[i] or self.g[i] != float('inf') or self.rhs[i] != float('inf'):
+                self._update_vertex(i)
+        return len(changed)
+
+    def path(self):
+        """Greedy descent of g from the start: [(row, col), ...] start to goal, or None."""
+        g = self.g
+        free = self.free
+        if g[self.start] == float('inf'):
+            return None
+        i = self.start
+        cells = [self._rc(i)]
+        for _ in range(len(g)):
+            if i == self.goal:
+                return cells
+            best = None
+            best_cost = float('inf')
+            for off, cost, a, b in self.moves:
+                j = i + off
+                if free[j] and free[i + a] and free[i + b]:
+                    c = cost + g[j]
+                    if c < best_cost:
+                        best, best_cost = j, c
+            if best is None:
+                return None
+            i = best
+            cells.append(self._rc(i))
+        return None
+
+
+def same_route(new, old, rejoin=REJOIN_CELLS):
+    """True if new rejoins old within its first few cells and then follows it to the goal.
+
+    The robot drifts off the exact cells it was sent along, so a path that only
+    differs in how it gets back onto the old route is not worth re-sending.
+    """
+    if old is None:
+        return False
+    index = {cell: k for k, cell in enumerate(old)}
+    for m, cell in enumerate(new[:rejoin]):
+        k = index.get(cell)
+        if k is not None:
+            return new[m:] == old[k:]
+    return False
+
+
+def selfcheck(scenarios=SELFCHECK_SCENARIOS, size=SELFCHECK_SIZE, seed=0):
+    """Random cell edits and robot moves, each repair checked against a fresh search.
+
+    Returns the number of mismatches (cost or path length differing from
+    distance_field by more than the diagonal rounding allows).
+    """
+    rng = random.Random(seed)
+    tolerance = 1e-4   # relative; COST_DIAGONAL rounds sqrt(2) by 1e-5
+    mismatches = 0
+    for n in range(scenarios):
+        blocked = np.array([[rng.random() < 0.25 for _ in range(size)] for _ in range(size)])
+        start = (rng.randrange(size), rng.randrange(size))
+        goal = (rng.randrange(size), rng.randrange(size))
+        blocked[start] = blocked[goal] = False
+        planner = DStarLite(blocked, start, goal)
+        planner.compute()
+        for _ in range(SELFCHECK_EDITS):
+            cells = [(rng.randrange(size), rng.randrange(size)) for _ in range(rng.randint(1, 12))]
+            for cell in cells:
+                if cell != goal:
+                    blocked[cell] = not blocked[cell]
+            free_cells = np.argwhere(~blocked)
+            start = tuple(int(v) for v in free_cells[rng.randrange(len(free_cells))])
+            planner.update_start(start)
+            rows, cols = zip(*cells)
+            planner.update_cells(rows, cols, blocked[list(rows), list(cols)])
+            planner.compute()
+            expected = distance_field(blocked, [goal])[start]
+            got = planner.cost()
+            ok = (got == expected) if math.isinf(expected) or math.isinf(got) else \
+                abs(got - expected) <= tolerance * max(1.0, expected)
+            cells_path = planner.path()
+            if ok and cells_path is not None:
+                length = sum(SQRT2 if r0 != r1 and c0 != c1 else 1.0
+                             for (r0, c0), (r1, c1) in zip(cells_path, cells_path[1:]))
+                ok = cells_path[-1] == goal and abs(length - expected) <= tolerance * max(1.0, expected)
+            if not ok:
+                mismatches += 1
+                print(f"  scenario {n}: D* Lite cost {got:.4f}, fresh search {expected:.4f}")
+    return mismatches
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == '--selfcheck':
+        scenarios = int(args[1]) if len(args) > 1 else SELFCHECK_SCENARIOS
+        mismatches = selfcheck(scenarios)
+        print(f"{scenarios} scenarios x {SELFCHECK_EDITS} repairs: {mismatches} mismatches")
+        sys.exit(1 if mismatches else 0)
+    map_prefix = None
+    if '--map' in args:
+        i = args.index('--map')
+        map_prefix = args[i + 1]
+        del args[i:i + 2]
+    if len(args) < 4:
+        print(__doc__)
+        sys.exit(1)
+
+    world = args[0]
+    robot_id = int(args[1])
+    goal_xy = (float(args[2]), float(args[3]))
+    cfg_path = os.path.join(project_root, 'world_configs', f'{world}.json')
+    try:
+        with open(cfg_path) as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        print(f"ERROR: No config found for world '{world}' at {cfg_path}")
+        sys.exit(1)
+    max_range = cfg.get('lidar_max_range', 3.5)
+
+    if map_prefix:
+        grid = OccupancyGrid.load_snapshot(map_prefix)
+    else:
+        x_min = cfg['floor_center_x'] - cfg['floor_width'] / 2
+        y_min = cfg['floor_center_y'] - cfg['floor_height'] / 2
+        grid = OccupancyGrid(x_min, x_min + cfg['floor_width'], y_min, y_min + cfg['floor_height'],
+                             resolution=GRID_RESOLUTION)
+    mask, res = prepare_mask(grid)
+    radius_cells = ROBOT_RADIUS / res
+    origin = (grid.x_min, grid.y_min)
+
+    print(f"=== D* Lite Planner [{cfg['name']}] ===")
+    print(f"Grid: {grid.width}x{grid.height} cells at {res}m | goal ({goal_xy[0]:.2f}, {goal_xy[1]:.2f})")
+
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        udp.bind(('localhost', POSITION_PORT))
+    except OSError as err:
+        print(f"ERROR: Could not bind UDP :{POSITION_PORT}: {err} — is slam_viz running?")
+        sys.exit(1)
+    udp.setblocking(False)
+
+    port = WAYPOINT_PORT + robot_id
+    try:
+        sock = socket.create_connection((HOST, port))
+    except OSError as err:
+        print(f"ERROR: Could not connect to robot {robot_id} on port {port}: {err}")
+        sys.exit(1)
+    sock.setblocking(False)
+    print(f"Connected to robot {robot_id} on port {port}")
+
+    sel = selectors.DefaultSelector()
+    sel.register(udp, selectors.EVENT_READ, 'udp')
+    sel.register(sock, selectors.EVENT_READ, 'tcp')
+
+    planner = None
+    pos = None
+    pending_r, pending_c = [], []
+    sent_cells = None
+    buffer = ""
+    last_replan = 0.0
+    replans = sends = 0
+    try:
+        while True:
+            for key, _ in sel.select(timeout=0.1):
+                if key.data == 'udp':
+                    while True:
+                        try:
+                            data = udp.recv(65535)
+                        except BlockingIOError:
+                            break
+                        try:
+                            rid, x, y, heading, ranges = unpack_position(data)
+                        except struct.error:
+                            continue   # truncated or foreign packet
+                        if rid != robot_id:
+                            continue
+                        pos = (x, y)
+                        if ranges:
+                            grid.update_from_lidar(x, y, heading, ranges,
+                                                   angle_min=LIDAR_ANGLE_MIN,
+                                                   angle_increment=-(2.0 * math.pi / len(ranges)),
+                                                   max_range=max_range)
+                            rows, cols = refresh_mask(grid, mask, grid.last_update_bbox, radius_cells)
+                            pending_r.extend(rows.tolist())
+                            pending_c.extend(cols.tolist())
+                    continue
+                try:
+                    data = sock.recv(4096)
+                except OSError:
+                    data = b''
+                if not data:
+                    print("Controller disconnected")
+                    return
+                buffer += data.decode('utf-8')
+                while '\n' in buffer:
+                    line, buffer = buffer.split('\n', 1)
+                    reached = parse_reached_ack(line)
+                    if reached:
+                        print(f"✓ Goal reached at ({reached[0]:.2f}, {reached[1]:.2f}) — "
+                              f"{replans} repairs, {sends} PATH updates")
+                        return
+
+            now = time.monotonic()
+            if pos is None or now - last_replan < REPLAN_INTERVAL:
+                continue
+            last_replan = now
+
+            col, row = grid.world_to_grid(*pos)
+            start = nearest_free(mask, row, col)
+            if start is None:
+                continue
+            t0 = time.perf_counter()
+            if planner is None:
+                gcol, grow = grid.world_to_grid(*goal_xy)
+                goal = nearest_free(mask, grow, gcol)
+                if goal is None:
+                    print("ERROR: Goal is not on free space")
+                    return
+                planner = DStarLite(mask, start, goal)
+                pending_r, pending_c = [], []
+                changed = 0
+            else:
+                planner.update_start(start)
+                changed = planner.update_cells(pending_r, pending_c, mask[pending_r, pending_c])
+                pending_r, pending_c = [], []
+                if changed == 0 and sent_cells is not None:
+                    continue
+            before = planner.expanded
+            found = planner.compute()
+            cells = planner.path() if found else None
+            dt = 1000 * (time.perf_counter() - t0)
+            replans += 1
+
+            if cells is None:
+                print(f"  No path to goal ({changed} cells changed) — waiting for the map to open up")
+                sent_cells = None
+                continue
+            if same_route(cells, sent_cells):
+                continue
+            world = [grid.grid_to_world(c, r) for r, c in cells]
+            path = process_path(world[1:], mask, origin, res, start=pos)
+            try:
+                send_path_command(sock, path)
+            except OSError as err:
+                print(f"ERROR: {err}")
+                return
+            sent_cells = cells
+            sends += 1
+            print(f"  PATH #{sends}: {len(path)} waypoints | {changed} cells changed, "
+                  f"{planner.expanded - before} expansions, {dt:.1f} ms")
+    except KeyboardInterrupt:
+        print("\nStopped by user")
+    finally:
+        sock.close()
+        udp.close()
+
+
+if __name__ == '__main__':
+    main()
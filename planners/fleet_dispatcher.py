@@ -0,0 +1,242 @@
+"""Fleet dispatcher: drives every robot in a world config concurrently from per-robot mission lists.
+
+Usage:
+    python planners/fleet_dispatcher.py <world> <missions.json>
+
+<world> is a world_configs/<world>.json key (dal-factory, dal2). missions.json maps
+robot IDs to goal lists ([x, y], or [x, y, z] for the drone); robots without a
+mission are not contacted:
+    {"0": [[3.0, -5.0], [3.0, 0.0]],
+     "2": [[-1.0, 2.0, 1.5], [-1.0, 8.0, 1.0]]}
+
+All controllers are served from one selector loop. A robot gets its next
+WAYPOINT as soon as its REACHED arrives, so nothing waits on another robot.
+Per-robot and fleet throughput (goals per minute, busy and idle time) are
+printed every REPORT_INTERVAL seconds and at exit.
+"""
+
+import sys
+import os
+import json
+import time
+import errno
+import socket
+import selectors
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.protocol import (
+    WAYPOINT_PORT,
+    send_waypoint_command,
+    parse_reached_ack
+)
+
+HOST = 'localhost'
+CONNECT_RETRY = 1.0     # seconds between connection attempts to a controller not yet up
+CONNECT_TIMEOUT = 30.0  # give up on a controller after this long
+REPORT_INTERVAL = 10.0  # seconds
+
+
+class Robot:
+    def __init__(self, robot_id, name, goals):
+        self.robot_id = robot_id
+        self.name = name
+        self.goals = [tuple(g) for g in goals]
+        self.sock = None
+        self.buffer = ""
+        self.connected = False
+        self.done = not self.goals
+        self.next_connect = 0.0
+
+        self.in_flight = None      # goal currently being driven to
+        self.sent_at = 0.0
+        self.idle_since = None
+        self.completed = 0
+        self.busy_s = 0.0
+        self.idle_s = 0.0
+
+    def idle_total(self, now):
+        return self.idle_s + (now - self.idle_since if self.idle_since is not None else 0.0)
+
+
+class FleetDispatcher:
+
+    def __init__(self, robots):
+        self.robots = robots
+        self.sel = selectors.DefaultSelector()
+        self.start = time.monotonic()
+        self.last_report = self.start
+
+    # ── Connections ───────────────────────────────────────────────────────────
+    def try_connect(self, robot, now):
+        robot.next_connect = now + CONNECT_RETRY
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        err = sock.connect_ex((HOST, WAYPOINT_PORT + robot.robot_id))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            return
+        robot.sock = sock
+        self.sel.register(sock, selectors.EVENT_WRITE, robot)
+
+    def finish_connect(self, robot, now):
+        err = robot.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        self.sel.unregister(robot.sock)
+        if err:
+            robot.sock.close()
+            robot.sock = None
+            return
+        robot.connected = True
+        robot.idle_since = now
+        self.sel.register(robot.sock, selectors.EVENT_READ, robot)
+        print(f"Connected to {robot.name} (robot {robot.robot_id}) on port {WAYPOINT_PORT + robot.robot_id}")
+        self.dispatch(robot, now)
+
+    def drop(self, robot, reason):
+        print(f"{robot.name}: {reason}")
+        if robot.sock is not None:
+            try:
+                self.sel.unregister(robot.sock)
+            except (KeyError, ValueError):
+                pass
+            robot.sock.close()
+            robot.sock = None
+        robot.connected = False
+        robot.done = True
+
+    # ── Dispatch ──────────────────────────────────────────────────────────────
+    def dispatch(self, robot, now):
+        """Send the next goal, or mark the robot done."""
+        if not robot.goals:
+            robot.done = True
+            return
+        goal = robot.goals.pop(0)
+        try:
+            send_waypoint_command(robot.sock, *goal)
+        except OSError as e:
+            self.drop(robot, f"send failed: {e}")
+            return
+        if robot.idle_since is not None:
+            robot.idle_s += now - robot.idle_since
+            robot.idle_since = None
+        robot.in_flight = goal
+        robot.sent_at = now
+
+    def on_readable(self, robot, now):
+        try:
+            data = robot.sock.recv(4096)
+        except OSError as e:
+            self.drop(robot, f"connection error: {e}")
+            return
+        if not data:
+            self.drop(robot, "controller disconnected")
+            return
+        robot.buffer += data.decode('utf-8')
+        while '\n' in robot.buffer:
+            line, robot.buffer = robot.buffer.split('\n', 1)
+            reached = parse_reached_ack(line)
+            if not reached or robot.in_flight is None:
+                continue
+            took = now - robot.sent_at
+            robot.busy_s += took
+            robot.completed += 1
+            robot.in_flight = None
+            robot.idle_since = now
+            print(f"✓ {robot.name} reached ({reached[0]:.2f}, {reached[1]:.2f}) in {took:.1f}s "
+                  f"[{robot.completed} done, {len(robot.goals)} left]")
+            self.dispatch(robot, now)
+
+    # ── Reporting ─────────────────────────────────────────────────────────────
+    def report(self, now, final=False):
+        elapsed = max(1e-6, now - self.start)
+        print(f"\n── Fleet throughput after {elapsed:.0f}s {'(final) ' if final else ''}──")
+        print(f"  {'robot':<14} {'done':>5} {'left':>5} {'goals/min':>10} {'busy_s':>8} {'idle_s':>8} {'util':>6}")
+        total = 0
+        for r in self.robots.values():
+            idle = r.idle_total(now)
+            busy = r.busy_s + (now - r.sent_at if r.in_flight is not None else 0.0)
+            util = 100.0 * busy / elapsed
+            total += r.completed
+            left = len(r.goals) + (1 if r.in_flight is not None else 0)
+            print(f"  {r.name:<14} {r.completed:>5} {left:>5} {60.0 * r.completed / elapsed:>10.2f} "
+                  f"{busy:>8.1f} {idle:>8.1f} {util:>5.0f}%")
+        print(f"  {'fleet':<14} {total:>5} {'':>5} {60.0 * total / elapsed:>10.2f}\n")
+
+    def run(self):
+        while True:
+            now = time.monotonic()
+            pending = False
+            for r in self.robots.values():
+                if r.done:
+                    continue
+                pending = True
+                if not r.connected and r.sock is None:
+                    if now - self.start > CONNECT_TIMEOUT:
+                        self.drop(r, f"no controller on port {WAYPOINT_PORT + r.robot_id} — giving up")
+                    elif now >= r.next_connect:
+                        self.try_connect(r, now)
+            if not pending:
+                break
+
+            for key, mask in self.sel.select(timeout=0.2):
+                robot = key.data
+                now = time.monotonic()
+                if not robot.connected:
+                    self.finish_connect(robot, now)
+                else:
+                    self.on_readable(robot, now)
+
+            if now - self.last_report >= REPORT_INTERVAL:
+                self.last_report = now
+                self.report(now)
+
+        self.report(time.monotonic(), final=True)
+        for r in self.robots.values():
+            if r.sock is not None:
+                r.sock.close()
+
+
+def load_fleet(world, missions):
+    cfg_path = os.path.join(project_root, 'world_configs', f'{world}.json')
+    try:
+        with open(cfg_path) as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        print(f"ERROR: No config found for world '{world}' at {cfg_path}")
+        sys.exit(1)
+
+    robots = {}
+    for rid, r in cfg['robots'].items():
+        goals = missions.get(rid, [])
+        robots[int(rid)] = Robot(int(rid), r['name'], goals)
+    for rid in missions:
+        if rid not in cfg['robots']:
+            print(f"WARNING: mission for robot {rid} ignored — not in {world} config")
+    return robots
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    with open(sys.argv[2]) as f:
+        missions = json.load(f)
+    robots = load_fleet(sys.argv[1], missions)
+
+    print(f"=== Fleet Dispatcher ===")
+    for r in robots.values():
+        print(f"  {r.name} (robot {r.robot_id}): {len(r.goals)} goals")
+    print()
+
+    dispatcher = FleetDispatcher(robots)
+    try:
+        dispatcher.run()
+    except KeyboardInterrupt:
+        print("\nStopped by user")
+        dispatcher.report(time.monotonic(), final=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+"""Frontier explorer: maps a world autonomously by sending robots to the edge of the known area.
+
+Usage:
+    python planners/frontier_explorer.py <world> <robot_id> [<robot_id> ...] [--save <map_prefix>]
+
+Binds UDP :5555 (stop slam_viz first), builds an OccupancyGrid from every
+listed robot's LIDAR, and keeps a frontier mask: free cells with an unknown
+4-neighbour. After each scan only the box of cells that scan touched, grown by
+one cell, is re-evaluated (OccupancyGrid.last_update_bbox), so the per-scan
+cost follows the LIDAR footprint rather than the floor size. Frontier cells
+are clustered on demand, and each idle robot is sent (as a smoothed PATH) to
+the cluster with the best utility - cost, with clusters near other robots'
+goals discounted. The map is saved to <map_prefix> when nothing is left to
+explore or on Ctrl+C.
+"""
+
+import sys
+import os
+import json
+import math
+import time
+import socket
+import struct
+import selectors
+from collections import deque
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.protocol import (
+    POSITION_PORT,
+    WAYPOINT_PORT,
+    unpack_position,
+    send_path_command,
+    parse_reached_ack
+)
+from utils.occupancy_grid import OccupancyGrid
+from planners.grid_planner import prepare_mask, distance_field, nearest_free, plan_path
+from planners.path_processing import process_path
+
+HOST = 'localhost'
+
+GRID_RESOLUTION = 0.15   # meters — same as slam_viz
+LIDAR_ANGLE_MIN = math.pi
+FREE_THRESHOLD = 0.35    # probability below which a cell counts as free
+UNKNOWN_BAND = 0.05      # |p - 0.5| below this counts as never observed
+MIN_CLUSTER = 4          # frontier cells; smaller clusters are scan noise
+UTILITY_WEIGHT = 2.0     # per meter of frontier
+COST_WEIGHT = 1.0        # per meter of travel
+CLAIM_DISCOUNT = 0.8     # fraction of utility lost when another robot's goal is within LIDAR range
+BLACKLIST_RADIUS = 0.5   # meters around a goal that could not be reached or cleared
+GOAL_TIMEOUT = 90.0      # seconds before an unreached goal is given up on
+CHECK_INTERVAL = 1.0     # seconds between checks that active goals are still frontier
+IDLE_ROUNDS = 5          # checks in a row with every robot idle before the remaining clusters count as unreachable
+STATUS_INTERVAL = 10.0   # seconds
+
+
+class FrontierTracker:
+    """Frontier mask over an OccupancyGrid, refreshed only where the grid changed."""
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.frontier = np.zeros((grid.height, grid.width), dtype=bool)
+        self.count = 0
+        self.cells_updated = 0
+        self.updates = 0
+        self.rebuild()
+
+    def _evaluate(self, r0, r1, c0, c1):
+        """Recompute frontier[r0:r1, c0:c1] (exclusive ends) from a window padded by one cell."""
+        h, w = self.frontier.shape
+        w_r0, w_r1 = max(0, r0 - 1), min(h, r1 + 1)
+        w_c0, w_c1 = max(0, c0 - 1), min(w, c1 + 1)
+        p = self.grid.grid[w_r0:w_r1, w_c0:w_c1]
+        unknown = np.abs(p - 0.5) < UNKNOWN_BAND
+        near = np.zeros_like(unknown)
+        near[1:, :] |= unknown[:-1, :]
+        near[:-1, :] |= unknown[1:, :]
+        near[:, 1:] |= unknown[:, :-1]
+        near[:, :-1] |= unknown[:, 1:]
+        front = (p < FREE_THRESHOLD) & near
+        new = front[r0 - w_r0:r1 - w_r0, c0 - w_c0:c1 - w_c0]
+        old = self.frontier[r0:r1, c0:c1]
+        self.count += int(new.sum()) - int(old.sum())
+        old[...] = new
+        self.cells_updated += new.size
+        self.updates += 1
+
+    def rebuild(self):
+        self._evaluate(0, self.grid.height, 0, self.grid.width)
+
+    def update(self, bbox):
+        """Refresh after a scan; bbox is OccupancyGrid.last_update_bbox."""
+        if bbox is None:
+            return
+        row_min, row_max, col_min, col_max = bbox
+        # A changed cell can flip its own status and that of its 4-neighbours
+        h, w = self.frontier.shape
+        self._evaluate(max(0, row_min - 1), min(h, row_max + 2), max(0, col_min - 1), min(w, col_max + 2))
+
+    def clusters(self, min_size=MIN_CLUSTER):
+        """8-connected frontier clusters as (N, 2) arrays of (row, col). Cost scales with the frontier, not the grid."""
+        cells = set(zip(*np.nonzero(self.frontier)))
+        out = []
+        while cells:
+            seed = cells.pop()
+            group = [seed]
+            queue = deque([seed])
+            while queue:
+                r, c = queue.popleft()
+                for dr in (-1, 0, 1):
+                    for dc in (-1, 0, 1):
+                        n = (r + dr, c + dc)
+                        if n in cells:
+                            cells.remove(n)
+                            group.append(n)
+                            queue.append(n)
+            if len(group) >= min_size:
+                out.append(np.array(group, dtype=np.int64))
+        return out
+
+
+class Explorer:
+    def __init__(self, robot_id):
+        self.robot_id = robot_id
+        self.sock = None
+        self.buffer = ""
+        self.pos = None
+        self.heading = 0.0
+        self.goal_cell = None    # (row, col) of the frontier cell being driven to
+        self.goal_xy = None
+        self.goal_sent_at = 0.0
+        self.goals_sent = 0
+
+
+def assign_goals(grid, tracker, explorers, max_range, blacklist):
+    """Send every idle robot to its best plannable frontier cluster. Returns the number of clusters seen.
+
+    blacklist is a list of world (x, y) goals that failed; frontier cells within
+    BLACKLIST_RADIUS of them are ignored, and clusters left empty are not counted.
+    """
+    idle = [e for e in explorers.values() if e.goal_cell is None and e.pos is not None and e.sock]
+    clusters = tracker.clusters()
+    if blacklist:
+        bl = np.array(blacklist)
+        kept = []
+        for cells in clusters:
+            wx = grid.x_min + (cells[:, 1] + 0.5) * grid.resolution
+            wy = grid.y_min + (cells[:, 0] + 0.5) * grid.resolution
+            near = np.hypot(wx[:, None] - bl[None, :, 0], wy[:, None] - bl[None, :, 1]) < BLACKLIST_RADIUS
+            cells = cells[~near.any(axis=1)]
+            if len(cells) >= MIN_CLUSTER:
+                kept.append(cells)
+        clusters = kept
+    if not idle or not clusters:
+        return len(clusters)
+
+    mask, res = prepare_mask(grid)
+    origin = (grid.x_min, grid.y_min)
+    size = np.array([len(c) for c in clusters], dtype=np.float64) * res
+    for e in idle:
+        col, row = grid.world_to_grid(*e.pos)
+        src = nearest_free(mask, row, col)
+        if src is None:
+            continue
+        field = distance_field(mask, [src])
+        ranked = []
+        for k, cells in enumerate(clusters):
+            d = field[cells[:, 0], cells[:, 1]]
+            j = int(np.argmin(d))
+            if not np.isfinite(d[j]):
+                continue
+            target = (int(cells[j, 0]), int(cells[j, 1]))
+            utility = UTILITY_WEIGHT * size[k]
+            tx, ty = grid.grid_to_world(target[1], target[0])
+            for other in explorers.values():
+                if other is not e and other.goal_xy is not None and \
+                        math.hypot(other.goal_xy[0] - tx, other.goal_xy[1] - ty) < max_range:
+                    utility *= 1.0 - CLAIM_DISCOUNT
+            ranked.append((utility - COST_WEIGHT * d[j] * res, k, target, (tx, ty), size[k]))
+        ranked.sort(reverse=True)
+
+        # Fall back to the next-ranked cluster when the best one cannot be planned to
+        for _, _, target, goal_xy, frontier_m in ranked:
+            path = plan_path(grid, e.pos, goal_xy, resolution=res, mask=mask)
+            if path:
+                break
+            blacklist.append(goal_xy)
+        else:
+            continue
+        path = process_path(path, mask, origin, res, start=e.pos)
+        try:
+            send_path_command(e.sock, path)
+        except OSError as err:
+            print(f"ERROR: Robot {e.robot_id}: {err}")
+            continue
+        e.goal_cell = target
+        e.goal_xy = goal_xy
+        e.goal_sent_at = time.monotonic()
+        e.goals_sent += 1
+        print(f"→ Robot {e.robot_id}: frontier at ({goal_xy[0]:.2f}, {goal_xy[1]:.2f}), "
+              f"{frontier_m:.1f} m of frontier, {len(path)} waypoints")
+    return len(clusters)
+
+
+def main():
+    args = sys.argv[1:]
+    save_prefix = None
+    if '--save' in args:
+        i = args.index('--save')
+        save_prefix = args[i + 1]
+        del args[i:i + 2]
+    if len(args) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    world = args[0]
+    cfg_path = os.path.join(project_root, 'world_configs', f'{world}.json')
+    try:
+        with open(cfg_path) as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        print(f"ERROR: No config found for world '{world}' at {cfg_path}")
+        sys.exit(1)
+
+    x_min = cfg['floor_center_x'] - cfg['floor_width'] / 2
+    x_max = cfg['floor_center_x'] + cfg['floor_width'] / 2
+    y_min = cfg['floor_center_y'] - cfg['floor_height'] / 2
+    y_max = cfg['floor_center_y'] + cfg['floor_height'] / 2
+    max_range = cfg.get('lidar_max_range', 3.5)
+    grid = OccupancyGrid(x_min, x_max, y_min, y_max, resolution=GRID_RESOLUTION)
+    tracker = FrontierTracker(grid)
+
+    print(f"=== Frontier Explorer [{cfg['name']}] ===")
+    print(f"Grid: {grid.width}x{grid.height} cells at {GRID_RESOLUTION}m")
+
+    sel = selectors.DefaultSelector()
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        udp.bind(('localhost', POSITION_PORT))
+    except OSError as err:
+        print(f"ERROR: Could not bind UDP :{POSITION_PORT}: {err} — is slam_viz running?")
+        sys.exit(1)
+    udp.setblocking(False)
+    sel.register(udp, selectors.EVENT_READ, None)
+
+    explorers = {}
+    for rid in args[1:]:
+        e = Explorer(int(rid))
+        port = WAYPOINT_PORT + e.robot_id
+        try:
+            e.sock = socket.create_connection((HOST, port))
+        except OSError as err:
+            print(f"ERROR: Could not connect to robot {rid} on port {port}: {err}")
+            continue
+        e.sock.setblocking(False)
+        sel.register(e.sock, selectors.EVENT_READ, e)
+        explorers[e.robot_id] = e
+        print(f"Connected to robot {rid} on port {port}")
+    if not explorers:
+        sys.exit(1)
+
+    blacklist = []
+    scans = 0
+    update_s = 0.0
+    last_check = last_status = started = time.monotonic()
+    waiting_for_scans = True
+    idle_rounds = 0
+    try:
+        while True:
+            for key, _ in sel.select(timeout=0.1):
+                e = key.data
+                if e is None:
+                    while True:
+                        try:
+                            data = udp.recv(65535)
+                        except BlockingIOError:
+                            break
+                        try:
+                            robot_id, x, y, heading, ranges = unpack_position(data)
+                        except struct.error:
+                            continue   # truncated or foreign packet
+                        r = explorers.get(robot_id)
+                        if r is None:
+                            continue
+                        r.pos = (x, y)
+                        r.heading = heading
+                        if ranges:
+                            t0 = time.perf_counter()
+                            grid.update_from_lidar(x, y, heading, ranges,
+                                                   angle_min=LIDAR_ANGLE_MIN,
+                                                   angle_increment=-(2.0 * math.pi / len(ranges)),
+                                                   max_range=max_range)
+                            tracker.update(grid.last_update_bbox)
+                            update_s += time.perf_counter() - t0
+                            scans += 1
+                    continue
+                try:
+                    data = e.sock.recv(4096)
+                except OSError:
+                    data = b''
+                if not data:
+                    print(f"Robot {e.robot_id} disconnected")
+                    sel.unregister(e.sock)
+                    e.sock.close()
+                    e.sock = None
+                    e.goal_cell = e.goal_xy = None
+                    continue
+                e.buffer += data.decode('utf-8')
+                while '\n' in e.buffer:
+                    line, e.buffer = e.buffer.split('\n', 1)
+                    if parse_reached_ack(line) and e.goal_cell is not None:
+                        print(f"✓ Robot {e.robot_id} reached frontier ({e.goal_xy[0]:.2f}, {e.goal_xy[1]:.2f})")
+                        r, c = e.goal_cell
+                        if tracker.frontier[max(0, r - 1):r + 2, max(0, c - 1):c + 2].any():
+                            # Still unknown beyond it from up close — unobservable, stop chasing it
+                            blacklist.append(e.goal_xy)
+                        e.goal_cell = e.goal_xy = None
+
+            now = time.monotonic()
+            if not any(e.sock for e in explorers.values()):
+                print("All robots disconnected")
+                break
+            if now - last_check >= CHECK_INTERVAL:
+                last_check = now
+                # A goal that is no longer frontier has been seen on the way — pick a new one
+                for e in explorers.values():
+                    if e.goal_cell is not None:
+                        r, c = e.goal_cell
+                        window = tracker.frontier[max(0, r - 1):r + 2, max(0, c - 1):c + 2]
+                        if not window.any():
+                            e.goal_cell = e.goal_xy = None
+                        elif now - e.goal_sent_at > GOAL_TIMEOUT:
+                            print(f"  Robot {e.robot_id}: giving up on ({e.goal_xy[0]:.2f}, {e.goal_xy[1]:.2f})")
+                            blacklist.append(e.goal_xy)
+                            e.goal_cell = e.goal_xy = None
+                if waiting_for_scans and scans > 0:
+                    waiting_for_scans = False
+                if not waiting_for_scans:
+                    n_clusters = assign_goals(grid, tracker, explorers, max_range, blacklist)
+                    active = [e for e in explorers.values() if e.sock]
+                    if all(e.pos is not None and e.goal_cell is None for e in active):
+                        idle_rounds += 1
+                        if n_clusters == 0:
+                            print("No frontiers left — exploration complete")
+                            break
+                        if idle_rounds >= IDLE_ROUNDS:
+                            print(f"No reachable frontiers left ({n_clusters} clusters remain) — exploration complete")
+                            break
+                    else:
+                        idle_rounds = 0
+
+            if now - last_status >= STATUS_INTERVAL:
+                last_status = now
+                known = np.count_nonzero(np.abs(grid.grid - 0.5) >= UNKNOWN_BAND) / grid.grid.size * 100
+                avg_cells = tracker.cells_updated / max(1, tracker.updates)
+                print(f"  [{now - started:.0f}s] known {known:.0f}% | frontier {tracker.count} cells | "
+                      f"{scans} scans, {1000 * update_s / max(1, scans):.2f} ms/scan, "
+                      f"{avg_cells:.0f} of {grid.grid.size} cells re-evaluated per scan")
+    except KeyboardInterrupt:
+        print("\nStopped by user")
+
+    for e in explorers.values():
+        if e.sock:
+            e.sock.close()
+    udp.close()
+    if save_prefix:
+        grid.save_snapshot(save_prefix)
+        print(f"Map saved to {save_prefix}.npy / {save_prefix}.json")
+
+
+if __name__ == '__main__':
+    main()
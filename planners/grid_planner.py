@@ -0,0 +1,501 @@
+"""Grid planner: A* with Jump Point Search on an OccupancyGrid, sends the result as a PATH.
+
+Usage:
+    python planners/grid_planner.py <robot_id> <map_prefix> <start_x> <start_y> <goal_x> <goal_y> [resolution]
+
+<map_prefix> is a snapshot written by OccupancyGrid.save_snapshot (<prefix>.npy + <prefix>.json).
+The optional resolution (meters) resamples the map before planning. The path is
+shortcut, smoothed and resampled by planners/path_processing.py before it is sent.
+"""
+
+import sys
+import os
+import math
+import time
+import socket
+import heapq
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.protocol import (
+    WAYPOINT_PORT,
+    send_path_command,
+    parse_reached_ack
+)
+from utils.occupancy_grid import OccupancyGrid
+from planners.path_processing import process_path
+
+HOST = 'localhost'
+
+OCCUPIED_THRESHOLD = 0.65  # probability above which a cell is an obstacle
+ROBOT_RADIUS = 0.30        # meters — obstacles are inflated by this much
+SQRT2 = math.sqrt(2.0)
+
+
+# ── Map preparation ───────────────────────────────────────────────────────────
+
+def blocked_mask(grid, occupied_threshold=OCCUPIED_THRESHOLD, unknown_is_free=True):
+    """Boolean (rows, cols) obstacle mask from an OccupancyGrid. Unknown cells are 0.5."""
+    blocked = grid.grid >= occupied_threshold
+    if not unknown_is_free:
+        blocked |= np.abs(grid.grid - 0.5) < 1e-3
+    return blocked
+
+
+def inflate(mask, radius_cells):
+    """Dilate a boolean mask by a disk of radius_cells (vectorized shifts)."""
+    r = int(math.ceil(radius_cells))
+    if r <= 0:
+        return mask.copy()
+    out = mask.copy()
+    rows, cols = mask.shape
+    for dr in range(-r, r + 1):
+        for dc in range(-r, r + 1):
+            if (dr == 0 and dc == 0) or dr * dr + dc * dc > radius_cells * radius_cells:
+                continue
+            src = mask[max(0, -dr):rows - max(0, dr), max(0, -dc):cols - max(0, dc)]
+            out[max(0, dr):rows - max(0, -dr), max(0, dc):cols - max(0, -dc)] |= src
+    return out
+
+
+def refresh_mask(grid, mask, bbox, radius_cells, occupied_threshold=OCCUPIED_THRESHOLD):
+    """Re-inflate mask (same resolution as grid) around a changed box, in place.
+
+    bbox is (row_min, row_max, col_min, col_max) inclusive, e.g. grid.last_update_bbox.
+    Returns (rows, cols) index arrays of the cells whose blocked state flipped.
+    """
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    if bbox is None:
+        return empty
+    r = int(math.ceil(radius_cells))
+    h, w = mask.shape
+    row_min, row_max, col_min, col_max = bbox
+    # Cells within r of the box can change; their inflation reads up to r further out
+    o_r0, o_r1 = max(0, row_min - r), min(h, row_max + r + 1)
+    o_c0, o_c1 = max(0, col_min - r), min(w, col_max + r + 1)
+    i_r0, i_r1 = max(0, o_r0 - r), min(h, o_r1 + r)
+    i_c0, i_c1 = max(0, o_c0 - r), min(w, o_c1 + r)
+    raw = grid.grid[i_r0:i_r1, i_c0:i_c1] >= occupied_threshold
+    new = inflate(raw, radius_cells)[o_r0 - i_r0:o_r1 - i_r0, o_c0 - i_c0:o_c1 - i_c0]
+    old = mask[o_r0:o_r1, o_c0:o_c1]
+    rows, cols = np.nonzero(new != old)
+    if rows.size == 0:
+        return empty
+    old[...] = new
+    return rows + o_r0, cols + o_c0
+
+
+def resample_mask(mask, src_resolution, dst_resolution):
+    """Nearest-cell resample of a mask to a different resolution (same world extent)."""
+    if abs(src_resolution - dst_resolution) < 1e-9:
+        return mask
+    rows, cols = mask.shape
+    new_rows = int(math.ceil(rows * src_resolution / dst_resolution))
+    new_cols = int(math.ceil(cols * src_resolution / dst_resolution))
+    r_idx = np.minimum(((np.arange(new_rows) + 0.5) * dst_resolution / src_resolution).astype(int), rows - 1)
+    c_idx = np.minimum(((np.arange(new_cols) + 0.5) * dst_resolution / src_resolution).astype(int), cols - 1)
+    return mask[np.ix_(r_idx, c_idx)]
+
+
+def downsample_any(mask, factor):
+    """Coarsen a mask by an integer factor; a coarse cell is blocked if any fine cell is."""
+    if factor <= 1:
+        return mask
+    rows, cols = mask.shape
+    pr = (-rows) % factor
+    pc = (-cols) % factor
+    padded = np.pad(mask, ((0, pr), (0, pc)), constant_values=False)
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).any(axis=(1, 3))
+
+
+def distance_field(blocked, sources, diagonal_cost=SQRT2):
+    """Multi-source Dijkstra over an 8-connected grid (no corner cutting).
+
+    sources is a list of (row, col). Returns a float array of path costs in
+    cells, inf where unreachable. One call gives the cost from the nearest
+    source to every cell, so a robot x task cost row needs one call per robot.
+    """
+    rows, cols = blocked.shape
+    W = cols + 2
+    padded = np.zeros((rows + 2, W), dtype=np.uint8)
+    padded[1:-1, 1:-1] = ~blocked
+    walk = padded.ravel().tolist()
+    inf = float('inf')
+    dist = [inf] * len(walk)
+    # (offset, cost, orthogonal a, orthogonal b); straight moves check themselves twice
+    steps = [(d, 1.0, d, d) for d in (1, -1, W, -W)]
+    steps += [(dr * W + dc, diagonal_cost, dr * W, dc) for dr in (1, -1) for dc in (1, -1)]
+
+    heap = []
+    for r, c in sources:
+        i = (int(r) + 1) * W + (int(c) + 1)
+        if walk[i] and dist[i] > 0.0:
+            dist[i] = 0.0
+            heap.append((0.0, i))
+    heapq.heapify(heap)
+    pop = heapq.heappop
+    push = heapq.heappush
+    while heap:
+        d, i = pop(heap)
+        if d > dist[i]:
+            continue
+        for off, cost, a, b in steps:
+            j = i + off
+            if not (walk[j] and walk[i + a] and walk[i + b]):
+                continue
+            nd = d + cost
+            if nd < dist[j]:
+                dist[j] = nd
+                push(heap, (nd, j))
+    return np.array(dist, dtype=np.float64).reshape(rows + 2, W)[1:-1, 1:-1]
+
+
+def nearest_free(blocked, row, col):
+    """Closest unblocked cell to (row, col), or None if the whole map is blocked."""
+    if not blocked[row, col]:
+        return row, col
+    free_r, free_c = np.nonzero(~blocked)
+    if free_r.size == 0:
+        return None
+    k = np.argmin((free_r - row) ** 2 + (free_c - col) ** 2)
+    return int(free_r[k]), int(free_c[k])
+
+
+# ── Jump Point Search ─────────────────────────────────────────────────────────
+
+class JumpPointPlanner:
+    """8-connected JPS on a uniform-cost grid; diagonals never cut obstacle corners.
+
+    The grid is stored as a flat bytearray padded with a blocked border, so
+    neighbour lookups are single index offsets without bounds checks. Search
+    state (g, parent, closed) lives in flat arrays sized to the grid. Build one
+    planner per map and reuse it: the stop tables are computed once.
+    """
+
+    def __init__(self, blocked):
+        rows, cols = blocked.shape
+        self.rows = rows
+        self.cols = cols
+        self.W = cols + 2
+        padded = np.zeros((rows + 2, cols + 2), dtype=bool)
+        padded[1:-1, 1:-1] = ~blocked
+        self.walk = bytearray(padded.astype(np.uint8).tobytes())
+        self.size = len(self.walk)
+        self._stops = self._stop_tables(padded)
+        self.goal = -1
+        self.expanded = 0
+
+    def _stop_tables(self, P):
+        """For each straight direction, the flat index where a scan from each cell stops.
+
+        A scan stops at the first wall or at the first cell with a forced
+        neighbour, so a straight jump becomes one table lookup (as in JPS+).
+        """
+        W = self.W
+        H = P.shape[0]
+        up = np.zeros_like(P)      # P[r + 1, c]
+        down = np.zeros_like(P)    # P[r - 1, c]
+        up[:-1] = P[1:]
+        down[1:] = P[:-1]
+
+        def shift_c(A, k):         # A[r, c + k]
+            out = np.zeros_like(A)
+            if k > 0:
+                out[:, :-k] = A[:, k:]
+            else:
+                out[:, -k:] = A[:, :k]
+            return out
+
+        forced = {
+            1: (up & ~shift_c(up, -1)) | (down & ~shift_c(down, -1)),
+            -1: (up & ~shift_c(up, 1)) | (down & ~shift_c(down, 1)),
+        }
+        right = shift_c(P, 1)
+        left = shift_c(P, -1)
+        right_down = np.zeros_like(P)
+        right_up = np.zeros_like(P)
+        left_down = np.zeros_like(P)
+        left_up = np.zeros_like(P)
+        right_down[1:] = right[:-1]
+        right_up[:-1] = right[1:]
+        left_down[1:] = left[:-1]
+        left_up[:-1] = left[1:]
+        forced[W] = (right & ~right_down) | (left & ~left_down)
+        forced[-W] = (right & ~right_up) | (left & ~left_up)
+
+        flat = np.arange(H * W).reshape(H, W)
+        big = H * W
+        tables = {}
+        for d, f in forced.items():
+            stop = ~P | (f & P)
+            idx = np.where(stop, flat, big if d > 0 else -1)
+            if d == 1:
+                nxt = np.minimum.accumulate(idx[:, ::-1], axis=1)[:, ::-1]
+            elif d == -1:
+                nxt = np.maximum.accumulate(idx, axis=1)
+            elif d == W:
+                nxt = np.minimum.accumulate(idx[::-1], axis=0)[::-1]
+            else:
+                nxt = np.maximum.accumulate(idx, axis=0)
+            tables[d] = nxt.ravel().tolist()
+        return tables
+
+    def _idx(self, row, col):
+        return (int(row) + 1) * self.W + (int(col) + 1)
+
+    def _rc(self, i):
+        r, c = divmod(i, self.W)
+        return r - 1, c - 1
+
+    def _heuristic(self, goal_row, goal_col):
+        """Octile distance from every cell to the goal, as a flat list."""
+        r = np.arange(self.rows + 2, dtype=np.float64)[:, None] - (goal_row + 1)
+        c = np.arange(self.W, dtype=np.float64)[None, :] - (goal_col + 1)
+        ar = np.abs(r)
+        ac = np.abs(c)
+        h = np.maximum(ar, ac) + (SQRT2 - 1.0) * np.minimum(ar, ac)
+        return h.ravel().tolist()
+
+    def _jump_straight(self, i, d):
+        """Jump along offset d: the goal if it lies on the way, else the stop cell if it is a jump point."""
+        stop = self._stops[d][i]
+        goal = self.goal
+        if d > 0:
+            on_way = i <= goal <= stop
+        else:
+            on_way = stop <= goal <= i
+        if on_way and (d == 1 or d == -1 or (goal - i) % self.W == 0):
+            return goal
+        return stop if self.walk[stop] else -1
+
+    def _jump(self, i, dr, dc):
+        W = self.W
+        if dr and dc:
+            walk = self.walk
+            goal = self.goal
+            dv = dr * W
+            d = dv + dc
+            while True:
+                if not walk[i]:
+                    return -1
+                if i == goal:
+                    return i
+                if self._jump_straight(i + dc, dc) >= 0 or self._jump_straight(i + dv, dv) >= 0:
+                    return i
+                if not (walk[i + dc] and walk[i + dv]):
+                    return -1
+                i += d
+        if dc:
+            return self._jump_straight(i, dc)
+        return self._jump_straight(i, dr * W)
+
+    def _neighbours(self, i, parent):
+        """Pruned successor directions (dr, dc) for a node reached from parent."""
+        walk = self.walk
+        W = self.W
+        if parent < 0:
+            dirs = []
+            for dr in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    if dr == 0 and dc == 0:
+                        continue
+                    if not walk[i + dr * W + dc]:
+                        continue
+                    if dr and dc and not (walk[i + dc] and walk[i + dr * W]):
+                        continue
+                    dirs.append((dr, dc))
+            return dirs
+
+        r, c = divmod(i, W)
+        pr, pc = divmod(parent, W)
+        dr = (r > pr) - (r < pr)
+        dc = (c > pc) - (c < pc)
+        dirs = []
+        if dr and dc:
+            vert = walk[i + dr * W]
+            horiz = walk[i + dc]
+            if vert:
+                dirs.append((dr, 0))
+            if horiz:
+                dirs.append((0, dc))
+            if vert and horiz:
+                dirs.append((dr, dc))
+        elif dc:
+            nxt = walk[i + dc]
+            up = walk[i + W]
+            down = walk[i - W]
+            if nxt:
+                dirs.append((0, dc))
+                if up:
+                    dirs.append((1, dc))
+                if down:
+                    dirs.append((-1, dc))
+            if up:
+                dirs.append((1, 0))
+            if down:
+                dirs.append((-1, 0))
+        else:
+            nxt = walk[i + dr * W]
+            right = walk[i + 1]
+            left = walk[i - 1]
+            if nxt:
+                dirs.append((dr, 0))
+                if right:
+                    dirs.append((dr, 1))
+                if left:
+                    dirs.append((dr, -1))
+            if right:
+                dirs.append((0, 1))
+            if left:
+                dirs.append((0, -1))
+        return dirs
+
+    def plan(self, start, goal):
+        """A*/JPS from start to goal (row, col). Returns the list of jump points, or None."""
+        s = self._idx(*start)
+        g_idx = self._idx(*goal)
+        if not self.walk[s] or not self.walk[g_idx]:
+            return None
+        self.goal = g_idx
+        W = self.W
+        h = self._heuristic(*goal)
+        inf = float('inf')
+        g = [inf] * self.size
+        parent = [-1] * self.size
+        closed = bytearray(self.size)
+
+        g[s] = 0.0
+        heap = [(h[s], s)]
+        self.expanded = 0
+        while heap:
+            _, i = heapq.heappop(heap)
+            if closed[i]:
+                continue
+            closed[i] = 1
+            self.expanded += 1
+            if i == g_idx:
+                path = []
+                while i >= 0:
+                    path.append(self._rc(i))
+                    i = parent[i]
+                path.reverse()
+                return path
+
+            gi = g[i]
+            ri, ci = divmod(i, W)
+            for dr, dc in self._neighbours(i, parent[i]):
+                jp = self._jump(i + dr * W + dc, dr, dc)
+                if jp < 0 or closed[jp]:
+                    continue
+                rj, cj = divmod(jp, W)
+                ar = abs(rj - ri)
+                ac = abs(cj - ci)
+                ng = gi + (SQRT2 * ar + (ac - ar) if ac > ar else SQRT2 * ac + (ar - ac))
+                if ng < g[jp]:
+                    g[jp] = ng
+                    parent[jp] = i
+                    heapq.heappush(heap, (ng + h[jp], jp))
+        return None
+
+
+# ── World-coordinate front end ────────────────────────────────────────────────
+
+def prepare_mask(grid, robot_radius=ROBOT_RADIUS, resolution=None):
+    """Inflated obstacle mask for grid, optionally resampled. Returns (mask, resolution)."""
+    mask = blocked_mask(grid)
+    res = grid.resolution
+    if resolution is not None:
+        mask = resample_mask(mask, grid.resolution, resolution)
+        res = resolution
+    return inflate(mask, robot_radius / res), res
+
+
+def plan_path(grid, start_xy, goal_xy, robot_radius=ROBOT_RADIUS, resolution=None, mask=None):
+    """Plan from start_xy to goal_xy in world meters. Returns [(x, y), ...] excluding the start, or None.
+
+    Pass a precomputed mask (from prepare_mask) to skip inflation on repeated queries;
+    its resolution must then equal resolution (or grid.resolution if None).
+    """
+    res = resolution or grid.resolution
+    if mask is None:
+        mask, res = prepare_mask(grid, robot_radius, resolution)
+    rows, cols = mask.shape
+
+    def to_cell(wx, wy):
+        col = min(cols - 1, max(0, int((wx - grid.x_min) / res)))
+        row = min(rows - 1, max(0, int((wy - grid.y_min) / res)))
+        return row, col
+
+    start = nearest_free(mask, *to_cell(*start_xy))
+    goal = nearest_free(mask, *to_cell(*goal_xy))
+    if start is None or goal is None:
+        return None
+    cells = JumpPointPlanner(mask).plan(start, goal)
+    if cells is None:
+        return None
+    return [(grid.x_min + (c + 0.5) * res, grid.y_min + (r + 0.5) * res) for r, c in cells[1:]]
+
+
+def main():
+    if len(sys.argv) < 7:
+        print(__doc__)
+        sys.exit(1)
+
+    robot_id = int(sys.argv[1])
+    grid = OccupancyGrid.load_snapshot(sys.argv[2])
+    start = (float(sys.argv[3]), float(sys.argv[4]))
+    goal = (float(sys.argv[5]), float(sys.argv[6]))
+    resolution = float(sys.argv[7]) if len(sys.argv) > 7 else None
+
+    print(f"=== Grid Planner (A* + JPS) ===")
+    print(f"Map: {grid.width}x{grid.height} cells at {grid.resolution}m")
+
+    t0 = time.perf_counter()
+    mask, res = prepare_mask(grid, resolution=resolution)
+    t1 = time.perf_counter()
+    path = plan_path(grid, start, goal, resolution=res, mask=mask)
+    t2 = time.perf_counter()
+    print(f"Planning grid: {mask.shape[1]}x{mask.shape[0]} at {res}m | "
+          f"inflate {1000 * (t1 - t0):.1f} ms | search {1000 * (t2 - t1):.1f} ms")
+
+    if not path:
+        print(f"ERROR: No path from {start} to {goal}")
+        return
+    raw = len(path)
+    path = process_path(path, mask, (grid.x_min, grid.y_min), res, start=start)
+    t3 = time.perf_counter()
+    print(f"Post-processing: {raw} -> {len(path)} points in {1000 * (t3 - t2):.1f} ms")
+    print(f"Path: {len(path)} waypoints")
+    for i, (x, y) in enumerate(path, 1):
+        print(f"  {i}. ({x:.2f}, {y:.2f})")
+
+    port = WAYPOINT_PORT + robot_id
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((HOST, port))
+        print(f"Connected to controller at {HOST}:{port}")
+    except Exception as e:
+        print(f"ERROR: Could not connect to controller: {e}")
+        print(f"Make sure Webots is running with waypoint_controller")
+        return
+
+    sock_file = sock.makefile('r')
+    try:
+        send_path_command(sock, path)
+        print("Path sent — waiting for REACHED...")
+        line = sock_file.readline()
+        reached = parse_reached_ack(line) if line else None
+        if reached:
+            print(f"✓ Goal reached at ({reached[0]:.2f}, {reached[1]:.2f})")
+        else:
+            print(f"WARNING: Unexpected response: {line.strip() if line else 'connection closed'}")
+    except Exception as e:
+        print(f"ERROR: {e}")
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Path post-processing: line-of-sight shortcutting, arc smoothing and resampling.
+
+Grid searches return either a dense staircase of cells or sparse jump points.
+Neither suits the pure-pursuit follower in waypoint_controller, which aims
+LOOKAHEAD_DISTANCE ahead and advances within WAYPOINT_SWITCH_DIST. This module
+turns such a path into a few evenly spaced points on straight runs joined by
+arcs of up to TURN_RADIUS, tighter (or a sharp corner) where segments are
+short or clearance is tight. Every stage works on whole numpy arrays, and the
+output is re-checked against the same inflated mask the planner used.
+
+    mask, res = prepare_mask(grid)
+    path = plan_path(grid, start, goal, resolution=res, mask=mask)
+    path = process_path(path, mask, (grid.x_min, grid.y_min), res, start=start)
+"""
+
+import numpy as np
+
+TURN_RADIUS = 0.40    # meters — tightest arc a Pioneer follows cleanly at path speed
+SPACING = 1.00        # meters — longest gap between output points on straight runs
+ARC_STEP = 0.25       # meters — chord length along fillets (sagitta < 2 cm at TURN_RADIUS)
+MIN_TANGENT = 0.05    # meters — fillets shorter than this are not worth two extra points
+FILLET_SHRINK = 4     # halve a colliding fillet radius this many times before dropping it
+
+
+# ── Collision checks ──────────────────────────────────────────────────────────
+
+def _crossings(g0, g1, seg):
+    """Parameters t in (0, 1] where segments g0 -> g1 (grid units, one axis) cross a cell boundary."""
+    c0 = np.floor(g0)
+    c1 = np.floor(g1)
+    counts = np.abs(c1 - c0).astype(np.int64)
+    idx = np.repeat(np.arange(len(g0)), counts)
+    k = np.arange(counts.sum()) - (np.cumsum(counts) - counts)[idx] + 1
+    forward = c1[idx] > c0[idx]
+    line = np.where(forward, c0[idx] + k, c0[idx] - k + 1)
+    return seg[idx], (line - g0[idx]) / (g1[idx] - g0[idx])
+
+
+def _traverse(a, b, origin, res):
+    """Grid (row, col) of every cell the segments a[k] -> b[k] pass through. Returns (rows, cols, segment)."""
+    ga = (a - origin) / res
+    gb = (b - origin) / res
+    n = len(a)
+    seg = np.arange(n)
+    sx, tx = _crossings(ga[:, 0], gb[:, 0], seg)
+    sy, ty = _crossings(ga[:, 1], gb[:, 1], seg)
+    all_seg = np.concatenate([seg, seg, sx, sy])
+    all_t = np.concatenate([np.zeros(n), np.ones(n), tx, ty])
+    order = np.lexsort((all_t, all_seg))
+    all_seg = all_seg[order]
+    all_t = all_t[order]
+    # One sample midway between consecutive crossings lies strictly inside each visited cell
+    same = all_seg[1:] == all_seg[:-1]
+    s_mid = all_seg[1:][same]
+    t_mid = 0.5 * (all_t[1:] + all_t[:-1])[same]
+    pts = ga[s_mid] + (gb - ga)[s_mid] * t_mid[:, None]
+    return np.floor(pts[:, 1]).astype(np.int64), np.floor(pts[:, 0]).astype(np.int64), s_mid
+
+
+def _blocked_cells(mask, r, c):
+    """Boolean per cell: True if blocked or off the map."""
+    rows, cols = mask.shape
+    inside = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+    out = ~inside
+    out[inside] = mask[r[inside], c[inside]]
+    return out
+
+
+def segments_clear(mask, origin, res, a, b):
+    """Boolean per segment a[k] -> b[k] (world (N, 2) arrays): True if every cell it touches is free."""
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    if len(a) == 0:
+        return np.zeros(0, dtype=bool)
+    r, c, seg = _traverse(a, b, np.asarray(origin, dtype=float), res)
+    hits = np.bincount(seg, weights=_blocked_cells(mask, r, c), minlength=len(a))
+    return hits == 0
+
+
+def is_collision_free(mask, origin, res, points):
+    """True if the polyline through points stays on free cells."""
+    pts = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(pts) < 2:
+        pts = np.vstack([pts, pts])
+    return bool(segments_clear(mask, origin, res, pts[:-1], pts[1:]).all())
+
+
+# ── Stages ────────────────────────────────────────────────────────────────────
+
+def shortcut(mask, origin, res, points):
+    """Greedy line-of-sight pruning: from each kept point, jump to the farthest point it can see."""
+    pts = np.asarray(points, dtype=float).reshape(-1, 2)
+    n = len(pts)
+    if n <= 2:
+        return pts
+    keep = [0]
+    i = 0
+    while i < n - 1:
+        candidates = np.arange(i + 1, n)
+        clear = segments_clear(mask, origin, res, np.repeat(pts[i:i + 1], len(candidates), axis=0),
+                               pts[candidates])
+        visible = candidates[clear]
+        i = int(visible[-1]) if len(visible) else i + 1
+        keep.append(i)
+    return pts[keep]
+
+
+def _fillets(pts, radius):
+    """Replace each interior corner with a circular arc. radius is a per-corner array.
+
+    Returns (corners, K, 2) arc points; short arcs are padded by repeating their last point.
+    """
+    p0, p1, p2 = pts[:-2], pts[1:-1], pts[2:]
+    d1 = p1 - p0
+    d2 = p2 - p1
+    l1 = np.hypot(*d1.T)
+    l2 = np.hypot(*d2.T)
+    u1 = d1 / l1[:, None]
+    u2 = d2 / l2[:, None]
+    cross = u1[:, 0] * u2[:, 1] - u1[:, 1] * u2[:, 0]
+    turn = np.arctan2(cross, np.einsum('ij,ij->i', u1, u2))   # signed heading change
+    half_tan = np.tan(np.abs(turn) / 2.0)
+
+    # Tangent length R*tan(turn/2), capped so neighbouring fillets never overlap
+    tangent = np.minimum(radius * half_tan, 0.5 * np.minimum(l1, l2))
+    tangent[tangent < MIN_TANGENT] = 0.0   # near-straight corners stay as one point
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_eff = np.where(half_tan > 1e-9, tangent / half_tan, 0.0)
+    entry = p1 - u1 * tangent[:, None]
+    side = np.sign(cross)[:, None]
+    normal = np.stack([-u1[:, 1], u1[:, 0]], axis=1) * side
+    centre = entry + normal * r_eff[:, None]
+
+    # Chords of at most ARC_STEP; every arc gets the same column count for broadcasting
+    n = np.maximum(2, np.ceil(np.abs(turn) * r_eff / ARC_STEP).astype(np.int64) + 1)
+    f = np.minimum(np.arange(n.max())[None, :] / (n[:, None] - 1), 1.0)
+    start_angle = np.arctan2(entry[:, 1] - centre[:, 1], entry[:, 0] - centre[:, 0])
+    ang = start_angle[:, None] + turn[:, None] * f
+    arcs = centre[:, None, :] + r_eff[:, None, None] * np.stack([np.cos(ang), np.sin(ang)], axis=2)
+    # Straight corners (r_eff == 0) collapse to the corner point itself
+    return np.where((r_eff > 0)[:, None, None], arcs, p1[:, None, :])
+
+
+def smooth(mask, origin, res, points, turn_radius=TURN_RADIUS):
+    """Fillet every corner with an arc of up to turn_radius, shrinking arcs that would collide."""
+    pts = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(pts) <= 2 or turn_radius <= 0:
+        return pts
+    radius = np.full(len(pts) - 2, float(turn_radius))
+    m = len(radius)
+    for attempt in range(FILLET_SHRINK + 1):
+        arcs = _fillets(pts, radius)
+        k = arcs.shape[1]
+        out = np.vstack([pts[:1], arcs.reshape(-1, 2), pts[-1:]])
+        # Segment j runs out[j] -> out[j+1]; map failures back to the corners they belong to.
+        # Connectors between arcs blame both neighbours, the arcs themselves only their own corner.
+        pos = np.nonzero(~segments_clear(mask, origin, res, out[:-1], out[1:]))[0] - 1
+        if len(pos) == 0:
+            break
+        corner = pos // k
+        connector = pos % k == k - 1
+        blamed = np.concatenate([corner, corner[connector] + 1])
+        bad = np.zeros(m, dtype=bool)
+        bad[blamed[(blamed >= 0) & (blamed < m)]] = True
+        radius[bad] = 0.0 if attempt == FILLET_SHRINK - 1 else radius[bad] * 0.5
+    # Drop the padding repeats and the shared point where two capped fillets meet
+    keep = np.concatenate([[True], np.hypot(*np.diff(out, axis=0).T) > 1e-6])
+    return out[keep]
+
+
+def resample(points, spacing=SPACING):
+    """Split every segment into equal pieces no longer than spacing. All vertices are kept,
+    so the result traces exactly the same polyline (and stays as collision-free as it)."""
+    pts = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(pts) < 2:
+        return pts
+    a, b = pts[:-1], pts[1:]
+    counts = np.maximum(1, np.ceil(np.hypot(*(b - a).T) / spacing).astype(np.int64))
+    seg = np.repeat(np.arange(len(a)), counts)
+    frac = (np.arange(counts.sum()) - (np.cumsum(counts) - counts)[seg]) / counts[seg]
+    return np.vstack([a[seg] + (b - a)[seg] * frac[:, None], pts[-1:]])
+
+
+def process_path(path, mask, origin, res, start=None, spacing=SPACING, turn_radius=TURN_RADIUS):
+    """Shortcut, smooth and resample a planner path. Returns [(x, y), ...] excluding the start.
+
+    path is a list of world points (as from plan_path, which omits the start;
+    pass start to include it in shortcutting — it is then left out of the result). mask/origin/res describe the
+    inflated planning grid. Falls back to the unsmoothed shortcut path if the
+    smoothed polyline touches a blocked cell (e.g. a start inside the inflation).
+    """
+    pts = np.asarray(path, dtype=float).reshape(-1, 2)
+    skip = 0
+    if start is not None:
+        pts = np.vstack([np.asarray(start, dtype=float).reshape(1, 2), pts])
+        skip = 1
+    if len(pts) < 2:
+        return [(float(x), float(y)) for x, y in pts[skip:]]
+    # Drop repeated points — they have no direction and break the fillet maths
+    keep = np.concatenate([[True], np.hypot(*np.diff(pts, axis=0).T) > 1e-9])
+    pts = pts[keep]
+    if len(pts) < 2:
+        return [(float(x), float(y)) for x, y in pts[skip:]]
+
+    short = shortcut(mask, origin, res, pts)
+    out = resample(smooth(mask, origin, res, short, turn_radius), spacing)
+    if not is_collision_free(mask, origin, res, out):
+        out = resample(short, spacing)
+    return [(float(x), float(y)) for x, y in out[skip:]]
@@ -0,0 +1,254 @@
+"""POI routes: all-pairs travel costs and paths between a world's points of interest, cached on disk.
+
+Usage:
+    python planners/poi_routes.py <world> <map_prefix> [<from> <to> [robot_id]] [--rebuild]
+
+Points of interest are named in the points_of_interest block of
+world_configs/<world>.json:
+    "points_of_interest": {"dock_1": [0.0, -2.0], "shelf_3": [0.0, -9.0]}
+
+The table is built with one distance_field per point of interest; every
+route into that point is read back by descending its field, then shortcut
+and smoothed by process_path. The result is stored in
+cache/poi_routes_<world>_<digest>.npz. The digest covers the world .wbt,
+its world_configs entry and the map snapshot, so editing any of them
+rebuilds the table on next use. Without <from> <to> the cost table is
+printed; with a robot_id the route is sent as a PATH.
+"""
+
+import sys
+import os
+import json
+import time
+import hashlib
+import socket
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.protocol import (
+    WAYPOINT_PORT,
+    send_path_command,
+    parse_reached_ack
+)
+from utils.occupancy_grid import OccupancyGrid
+from utils.cache import file_digest, load_arrays, save_arrays
+from planners.grid_planner import SQRT2, prepare_mask, distance_field, nearest_free
+from planners.path_processing import process_path
+
+HOST = 'localhost'
+
+ROUTE_RESOLUTION = 0.10  # meters — planning grid for the table (never finer than the map)
+BUILD_VERSION = 1        # bump when the build algorithm changes
+
+# (d_row, d_col, cost) for the 8 grid moves
+_MOVES = [(dr, dc, SQRT2 if dr and dc else 1.0)
+          for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+
+
+def load_points(cfg):
+    """{name: (x, y)} from a world config's points_of_interest block (empty if it has none)."""
+    return {name: (float(p[0]), float(p[1]))
+            for name, p in cfg.get('points_of_interest', {}).items()}
+
+
+def _descend(field, blocked, row, col):
+    """Cells from (row, col) down field to its source (cost 0), following the same moves as distance_field."""
+    rows, cols = blocked.shape
+    cells = [(row, col)]
+    while field[row, col] > 0.0:
+        best = None
+        for dr, dc, cost in _MOVES:
+            r, c = row + dr, col + dc
+            if not (0 <= r < rows and 0 <= c < cols) or blocked[r, c]:
+                continue
+            if dr and dc and (blocked[row + dr, col] or blocked[row, col + dc]):
+                continue
+            score = field[r, c] + cost
+            if best is None or score < best[0]:
+                best = (score, r, c)
+        row, col = best[1], best[2]
+        cells.append((row, col))
+    return cells
+
+
+class PoiRoutes:
+    """Cost matrix (meters, inf if unreachable) and waypoint lists for every ordered pair of points."""
+
+    def __init__(self, names, points, costs, indptr, waypoints):
+        self.names = list(names)
+        self.points = points        # (N, 2)
+        self.costs = costs          # (N, N)
+        self.indptr = indptr        # (N * N + 1,) into waypoints, pair (i, j) at i * N + j
+        self.waypoints = waypoints  # (K, 2)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def build(cls, grid, points, resolution=ROUTE_RESOLUTION):
+        names = list(points)
+        n = len(names)
+        mask, res = prepare_mask(grid, resolution=max(resolution, grid.resolution))
+        origin = (grid.x_min, grid.y_min)
+        rows, cols = mask.shape
+        cells = []
+        for name in names:
+            x, y = points[name]
+            col = min(cols - 1, max(0, int((x - origin[0]) / res)))
+            row = min(rows - 1, max(0, int((y - origin[1]) / res)))
+            cells.append(nearest_free(mask, row, col))
+
+        costs = np.full((n, n), np.inf)
+        routes = [[] for _ in range(n * n)]
+        for j in range(n):
+            if cells[j] is None:
+                continue
+            # One field per destination gives the routes from every other point into it
+            field = distance_field(mask, [cells[j]])
+            for i in range(n):
+                if i == j or cells[i] is None or not np.isfinite(field[cells[i]]):
+                    continue
+                centres = [(origin[0] + (c + 0.5) * res, origin[1] + (r + 0.5) * res)
+                           for r, c in _descend(field, mask, *cells[i])]
+                path = process_path(centres, mask, origin, res, start=points[names[i]])
+                gx, gy = points[names[j]]
+                if not path or np.hypot(path[-1][0] - gx, path[-1][1] - gy) > 1e-6:
+                    # Points inside the inflated margin end with a short final leg
+                    path.append((gx, gy))
+                routes[i * n + j] = path
+                # Cost is the length of the route actually driven, not the grid cost
+                legs = np.diff(np.vstack([points[names[i]], path]), axis=0)
+                costs[i, j] = float(np.hypot(legs[:, 0], legs[:, 1]).sum())
+            costs[j, j] = 0.0
+
+        indptr = np.zeros(n * n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(r) for r in routes])
+        waypoints = np.array([p for r in routes for p in r], dtype=np.float64).reshape(-1, 2)
+        xy = np.array([points[name] for name in names], dtype=np.float64).reshape(-1, 2)
+        return cls(names, xy, costs, indptr, waypoints)
+
+    def save(self, name):
+        save_arrays(name, names=np.array(self.names, dtype=str), points=self.points,
+                    costs=self.costs, indptr=self.indptr, waypoints=self.waypoints)
+
+    @classmethod
+    def load(cls, name):
+        data = load_arrays(name)
+        if data is None:
+            return None
+        return cls(data['names'].tolist(), data['points'], data['costs'],
+                   data['indptr'], data['waypoints'])
+
+    def cost(self, a, b):
+        """Travel cost in meters from point a to point b (inf if unreachable)."""
+        return float(self.costs[self.index[a], self.index[b]])
+
+    def path(self, a, b):
+        """[(x, y), ...] from a to b excluding a's own position; None if unreachable."""
+        i, j = self.index[a], self.index[b]
+        if not np.isfinite(self.costs[i, j]):
+            return None
+        k = i * len(self.names) + j
+        return [(float(x), float(y)) for x, y in self.waypoints[self.indptr[k]:self.indptr[k + 1]]]
+
+
+def poi_cache_name(world, cfg_path, map_prefix):
+    """Cache file name keyed by the world file, its config, the map and the build parameters."""
+    with open(cfg_path) as f:
+        cfg = json.load(f)
+    wbt = os.path.join(project_root, 'worlds', f"{cfg['name']}.wbt")
+    params = f"{BUILD_VERSION}:{ROUTE_RESOLUTION}"
+    digest = hashlib.sha1((file_digest(wbt, cfg_path, f"{map_prefix}.npy", f"{map_prefix}.json")
+                           + params).encode()).hexdigest()
+    return f"poi_routes_{world}_{digest[:12]}.npz"
+
+
+def load_or_build(world, map_prefix, rebuild=False):
+    """PoiRoutes for world/map_prefix from the cache, building and caching the table on a miss."""
+    if map_prefix.endswith('.npy') or map_prefix.endswith('.json'):
+        map_prefix = map_prefix.rsplit('.', 1)[0]
+    cfg_path = os.path.join(project_root, 'world_configs', f'{world}.json')
+    name = poi_cache_name(world, cfg_path, map_prefix)
+    t0 = time.perf_counter()
+    routes = None if rebuild else PoiRoutes.load(name)
+    if routes is not None:
+        print(f"POI routes loaded from cache/{name} in {1000 * (time.perf_counter() - t0):.1f} ms")
+        return routes
+    with open(cfg_path) as f:
+        points = load_points(json.load(f))
+    routes = PoiRoutes.build(OccupancyGrid.load_snapshot(map_prefix), points)
+    routes.save(name)
+    print(f"POI routes built in {1000 * (time.perf_counter() - t0):.0f} ms and cached as cache/{name}")
+    return routes
+
+
+def main():
+    args = sys.argv[1:]
+    rebuild = '--rebuild' in args
+    args = [a for a in args if a != '--rebuild']
+    if len(args) not in (2, 4, 5):
+        print(__doc__)
+        sys.exit(1)
+
+    world = args[0]
+    cfg_path = os.path.join(project_root, 'world_configs', f'{world}.json')
+    try:
+        with open(cfg_path) as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        print(f"ERROR: No config found for world '{world}' at {cfg_path}")
+        sys.exit(1)
+    if not load_points(cfg):
+        print(f"ERROR: {cfg_path} has no points_of_interest")
+        sys.exit(1)
+
+    print(f"=== POI Routes [{cfg['name']}] ===")
+    routes = load_or_build(world, args[1], rebuild)
+
+    if len(args) == 2:
+        width = max(len(n) for n in routes.names)
+        print(" " * width + "".join(f"{n:>{width + 2}}" for n in routes.names))
+        for a in routes.names:
+            print(f"{a:<{width}}" + "".join(f"{routes.cost(a, b):>{width + 2}.1f}" for b in routes.names))
+        return
+
+    a, b = args[2], args[3]
+    for name in (a, b):
+        if name not in routes.index:
+            print(f"ERROR: Unknown point '{name}' (known: {', '.join(routes.names)})")
+            sys.exit(1)
+    path = routes.path(a, b)
+    if path is None:
+        print(f"ERROR: No route from {a} to {b}")
+        return
+    print(f"{a} -> {b}: {routes.cost(a, b):.1f} m, {len(path)} waypoints")
+    for i, (x, y) in enumerate(path, 1):
+        print(f"  {i}. ({x:.2f}, {y:.2f})")
+    if len(args) < 5:
+        return
+
+    port = WAYPOINT_PORT + int(args[4])
+    try:
+        sock = socket.create_connection((HOST, port))
+        print(f"Connected to controller at {HOST}:{port}")
+    except OSError as e:
+        print(f"ERROR: Could not connect to controller: {e}")
+        return
+    sock_file = sock.makefile('r')
+    try:
+        send_path_command(sock, path)
+        print("Path sent — waiting for REACHED...")
+        line = sock_file.readline()
+        reached = parse_reached_ack(line) if line else None
+        if reached:
+            print(f"✓ Reached {b} at ({reached[0]:.2f}, {reached[1]:.2f})")
+        else:
+            print(f"WARNING: Unexpected response: {line.strip() if line else 'connection closed'}")
+    except OSError as e:
+        print(f"ERROR: {e}")
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Time-expanded cell reservation table for multi-robot planning.
+
+Cells are flat indices into a planning grid and time is counted in steps of
+step_duration seconds since the table was created. Each claim covers a
+(cell, time window) of +/- slack steps, so robots that run a little ahead of
+or behind their schedule still keep clear of each other. Only claimed slots
+are stored (hashed by t * num_cells + cell), so memory grows with the total
+length of the planned paths, not with the number of cells times the horizon.
+"""
+
+import time
+
+
+class ReservationTable:
+
+    def __init__(self, num_cells, step_duration=1.0, slack=1):
+        self.num_cells = num_cells
+        self.step_duration = step_duration
+        self.slack = slack
+        self._slots = {}      # t * num_cells + cell -> robot_id
+        self._owned = {}      # robot_id -> set of slot keys
+        self._last = {}       # cell -> {robot_id: latest claimed t}
+        self._parked = {}     # cell -> (robot_id, from_t)
+        self._parking = {}    # robot_id -> cell
+        self._epoch = time.monotonic()
+
+    def now(self):
+        """Current time step."""
+        return int((time.monotonic() - self._epoch) / self.step_duration)
+
+    def __len__(self):
+        return len(self._slots)
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+    def owner(self, cell, t):
+        robot = self._slots.get(t * self.num_cells + cell)
+        if robot is not None:
+            return robot
+        parked = self._parked.get(cell)
+        if parked is not None and t >= parked[1]:
+            return parked[0]
+        return None
+
+    def is_free(self, cell, t, robot_id):
+        owner = self.owner(cell, t)
+        return owner is None or owner == robot_id
+
+    def can_move(self, src, dst, t, robot_id):
+        """Moving src -> dst between steps t and t+1: dst free at t+1 and nobody swapping dst -> src."""
+        if not self.is_free(dst, t + 1, robot_id):
+            return False
+        other = self.owner(dst, t)
+        if other is not None and other != robot_id and self.owner(src, t + 1) == other:
+            return False
+        return True
+
+    def free_after(self, cell, t, robot_id):
+        """True if no other robot claims cell at any step after t (safe to stop there)."""
+        parked = self._parked.get(cell)
+        if parked is not None and parked[0] != robot_id:
+            return False
+        for robot, last in self._last.get(cell, {}).items():
+            if robot != robot_id and last > t:
+                return False
+        return True
+
+    # ── Claims ────────────────────────────────────────────────────────────────
+    def reserve_path(self, robot_id, cells, start_t, park=True):
+        """Claim cells[k] at step start_t + k (with slack), then park on the last cell."""
+        owned = self._owned.setdefault(robot_id, set())
+        n = self.num_cells
+        slots = self._slots
+        for k, cell in enumerate(cells):
+            t = start_t + k
+            for tt in range(t - self.slack, t + self.slack + 1):
+                key = tt * n + cell
+                if slots.setdefault(key, robot_id) == robot_id:
+                    owned.add(key)
+            last = self._last.setdefault(cell, {})
+            if last.get(robot_id, -1) < t + self.slack:
+                last[robot_id] = t + self.slack
+        if park and cells:
+            self.park(robot_id, cells[-1], start_t + len(cells) - 1)
+
+    def park(self, robot_id, cell, from_t):
+        """Hold cell for robot_id from from_t until released (robot standing at its goal)."""
+        self.unpark(robot_id)
+        self._parked[cell] = (robot_id, from_t)
+        self._parking[robot_id] = cell
+
+    def unpark(self, robot_id):
+        cell = self._parking.pop(robot_id, None)
+        if cell is not None and self._parked.get(cell, (None,))[0] == robot_id:
+            del self._parked[cell]
+
+    def release(self, robot_id, until_t=None):
+        """Drop robot_id's claims at steps <= until_t (all of them if None). Parking is kept."""
+        owned = self._owned.get(robot_id)
+        if not owned:
+            return 0
+        n = self.num_cells
+        if until_t is None:
+            dropped = owned
+            self._owned[robot_id] = set()
+        else:
+            limit = (until_t + 1) * n
+            dropped = {k for k in owned if k < limit}
+            owned -= dropped
+        for key in dropped:
+            if self._slots.get(key) == robot_id:
+                del self._slots[key]
+            cell = key % n
+            last = self._last.get(cell)
+            if last is not None and robot_id in last and (until_t is None or last[robot_id] <= until_t):
+                del last[robot_id]
+                if not last:
+                    del self._last[cell]
+        return len(dropped)
+
+    def release_robot(self, robot_id):
+        """Forget everything about robot_id (disconnects)."""
+        self.release(robot_id)
+        self.unpark(robot_id)
+
+    def prune(self, before_t):
+        """Drop every claim older than before_t to keep long sessions bounded."""
+        limit = before_t * self.num_cells
+        for robot_id, owned in self._owned.items():
+            old = {k for k in owned if k < limit}
+            if old:
+                owned -= old
+                for key in old:
+                    self._slots.pop(key, None)
@@ -0,0 +1,355 @@
+"""Roadmap planner: a probabilistic roadmap per world, cached on disk for instant startup.
+
+Usage:
+    python planners/roadmap.py <world> <map_prefix> <start_x> <start_y> <goal_x> <goal_y> [robot_id] [--rebuild]
+
+The roadmap is built once from a prior map snapshot and stored in
+cache/roadmap_<world>_<digest>.npz. The digest covers the world .wbt, its
+world_configs entry, the snapshot and the build parameters, so editing any
+of them triggers a rebuild on next use. A cached roadmap loads in a few
+milliseconds. Queries attach start and goal to nearby nodes through a
+bucket-grid spatial index, search the graph, and shortcut the result.
+With a robot_id the path is sent as a PATH and the planner waits for REACHED.
+"""
+
+import sys
+import os
+import json
+import time
+import heapq
+import hashlib
+import socket
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.protocol import (
+    WAYPOINT_PORT,
+    send_path_command,
+    parse_reached_ack
+)
+from utils.occupancy_grid import OccupancyGrid
+from utils.cache import file_digest, load_arrays, save_arrays
+from planners.grid_planner import prepare_mask, nearest_free
+from planners.path_processing import segments_clear, process_path
+
+HOST = 'localhost'
+
+SAMPLE_SPACING = 0.6    # meters — one jittered sample per block of this size
+SAMPLE_TRIES = 4        # attempts per block to land on free space
+CONNECT_RADIUS = 1.5    # meters — candidate edge length
+MAX_NEIGHBOURS = 10     # nearest candidates tried per node
+ATTACH_CANDIDATES = 8   # nodes tried when connecting a query point
+SEED = 0                # fixed so rebuilding the same inputs gives the same roadmap
+BUILD_VERSION = 1       # bump when the build algorithm changes
+
+
+class SpatialIndex:
+    """Uniform bucket grid over 2D points; nearest and radius queries touch only nearby buckets."""
+
+    def __init__(self, points, bucket_size):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.size = float(bucket_size)
+        self.buckets = {}
+        keys = np.floor(self.points / self.size).astype(np.int64)
+        for i, (bx, by) in enumerate(keys.tolist()):
+            self.buckets.setdefault((bx, by), []).append(i)
+        if len(keys):
+            self.lo = keys.min(axis=0)
+            self.hi = keys.max(axis=0)
+
+    def within(self, x, y, radius):
+        """Ids of points within radius of (x, y), nearest first."""
+        if not self.buckets:
+            return np.zeros(0, dtype=np.int64)
+        s = self.size
+        ids = []
+        for bx in range(int(np.floor((x - radius) / s)), int(np.floor((x + radius) / s)) + 1):
+            for by in range(int(np.floor((y - radius) / s)), int(np.floor((y + radius) / s)) + 1):
+                ids.extend(self.buckets.get((bx, by), ()))
+        ids = np.array(ids, dtype=np.int64)
+        if ids.size == 0:
+            return ids
+        d = np.hypot(self.points[ids, 0] - x, self.points[ids, 1] - y)
+        keep = d <= radius
+        return ids[keep][np.argsort(d[keep], kind='stable')]
+
+    def nearest(self, x, y, k=1):
+        """Ids of the k nearest points, nearest first (fewer if the index is smaller)."""
+        if not self.buckets:
+            return np.zeros(0, dtype=np.int64)
+        s = self.size
+        cx = int(np.floor(x / s))
+        cy = int(np.floor(y / s))
+        # Rings beyond this cover every bucket
+        max_ring = int(max(abs(cx - self.lo[0]), abs(cx - self.hi[0]),
+                           abs(cy - self.lo[1]), abs(cy - self.hi[1]))) + 1
+        ids = []
+        for ring in range(max_ring + 1):
+            for bx in range(cx - ring, cx + ring + 1):
+                # Full column on the ring's left/right edges, top and bottom cells in between
+                bys = range(cy - ring, cy + ring + 1) if abs(bx - cx) == ring else (cy - ring, cy + ring)
+                for by in bys:
+                    ids.extend(self.buckets.get((bx, by), ()))
+            # Anything outside ring r is at least r * s away
+            if len(ids) >= k:
+                d = np.hypot(self.points[ids, 0] - x, self.points[ids, 1] - y)
+                if np.partition(d, k - 1)[k - 1] <= ring * s:
+                    break
+        ids = np.array(ids, dtype=np.int64)
+        d = np.hypot(self.points[ids, 0] - x, self.points[ids, 1] - y)
+        return ids[np.argsort(d, kind='stable')[:k]]
+
+
+class Roadmap:
+    """Nodes (N, 2) in world meters and an undirected graph stored as CSR arrays."""
+
+    def __init__(self, nodes, indptr, indices, weights, mask, origin, res):
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.mask = mask
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.res = float(res)
+        self.index = SpatialIndex(nodes, CONNECT_RADIUS)
+
+    @property
+    def num_edges(self):
+        return len(self.indices) // 2
+
+    # ── Build ─────────────────────────────────────────────────────────────────
+    @classmethod
+    def build(cls, grid, rng=None):
+        rng = rng or np.random.default_rng(SEED)
+        mask, res = prepare_mask(grid)
+        origin = (grid.x_min, grid.y_min)
+        rows, cols = mask.shape
+
+        # Jittered block samples; each block keeps its first try that lands on free space
+        nx = int(np.ceil(cols * res / SAMPLE_SPACING))
+        ny = int(np.ceil(rows * res / SAMPLE_SPACING))
+        bx, by = np.meshgrid(np.arange(nx), np.arange(ny))
+        bx = bx.ravel()
+        by = by.ravel()
+        found = np.zeros(bx.size, dtype=bool)
+        pts = np.zeros((bx.size, 2))
+        for _ in range(SAMPLE_TRIES):
+            jitter = rng.random((bx.size, 2))
+            cand = np.stack([origin[0] + (bx + jitter[:, 0]) * SAMPLE_SPACING,
+                             origin[1] + (by + jitter[:, 1]) * SAMPLE_SPACING], axis=1)
+            c = np.minimum((cand[:, 0] - origin[0]) / res, cols - 1).astype(np.int64)
+            r = np.minimum((cand[:, 1] - origin[1]) / res, rows - 1).astype(np.int64)
+            ok = ~found & ~mask[r, c]
+            pts[ok] = cand[ok]
+            found |= ok
+        nodes = pts[found]
+
+        # Candidate edges to nearby nodes, then one vectorized collision check for all of them
+        index = SpatialIndex(nodes, CONNECT_RADIUS)
+        pairs = set()
+        for i, (x, y) in enumerate(nodes):
+            for j in index.within(x, y, CONNECT_RADIUS)[1:MAX_NEIGHBOURS + 1]:
+                pairs.add((min(i, int(j)), max(i, int(j))))
+        pairs = np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+        clear = segments_clear(mask, origin, res, nodes[pairs[:, 0]], nodes[pairs[:, 1]])
+        edges = pairs[clear]
+
+        # Both directions, grouped by source node
+        src = np.concatenate([edges[:, 0], edges[:, 1]])
+        dst = np.concatenate([edges[:, 1], edges[:, 0]])
+        order = np.argsort(src, kind='stable')
+        src = src[order]
+        dst = dst[order]
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.add.at(indptr, src + 1, 1)
+        indptr = np.cumsum(indptr)
+        weights = np.hypot(*(nodes[dst] - nodes[src]).T)
+        return cls(nodes, indptr, dst, weights, mask, origin, res)
+
+    # ── Serialization ─────────────────────────────────────────────────────────
+    def save(self, name):
+        save_arrays(name, nodes=self.nodes, indptr=self.indptr, indices=self.indices,
+                    weights=self.weights, mask=np.packbits(self.mask, axis=None),
+                    shape=np.array(self.mask.shape), frame=np.array([*self.origin, self.res]))
+
+    @classmethod
+    def load(cls, name):
+        data = load_arrays(name)
+        if data is None:
+            return None
+        shape = tuple(int(v) for v in data['shape'])
+        mask = np.unpackbits(data['mask'], count=shape[0] * shape[1]).astype(bool).reshape(shape)
+        x0, y0, res = data['frame']
+        return cls(data['nodes'], data['indptr'], data['indices'], data['weights'], mask, (x0, y0), res)
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+    def snap(self, x, y):
+        """(x, y), or the centre of the nearest free cell if it lies on an (inflated) obstacle."""
+        rows, cols = self.mask.shape
+        col = min(cols - 1, max(0, int((x - self.origin[0]) / self.res)))
+        row = min(rows - 1, max(0, int((y - self.origin[1]) / self.res)))
+        if not self.mask[row, col]:
+            return float(x), float(y)
+        free = nearest_free(self.mask, row, col)
+        if free is None:
+            return None
+        return (self.origin[0] + (free[1] + 0.5) * self.res, self.origin[1] + (free[0] + 0.5) * self.res)
+
+    def attach(self, x, y):
+        """Nearby nodes visible from (x, y) with their distances, nearest first."""
+        ids = self.index.nearest(x, y, ATTACH_CANDIDATES)
+        if ids.size == 0:
+            return ids, np.zeros(0)
+        here = np.repeat([[x, y]], len(ids), axis=0)
+        ids = ids[segments_clear(self.mask, self.origin, self.res, here, self.nodes[ids])]
+        return ids, np.hypot(self.nodes[ids, 0] - x, self.nodes[ids, 1] - y)
+
+    def query(self, start_xy, goal_xy):
+        """Shortest roadmap route start -> goal: [(x, y), ...] excluding the start, or None.
+
+        Points inside the obstacle inflation are first moved to the nearest free cell.
+        """
+        start_xy = self.snap(*start_xy)
+        goal_xy = self.snap(*goal_xy)
+        if start_xy is None or goal_xy is None:
+            return None
+        sx, sy = start_xy
+        gx, gy = goal_xy
+        if segments_clear(self.mask, self.origin, self.res, [start_xy], [goal_xy])[0]:
+            return [(float(gx), float(gy))]
+        s_ids, s_d = self.attach(sx, sy)
+        g_ids, g_d = self.attach(gx, gy)
+        if s_ids.size == 0 or g_ids.size == 0:
+            return None
+
+        # A* over the CSR graph; the query points join as virtual edges
+        nodes = self.nodes
+        indptr = self.indptr
+        indices = self.indices
+        weights = self.weights
+        exit_cost = dict(zip(g_ids.tolist(), g_d.tolist()))
+        dist = {}
+        parent = {}
+        heap = []
+        for i, d in zip(s_ids.tolist(), s_d.tolist()):
+            dist[i] = d
+            parent[i] = None
+            heapq.heappush(heap, (d + np.hypot(nodes[i, 0] - gx, nodes[i, 1] - gy), d, i))
+        best_end = None
+        best_total = float('inf')
+        while heap:
+            f, d, i = heapq.heappop(heap)
+            if f >= best_total:
+                break
+            if d > dist[i]:
+                continue
+            if i in exit_cost and d + exit_cost[i] < best_total:
+                best_total = d + exit_cost[i]
+                best_end = i
+            for k in range(indptr[i], indptr[i + 1]):
+                j = int(indices[k])
+                nd = d + weights[k]
+                if nd < dist.get(j, float('inf')):
+                    dist[j] = nd
+                    parent[j] = i
+                    heapq.heappush(heap, (nd + np.hypot(nodes[j, 0] - gx, nodes[j, 1] - gy), nd, j))
+        if best_end is None:
+            return None
+        route = []
+        i = best_end
+        while i is not None:
+            route.append((float(nodes[i, 0]), float(nodes[i, 1])))
+            i = parent[i]
+        route.reverse()
+        route.append((float(gx), float(gy)))
+        return route
+
+
+def roadmap_cache_name(world, cfg_path, map_prefix):
+    """Cache file name keyed by the world file, its config, the map and the build parameters."""
+    with open(cfg_path) as f:
+        cfg = json.load(f)
+    wbt = os.path.join(project_root, 'worlds', f"{cfg['name']}.wbt")
+    params = f"{BUILD_VERSION}:{SAMPLE_SPACING}:{SAMPLE_TRIES}:{CONNECT_RADIUS}:{MAX_NEIGHBOURS}:{SEED}"
+    digest = hashlib.sha1((file_digest(wbt, cfg_path, f"{map_prefix}.npy", f"{map_prefix}.json")
+                           + params).encode()).hexdigest()
+    return f"roadmap_{world}_{digest[:12]}.npz"
+
+
+def load_or_build(world, map_prefix, rebuild=False):
+    """Roadmap for world/map_prefix from the cache, building and caching it on a miss."""
+    if map_prefix.endswith('.npy') or map_prefix.endswith('.json'):
+        map_prefix = map_prefix.rsplit('.', 1)[0]
+    cfg_path = os.path.join(project_root, 'world_configs', f'{world}.json')
+    name = roadmap_cache_name(world, cfg_path, map_prefix)
+    t0 = time.perf_counter()
+    roadmap = None if rebuild else Roadmap.load(name)
+    if roadmap is not None:
+        print(f"Roadmap loaded from cache/{name} in {1000 * (time.perf_counter() - t0):.1f} ms")
+        return roadmap
+    grid = OccupancyGrid.load_snapshot(map_prefix)
+    roadmap = Roadmap.build(grid)
+    roadmap.save(name)
+    print(f"Roadmap built in {1000 * (time.perf_counter() - t0):.0f} ms and cached as cache/{name}")
+    return roadmap
+
+
+def main():
+    args = sys.argv[1:]
+    rebuild = '--rebuild' in args
+    args = [a for a in args if a != '--rebuild']
+    if len(args) < 6:
+        print(__doc__)
+        sys.exit(1)
+
+    world = args[0]
+    if not os.path.exists(os.path.join(project_root, 'world_configs', f'{world}.json')):
+        print(f"ERROR: No config found for world '{world}'")
+        sys.exit(1)
+    start = (float(args[2]), float(args[3]))
+    goal = (float(args[4]), float(args[5]))
+    robot_id = int(args[6]) if len(args) > 6 else None
+
+    print(f"=== Roadmap Planner ===")
+    roadmap = load_or_build(world, args[1], rebuild)
+    print(f"Roadmap: {len(roadmap.nodes)} nodes, {roadmap.num_edges} edges")
+
+    t0 = time.perf_counter()
+    route = roadmap.query(start, goal)
+    if route is None:
+        print(f"ERROR: No roadmap route from {start} to {goal}")
+        return
+    path = process_path(route, roadmap.mask, roadmap.origin, roadmap.res, start=start)
+    print(f"Query: {len(route)} roadmap points -> {len(path)} waypoints in {1000 * (time.perf_counter() - t0):.1f} ms")
+    for i, (x, y) in enumerate(path, 1):
+        print(f"  {i}. ({x:.2f}, {y:.2f})")
+    if robot_id is None:
+        return
+
+    port = WAYPOINT_PORT + robot_id
+    try:
+        sock = socket.create_connection((HOST, port))
+        print(f"Connected to controller at {HOST}:{port}")
+    except OSError as e:
+        print(f"ERROR: Could not connect to controller: {e}")
+        return
+    sock_file = sock.makefile('r')
+    try:
+        send_path_command(sock, path)
+        print("Path sent — waiting for REACHED...")
+        line = sock_file.readline()
+        reached = parse_reached_ack(line) if line else None
+        if reached:
+            print(f"✓ Goal reached at ({reached[0]:.2f}, {reached[1]:.2f})")
+        else:
+            print(f"WARNING: Unexpected response: {line.strip() if line else 'connection closed'}")
+    except OSError as e:
+        print(f"ERROR: {e}")
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
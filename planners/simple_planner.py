@@ -2,16 +2,18 @@
 
 import sys
 import os
+import time
 import socket
 
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
 from utils.protocol import (
-    WAYPOINT_PORT,
+    WAYPOINT_PORT, METRICS_PLANNER_PORT_BASE,
     send_waypoint_command,
     parse_reached_ack
 )
+from utils.metrics import make_metrics
 
 ROBOT_ID = 0  # 0 = YouBot, 1 = Pioneer
 HOST = 'localhost'
@@ -29,8 +31,16 @@ WAYPOINTS = [
 ]
 
 
+# Waypoint-to-REACHED buckets, in seconds
+REACH_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
 def main():
     port = WAYPOINT_PORT + ROBOT_ID
+    metrics = make_metrics('simple_planner', METRICS_PLANNER_PORT_BASE + ROBOT_ID, ROBOT_ID)
+    m_sent = metrics.counter('dal_waypoints_sent_total', 'Waypoints sent')
+    m_reached = metrics.counter('dal_waypoints_reached_total', 'REACHED acks received')
+    m_reach_time = metrics.histogram('dal_waypoint_seconds', 'Waypoint sent to REACHED', buckets=REACH_BUCKETS)
     print(f"=== Simple Planner ===")
     print(f"Connecting to controller at {HOST}:{port}...")
 
@@ -58,6 +68,8 @@ def main():
         # Send waypoint command
         try:
             send_waypoint_command(sock, x, y)
+            sent_at = time.monotonic()
+            m_sent.inc()
         except Exception as e:
             print(f"ERROR: Failed to send waypoint: {e}")
             break
@@ -73,6 +85,8 @@ def main():
             reached = parse_reached_ack(line)
             if reached:
                 rx, ry = reached
+                m_reached.inc()
+                m_reach_time.observe(time.monotonic() - sent_at)
                 print(f"  ✓ Robot reached ({rx:.2f}, {ry:.2f})")
             else:
                 print(f"  WARNING: Unexpected response: {line.strip()}")
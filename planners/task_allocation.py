@@ -0,0 +1,377 @@
+"""Task allocation: optimal robot -> task assignment from batched distance fields, re-solved as tasks arrive.
+
+Usage:
+    python planners/task_allocation.py <world> <map_prefix> <tasks.json>
+
+tasks.json is a list of pickup points; entries may be named:
+    [{"id": "pallet_7", "pos": [3.0, -5.0]}, [0.0, -9.0], ...]
+The file is re-read whenever it changes, so appending tasks while the
+planner runs feeds them into the next allocation.
+
+Each allocation computes one distance_field per robot on a coarse copy of
+the map (ALLOCATION_RESOLUTION) and reads every task's cost out of it, so a
+robot x task matrix costs one Dijkstra per robot however many tasks there
+are. The matrix is solved optimally with a rectangular Hungarian solver.
+Idle robots and robots still driving to a task take part in every round;
+a robot keeps its current task unless switching saves REASSIGN_MARGIN meters.
+Robot positions come from UDP :5555 (stop slam_viz first).
+"""
+
+import sys
+import os
+import json
+import time
+import socket
+import struct
+import selectors
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from utils.protocol import (
+    POSITION_PORT,
+    WAYPOINT_PORT,
+    unpack_position,
+    send_path_command,
+    send_waypoint_command,
+    parse_reached_ack
+)
+from utils.occupancy_grid import OccupancyGrid
+from planners.grid_planner import prepare_mask, distance_field, nearest_free, plan_path
+from planners.path_processing import process_path
+
+HOST = 'localhost'
+
+ALLOCATION_RESOLUTION = 0.25  # meters — coarse grid for cost fields and routes
+REASSIGN_MARGIN = 1.0         # meters a new assignment must save before a driving robot switches
+POLL_INTERVAL = 1.0           # seconds between checks of the tasks file
+ACK_TOLERANCE = 1e-3          # meters — a REACHED this close to the last target sent is for that target
+
+
+def assign(cost):
+    """Minimum-cost assignment for a rectangular cost matrix (Hungarian, shortest augmenting paths).
+
+    Every row is matched if rows <= cols (and every column otherwise). inf marks
+    forbidden pairs; rows left only with inf are returned unmatched.
+    Returns a list of (row, col).
+    """
+    c = np.asarray(cost, dtype=np.float64)
+    transposed = c.shape[0] > c.shape[1]
+    if transposed:
+        c = c.T
+    n, m = c.shape
+    if n == 0:
+        return []
+    finite = np.isfinite(c)
+    big = (np.abs(c[finite]).max() + 1.0) * (n + 1) if finite.any() else 1.0
+    c = np.where(finite, c, big)
+
+    # 1-based potentials and matching as in the classic O(n^2 m) formulation;
+    # the inner scan over columns is vectorized
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)      # p[j] = row matched to column j (0 = none)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = c[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            j1 = int(np.argmin(np.where(free, minv[1:], np.inf))) + 1
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    pairs = [(int(p[j]) - 1, j - 1) for j in range(1, m + 1) if p[j]]
+    pairs = [(r, col) for r, col in pairs if finite[r, col]]
+    if transposed:
+        pairs = [(col, r) for r, col in pairs]
+    return sorted(pairs)
+
+
+class CostModel:
+    """Coarse inflated map plus the world <-> cell conversions used for costs and routes."""
+
+    def __init__(self, grid, resolution=ALLOCATION_RESOLUTION):
+        self.grid = grid
+        self.mask, self.res = prepare_mask(grid, resolution=max(resolution, grid.resolution))
+        self.origin = (grid.x_min, grid.y_min)
+
+    def cell(self, x, y):
+        rows, cols = self.mask.shape
+        col = min(cols - 1, max(0, int((x - self.origin[0]) / self.res)))
+        row = min(rows - 1, max(0, int((y - self.origin[1]) / self.res)))
+        return nearest_free(self.mask, row, col)
+
+    def cost_matrix(self, robot_xys, task_xys):
+        """(robots, tasks) travel cost in meters, inf where unreachable: one Dijkstra per robot."""
+        out = np.full((len(robot_xys), len(task_xys)), np.inf)
+        if not task_xys:
+            return out
+        cells = [self.cell(x, y) for x, y in task_xys]
+        ok = np.array([c is not None for c in cells])
+        rows = np.array([c[0] if c else 0 for c in cells])
+        cols = np.array([c[1] if c else 0 for c in cells])
+        for k, (x, y) in enumerate(robot_xys):
+            src = self.cell(x, y)
+            if src is None:
+                continue
+            field = distance_field(self.mask, [src])
+            out[k] = np.where(ok, field[rows, cols] * self.res, np.inf)
+        return out
+
+    def route(self, start_xy, goal_xy):
+        path = plan_path(self.grid, start_xy, goal_xy, resolution=self.res, mask=self.mask)
+        if not path:
+            return None
+        return process_path(path, self.mask, self.origin, self.res, start=start_xy)
+
+
+def load_tasks(path):
+    """{task_id: (x, y)} from the tasks file; unnamed entries are keyed by position in the list."""
+    with open(path) as f:
+        raw = json.load(f)
+    tasks = {}
+    for i, t in enumerate(raw):
+        if isinstance(t, dict):
+            tasks[str(t.get('id', i))] = (float(t['pos'][0]), float(t['pos'][1]))
+        else:
+            tasks[str(i)] = (float(t[0]), float(t[1]))
+    return tasks
+
+
+class Worker:
+    def __init__(self, robot_id, name):
+        self.robot_id = robot_id
+        self.name = name
+        self.sock = None
+        self.buffer = ""
+        self.pos = None
+        self.task = None      # task id being driven to
+        self.target = None    # (x, y) end of the last PATH or stop sent; only its REACHED counts
+        self.done = 0
+
+    def acked(self, reached):
+        """True if reached is the ack for the last target sent, not a stale one from a replaced command."""
+        return (self.target is not None and abs(reached[0] - self.target[0]) <= ACK_TOLERANCE
+                and abs(reached[1] - self.target[1]) <= ACK_TOLERANCE)
+
+    def stop(self):
+        """Hold position: a WAYPOINT at the current pose replaces whatever PATH is being driven."""
+        try:
+            send_waypoint_command(self.sock, *self.pos)
+        except OSError as err:
+            print(f"ERROR: {self.name}: {err}")
+            return
+        self.target = self.pos
+        print(f"■ {self.name}: stopped at ({self.pos[0]:.2f}, {self.pos[1]:.2f}), no task")
+
+
+def allocate(model, workers, tasks, pending):
+    """Re-solve the assignment for every connected robot with a known position. Returns (changes, stats)."""
+    crew = [w for w in workers.values() if w.sock and w.pos is not None]
+    # Tasks already being driven to stay in play so a better placed robot can take them over
+    active = {w.task for w in crew if w.task}
+    ids = [t for t in tasks if t in pending or t in active]
+    if not crew or not ids:
+        return [], None
+    t0 = time.perf_counter()
+    cost = model.cost_matrix([w.pos for w in crew], [tasks[t] for t in ids])
+    t1 = time.perf_counter()
+    biased = cost.copy()
+    col = {t: j for j, t in enumerate(ids)}
+    for k, w in enumerate(crew):
+        if w.task in col:
+            biased[k, col[w.task]] -= REASSIGN_MARGIN
+    pairs = assign(biased)
+    t2 = time.perf_counter()
+
+    changes = []
+    chosen = {crew[r].robot_id: ids[c] for r, c in pairs}
+    for w in crew:
+        new = chosen.get(w.robot_id)
+        if new != w.task:
+            changes.append((w, new, cost[crew.index(w), col[new]] if new else None))
+    stats = (len(crew), len(ids), 1000 * (t1 - t0), 1000 * (t2 - t1))
+    return changes, stats
+
+
+def main():
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+
+    world, map_prefix, tasks_path = sys.argv[1:4]
+    cfg_path = os.path.join(project_root, 'world_configs', f'{world}.json')
+    try:
+        with open(cfg_path) as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        print(f"ERROR: No config found for world '{world}' at {cfg_path}")
+        sys.exit(1)
+
+    model = CostModel(OccupancyGrid.load_snapshot(map_prefix))
+    tasks = load_tasks(tasks_path)
+    tasks_mtime = os.path.getmtime(tasks_path)
+    pending = set(tasks)
+    print(f"=== Task Allocation [{cfg['name']}] ===")
+    print(f"Cost grid: {model.mask.shape[1]}x{model.mask.shape[0]} at {model.res}m | {len(tasks)} tasks")
+
+    sel = selectors.DefaultSelector()
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        udp.bind(('localhost', POSITION_PORT))
+    except OSError as err:
+        print(f"ERROR: Could not bind UDP :{POSITION_PORT}: {err} — is slam_viz running?")
+        sys.exit(1)
+    udp.setblocking(False)
+    sel.register(udp, selectors.EVENT_READ, None)
+
+    workers = {}
+    for rid, r in cfg['robots'].items():
+        w = Worker(int(rid), r['name'])
+        port = WAYPOINT_PORT + w.robot_id
+        try:
+            w.sock = socket.create_connection((HOST, port), timeout=1.0)
+        except OSError:
+            print(f"  {w.name}: no controller on port {port} — skipped")
+            continue
+        w.sock.setblocking(False)
+        sel.register(w.sock, selectors.EVENT_READ, w)
+        workers[w.robot_id] = w
+        print(f"Connected to {w.name} (robot {w.robot_id}) on port {port}")
+    if not workers:
+        sys.exit(1)
+
+    dirty = True
+    last_poll = time.monotonic()
+    try:
+        while pending or any(w.task for w in workers.values()):
+            for key, _ in sel.select(timeout=0.1):
+                w = key.data
+                if w is None:
+                    while True:
+                        try:
+                            data = udp.recv(65535)
+                        except BlockingIOError:
+                            break
+                        try:
+                            rid, x, y, _, _ = unpack_position(data)
+                        except struct.error:
+                            continue   # truncated or foreign packet
+                        if rid in workers:
+                            if workers[rid].pos is None:
+                                dirty = True
+                            workers[rid].pos = (x, y)
+                    continue
+                try:
+                    data = w.sock.recv(4096)
+                except OSError:
+                    data = b''
+                if not data:
+                    print(f"{w.name} disconnected")
+                    sel.unregister(w.sock)
+                    w.sock.close()
+                    w.sock = None
+                    if w.task:
+                        pending.add(w.task)
+                        w.task = None
+                    dirty = True
+                    continue
+                w.buffer += data.decode('utf-8')
+                while '\n' in w.buffer:
+                    line, w.buffer = w.buffer.split('\n', 1)
+                    reached = parse_reached_ack(line)
+                    if reached and w.task and w.acked(reached):
+                        w.pos = reached
+                        w.done += 1
+                        print(f"✓ {w.name} completed task {w.task} ({len(pending)} pending)")
+                        w.task = None
+                        dirty = True
+            if not any(w.sock for w in workers.values()):
+                print("All robots disconnected")
+                break
+
+            now = time.monotonic()
+            if now - last_poll >= POLL_INTERVAL:
+                last_poll = now
+                try:
+                    mtime = os.path.getmtime(tasks_path)
+                    if mtime != tasks_mtime:
+                        tasks_mtime = mtime
+                        fresh = {t: xy for t, xy in load_tasks(tasks_path).items() if t not in tasks}
+                        if fresh:
+                            tasks.update(fresh)
+                            pending.update(fresh)
+                            dirty = True
+                            print(f"+ {len(fresh)} new tasks ({len(pending)} pending)")
+                except (OSError, ValueError) as err:
+                    print(f"WARNING: could not re-read {tasks_path}: {err}")
+
+            if not dirty:
+                continue
+            dirty = False
+            changes, stats = allocate(model, workers, tasks, pending)
+            if stats:
+                print(f"  Allocation: {stats[0]} robots x {stats[1]} tasks | "
+                      f"cost fields {stats[2]:.1f} ms, assignment {stats[3]:.1f} ms")
+            # Release every switched task before handing any out, so a task moving
+            # from one robot to another is not put back into pending afterwards
+            driving = [w for w, _, _ in changes if w.task]
+            for w, _, _ in changes:
+                if w.task:
+                    pending.add(w.task)
+                w.task = None
+            for w, task, cost in changes:
+                if task is None:
+                    continue
+                path = model.route(w.pos, tasks[task])
+                if not path:
+                    print(f"  {w.name}: no route to task {task}")
+                    continue
+                try:
+                    send_path_command(w.sock, path)
+                except OSError as err:
+                    print(f"ERROR: {w.name}: {err}")
+                    continue
+                w.task = task
+                w.target = path[-1]
+                pending.discard(task)
+                print(f"→ {w.name}: task {task} at ({tasks[task][0]:.2f}, {tasks[task][1]:.2f}), {cost:.1f} m")
+            # A robot that lost its task without getting a new PATH (moved to another
+            # robot, or no route to its new one) would keep driving the old PATH
+            for w in driving:
+                if w.task is None and w.sock:
+                    w.stop()
+    except KeyboardInterrupt:
+        print("\nStopped by user")
+
+    print("=" * 50)
+    for w in workers.values():
+        print(f"  {w.name}: {w.done} tasks")
+    for w in workers.values():
+        if w.sock:
+            w.sock.close()
+    udp.close()
+
+
+if __name__ == '__main__':
+    main()
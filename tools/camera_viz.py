@@ -1,13 +1,24 @@
-"""Live camera feed from robots via UDP. Run from project root. Requires opencv-python."""
+"""Live camera feed from robots via UDP. Run from project root. Requires opencv-python.
+
+Every robot's camera is shown as a tile in one mosaic window. Frames are
+received on a background thread, which keeps only the newest frame per
+robot; a decode thread converts and scales them, so the window never falls
+behind the stream. Each tile shows the robot's frame rate and the age of the
+frame on screen. Press 'q' in the window to quit.
+"""
 
 import sys
 import os
+import math
+import time
 import socket
+import threading
 import numpy as np
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from utils.protocol import CAMERA_PORT, CAMERA_HEADER_SIZE, unpack_camera_header
+from utils.metrics import make_metrics, tool_port
 
 try:
     import cv2
@@ -15,55 +26,210 @@ except ImportError:
     print("ERROR: opencv-python is required. Install with: pip install opencv-python")
     sys.exit(1)
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind(('localhost', CAMERA_PORT))
-sock.settimeout(0.1)
-
-print(f"Camera Viewer listening on UDP :{CAMERA_PORT}...")
-print("Press 'q' in the camera window to quit.")
-
-frame_count = 0
-timeout_count = 0
-
-try:
-    while True:
-        try:
-            data, addr = sock.recvfrom(65535)
+TILE_WIDTH = 384       # pixels — every robot is scaled to fit one tile of this size
+TILE_HEIGHT = 288
+STALE_AFTER = 2.0      # seconds without a frame before a tile is marked as stale
+LOG_INTERVAL = 5.0     # seconds between console reports
+UI_INTERVAL = 15       # ms — window refresh period (cv2.waitKey)
+FPS_SMOOTHING = 0.2    # weight of the newest frame interval in the displayed FPS
+WINDOW_NAME = "Robot Cameras"
+
+
+class Feed:
+    """Per-robot state: newest undecoded packet, newest decoded tile and rate counters."""
+
+    def __init__(self, robot_id):
+        self.robot_id = robot_id
+        self.raw = None          # (recv_time, width, height, rgb bytes) not yet decoded
+        self.tile = None         # TILE_HEIGHT x TILE_WIDTH x 3 BGR
+        self.tile_time = 0.0     # recv_time of the frame in tile
+        self.size = (0, 0)
+        self.fps = 0.0
+        self.last_recv = None
+        self.received = 0
+        self.decoded = 0
+        self.skipped = 0         # frames replaced by a newer one before they were decoded
+
+
+class CameraStream:
+    """Receiver thread (UDP -> newest packet per robot) and decode thread (packet -> scaled tile)."""
+
+    def __init__(self, sock, metrics):
+        self.sock = sock
+        self.feeds = {}
+        self.lock = threading.Lock()
+        self.pending = threading.Condition(self.lock)
+        self.stop_event = threading.Event()
+        self.bad = 0             # packets shorter than their header claims
+        # Feed counters are exported as they are, per robot, when scraped
+        self.m_frames = metrics.counter('dal_frames_total', 'Camera frames received, decoded or '
+                                        'replaced by a newer one before decoding', ('robot', 'stage'))
+        self.m_decode = metrics.histogram('dal_decode_seconds', 'Decode and scale time per frame')
+        metrics.counter('dal_bad_packets_total', 'Packets shorter than their header claims').set_function(
+            lambda: self.bad)
+        self.threads = [threading.Thread(target=self._receive, name='receiver', daemon=True),
+                        threading.Thread(target=self._decode, name='decoder', daemon=True)]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.pending:
+            self.pending.notify_all()
+        for t in self.threads:
+            t.join(timeout=1.0)
+
+    def _receive(self):
+        while not self.stop_event.is_set():
+            try:
+                data = self.sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            now = time.monotonic()
+            if len(data) < CAMERA_HEADER_SIZE:
+                self.bad += 1
+                continue
             robot_id, width, height = unpack_camera_header(data)
-            rgb_data = data[CAMERA_HEADER_SIZE:]
-            expected_size = width * height * 3
-
-            print(f"[DEBUG] Packet: {len(data)} bytes | robot_id={robot_id} | {width}x{height} | rgb_bytes={len(rgb_data)} | expected={expected_size}")
-
-            if len(rgb_data) < expected_size:
-                print(f"[DEBUG] DROPPED: rgb data too short ({len(rgb_data)} < {expected_size})")
+            if len(data) - CAMERA_HEADER_SIZE < width * height * 3:
+                self.bad += 1
                 continue
-
-            img = np.frombuffer(rgb_data, dtype=np.uint8, count=expected_size)
-            img = img.reshape((height, width, 3))
-            img_bgr = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-
-            scale = 3
-            img_display = cv2.resize(img_bgr, (width * scale, height * scale),
-                                     interpolation=cv2.INTER_NEAREST)
-
-            window_name = f"Robot {robot_id} Camera"
-            cv2.imshow(window_name, img_display)
-
-            frame_count += 1
-            if frame_count % 50 == 0:
-                print(f"  Received {frame_count} frames from robot {robot_id} ({width}x{height})")
-
-        except socket.timeout:
-            timeout_count += 1
-            if timeout_count % 20 == 0:
-                print(f"[DEBUG] No data for {timeout_count * 0.1:.1f}s — is controller running and camera enabled?")
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-except KeyboardInterrupt:
-    print("\nStopped by user")
-finally:
-    sock.close()
-    cv2.destroyAllWindows()
+            with self.pending:
+                feed = self.feeds.get(robot_id)
+                if feed is None:
+                    feed = self.feeds[robot_id] = Feed(robot_id)
+                    print(f"Robot {robot_id}: first frame {width}x{height}")
+                    for stage in ('received', 'decoded', 'skipped'):
+                        self.m_frames.labels(robot_id, stage).set_function(
+                            lambda feed=feed, stage=stage: getattr(feed, stage))
+                if feed.raw is not None:
+                    feed.skipped += 1
+                feed.raw = (now, width, height, data)
+                if feed.last_recv is not None and now > feed.last_recv:
+                    feed.fps += FPS_SMOOTHING * (1.0 / (now - feed.last_recv) - feed.fps)
+                feed.last_recv = now
+                feed.received += 1
+                self.pending.notify()
+
+    def _decode(self):
+        while not self.stop_event.is_set():
+            with self.pending:
+                work = [(f, f.raw) for f in self.feeds.values() if f.raw is not None]
+                if not work:
+                    self.pending.wait(timeout=0.1)
+                    continue
+                for f, _ in work:
+                    f.raw = None
+            # Decoding happens outside the lock so the receiver is never held up
+            for feed, (recv_time, width, height, data) in work:
+                t0 = time.perf_counter()
+                img = np.frombuffer(data, dtype=np.uint8, count=width * height * 3,
+                                    offset=CAMERA_HEADER_SIZE).reshape(height, width, 3)
+                tile = fit_tile(img[:, :, ::-1])   # RGB -> BGR as a view; fit_tile copies
+                self.m_decode.observe(time.perf_counter() - t0)
+                with self.lock:
+                    feed.tile = tile
+                    feed.tile_time = recv_time
+                    feed.size = (width, height)
+                    feed.decoded += 1
+
+
+def fit_tile(img):
+    """Scale img to fit TILE_WIDTH x TILE_HEIGHT (nearest neighbour, aspect kept) and letterbox it."""
+    h, w = img.shape[:2]
+    scale = min(TILE_WIDTH / w, TILE_HEIGHT / h)
+    sw, sh = max(1, int(w * scale)), max(1, int(h * scale))
+    tile = np.zeros((TILE_HEIGHT, TILE_WIDTH, 3), dtype=np.uint8)
+    x0, y0 = (TILE_WIDTH - sw) // 2, (TILE_HEIGHT - sh) // 2
+    tile[y0:y0 + sh, x0:x0 + sw] = cv2.resize(np.ascontiguousarray(img), (sw, sh),
+                                               interpolation=cv2.INTER_NEAREST)
+    return tile
+
+
+def compose(stream, now):
+    """One mosaic image with a tile per robot, ordered by robot id, plus text overlays."""
+    with stream.lock:
+        feeds = [(f.robot_id, f.tile, f.tile_time, f.fps, f.size)
+                 for f in sorted(stream.feeds.values(), key=lambda f: f.robot_id)]
+    cols = max(1, math.ceil(math.sqrt(len(feeds))))
+    rows = max(1, math.ceil(len(feeds) / cols))
+    mosaic = np.zeros((rows * TILE_HEIGHT, cols * TILE_WIDTH, 3), dtype=np.uint8)
+    if not feeds:
+        cv2.putText(mosaic, "Waiting for camera frames...", (10, TILE_HEIGHT // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1, cv2.LINE_AA)
+        return mosaic
+    for k, (robot_id, tile, tile_time, fps, (w, h)) in enumerate(feeds):
+        y, x = (k // cols) * TILE_HEIGHT, (k % cols) * TILE_WIDTH
+        view = mosaic[y:y + TILE_HEIGHT, x:x + TILE_WIDTH]
+        if tile is not None:
+            view[:] = tile
+        age = now - tile_time
+        stale = tile is None or age > STALE_AFTER
+        if tile is None:
+            label = f"Robot {robot_id}  decoding..."
+        elif stale:
+            view //= 3
+            label = f"Robot {robot_id}  no frame for {age:.0f}s"
+        else:
+            label = f"Robot {robot_id}  {w}x{h}  {fps:.1f} fps  age {1000 * age:.0f} ms"
+        cv2.rectangle(view, (0, 0), (TILE_WIDTH - 1, 22), (0, 0, 0), -1)
+        cv2.putText(view, label, (6, 16), cv2.FONT_HERSHEY_SIMPLEX, 0.45,
+                    (80, 80, 255) if stale else (255, 255, 255), 1, cv2.LINE_AA)
+    return mosaic
+
+
+def report(stream, last):
+    """Rate-limited console summary: per-robot fps and frames received / decoded / skipped."""
+    with stream.lock:
+        lines = [f"Robot {f.robot_id}: {f.fps:.1f} fps | rx {f.received} | decoded {f.decoded} | "
+                 f"skipped {f.skipped}" for f in sorted(stream.feeds.values(), key=lambda f: f.robot_id)]
+    if not lines:
+        print("No camera frames yet — is controller running and camera enabled?")
+        return
+    for line in lines:
+        print(f"  {line}")
+    if stream.bad != last.get('bad', 0):
+        print(f"  {stream.bad - last.get('bad', 0)} truncated packets")
+        last['bad'] = stream.bad
+
+
+def main():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.bind(('localhost', CAMERA_PORT))
+    except OSError as e:
+        print(f"ERROR: Could not bind UDP :{CAMERA_PORT}: {e}")
+        sys.exit(1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sock.settimeout(0.1)
+
+    print(f"Camera Viewer listening on UDP :{CAMERA_PORT}...")
+    print("Press 'q' in the camera window to quit.")
+
+    stream = CameraStream(sock, make_metrics('camera_viz', tool_port('camera_viz')))
+    stream.start()
+    last_log = time.monotonic()
+    last = {}
+    cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_AUTOSIZE)
+    try:
+        while True:
+            now = time.monotonic()
+            cv2.imshow(WINDOW_NAME, compose(stream, now))
+            if now - last_log >= LOG_INTERVAL:
+                last_log = now
+                report(stream, last)
+            if cv2.waitKey(UI_INTERVAL) & 0xFF == ord('q'):
+                break
+    except KeyboardInterrupt:
+        print("\nStopped by user")
+    finally:
+        stream.stop()
+        sock.close()
+        cv2.destroyAllWindows()
+
+
+if __name__ == '__main__':
+    main()
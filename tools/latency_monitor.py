@@ -0,0 +1,386 @@
+"""Latency monitor: per-robot, per-stream latency, rates, losses and bandwidth of the live streams.
+
+Usage:
+    python tools/latency_monitor.py [--no-camera] [--proxy <id>[,<id>...]] [--report <file.json>]
+
+Binds UDP :5555 and :5556 like the viewers (run it instead of them).
+Controllers append a STAMP extension (sequence number, wall time
+robot.step returned) to every position and camera packet, so for each
+robot and stream it reports:
+
+    latency   step -> received here, p50/p95/p99 in ms (same host, same clock)
+    drop%     sequence numbers never received
+    pkt/s, kB/s
+
+Stamps older than STALE_STAMP (e.g. replayed by tools/session_replay.py,
+which keeps the original step times) are counted as stale: rates and
+drops only, no latency.
+
+--proxy 0,1 also observes the command links of those robots through a proxy
+on PROXY_PORT_BASE + id (start the planner with DAL_WAYPOINT_PORT=6200).
+Its latency is command -> motion: from the moment a WAYPOINT/PATH/APPEND/
+REPLACE_FROM line passes the proxy while the robot is standing still, to the
+first step at which the robot has moved MOTION_EPS.
+
+A live table is printed every REPORT_INTERVAL seconds over that interval;
+at exit (Ctrl+C) the whole run is printed, and --report also writes it as
+JSON so runs can be compared.
+"""
+
+import sys
+import os
+import json
+import math
+import time
+import socket
+import struct
+import threading
+from bisect import bisect_left
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.protocol import (
+    POSITION_PORT, CAMERA_PORT, POSITION_HEADER_FMT, POSITION_HEADER_SIZE, CAMERA_HEADER_SIZE,
+    unpack_position_stamp, unpack_camera_stamp
+)
+from utils.command_proxy import CommandProxy, TO_CONTROLLER
+
+HOST = 'localhost'
+REPORT_INTERVAL = 5.0      # seconds between live tables
+RECV_BUFFER = 8 << 20      # bytes
+SOCKET_TIMEOUT = 0.2       # seconds — how often receiver threads check for shutdown
+RESTART_GAP = 1000         # a sequence number this far below the last one means the controller restarted
+MOTION_EPS = 0.02          # meters — displacement that counts as "moving"
+STILL_SPEED = 0.02         # m/s — slower than this at command time counts as standing still
+MOTION_TIMEOUT = 10.0      # seconds — a command without motion by then counts as "no motion"
+MOTION_VERBS = ('WAYPOINT', 'PATH', 'PATH3', 'APPEND', 'REPLACE_FROM')
+STALE_STAMP = 30.0         # seconds — an older stamp was not sent live (a replay); no latency is taken
+
+# Upper bucket edges in ms, ~12% apart from 10 us to ~40 s
+LATENCY_EDGES_MS = tuple(0.01 * 1.12 ** i for i in range(135))
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram: constant memory however long the run; percentiles are bucket upper edges (capped at the max)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_EDGES_MS) + 1)
+        self.n = 0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect_left(LATENCY_EDGES_MS, ms)] += 1
+        self.n += 1
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        if self.n == 0:
+            return None
+        target = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(LATENCY_EDGES_MS[i], self.max) if i < len(LATENCY_EDGES_MS) else self.max
+        return self.max
+
+
+class StreamStats:
+    """Counters for one (robot, stream): packets, bytes, sequence losses and latency."""
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.stamped = 0          # packets that carried a sequence number
+        self.stale = 0            # stamped packets older than STALE_STAMP
+        self.lost = 0             # from earlier controller runs (before a restart)
+        self.first_seq = None
+        self.max_seq = None
+        self.seen = 0             # stamped packets since first_seq
+        self.total = LatencyHistogram()
+        self.window = LatencyHistogram()
+        self.window_packets = 0
+        self.window_bytes = 0
+        self.window_lost = 0
+
+    def add(self, nbytes, seq=None, latency_ms=None, stale=False):
+        self.packets += 1
+        if stale:
+            self.stale += 1
+        self.bytes += nbytes
+        self.window_packets += 1
+        self.window_bytes += nbytes
+        if seq is not None:
+            self.stamped += 1
+            if self.max_seq is None or seq < self.max_seq - RESTART_GAP:
+                if self.max_seq is not None:
+                    self.lost += self._missing()
+                self.first_seq = self.max_seq = seq
+                self.seen = 0
+            self.seen += 1
+            self.max_seq = max(self.max_seq, seq)
+        if latency_ms is not None:
+            self.total.add(latency_ms)
+            self.window.add(latency_ms)
+
+    def _missing(self):
+        if self.first_seq is None:
+            return 0
+        return max(0, self.max_seq - self.first_seq + 1 - self.seen)
+
+    def lost_total(self):
+        return self.lost + self._missing()
+
+    def drop_pct(self, lost=None):
+        lost = self.lost_total() if lost is None else lost
+        return 100.0 * lost / (lost + self.stamped) if self.stamped else None
+
+
+class Monitor:
+    def __init__(self, camera=True, proxy_ids=()):
+        self.lock = threading.Lock()
+        self.stats = {}           # (robot_id, stream) -> StreamStats
+        self.poses = {}           # robot_id -> (step_wall, x, y, speed)
+        self.pending = {}         # robot_id -> [(t_command, x, y)] awaiting motion
+        self.line_buf = {}        # robot_id -> partial command line
+        self.no_motion = 0
+        self.while_moving = 0     # motion commands sent while the robot was already moving
+        self.bad = 0
+        self.start_wall = self.window_start = time.time()
+        self.stop_event = threading.Event()
+        self.sockets = []
+        self.threads = []
+        ports = [(POSITION_PORT, self._on_position)]
+        if camera:
+            ports.append((CAMERA_PORT, self._on_camera))
+        for port, handler in ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+            sock.bind((HOST, port))
+            sock.settimeout(SOCKET_TIMEOUT)
+            self.sockets.append(sock)
+            self.threads.append(threading.Thread(target=self._receive, args=(sock, handler),
+                                                 name=f'udp-{port}', daemon=True))
+        self.proxies = [CommandProxy(robot_id, self._on_command, self.stop_event, HOST)
+                        for robot_id in proxy_ids]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        for proxy in self.proxies:
+            proxy.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for proxy in self.proxies:
+            proxy.close()
+        for t in self.threads:
+            t.join(timeout=1.0)
+        for sock in self.sockets:
+            sock.close()
+
+    def _stream(self, robot_id, stream):
+        s = self.stats.get((robot_id, stream))
+        if s is None:
+            s = self.stats[(robot_id, stream)] = StreamStats()
+        return s
+
+    def _receive(self, sock, handler):
+        while not self.stop_event.is_set():
+            try:
+                data = sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            now = time.time()
+            try:
+                handler(data, now)
+            except (struct.error, IndexError):
+                self.bad += 1
+
+    @staticmethod
+    def _latency(stamp, now):
+        """(seq, latency ms, step wall time, stale) of a packet; a stale stamp gives no latency and its receive time."""
+        if stamp is None:
+            return None, None, now, False
+        seq, step_wall = stamp[0], stamp[1]
+        if now - step_wall > STALE_STAMP:
+            return seq, None, now, True
+        # Clamped at 0: sender and monitor share a clock, but time.time() can step
+        return seq, max(0.0, 1000.0 * (now - step_wall)), step_wall, False
+
+    def _on_position(self, data, now):
+        robot_id, x, y, _, _ = struct.unpack_from(POSITION_HEADER_FMT, data)
+        stamp = unpack_position_stamp(data) if len(data) > POSITION_HEADER_SIZE else None
+        seq, latency, step_wall, stale = self._latency(stamp, now)
+        with self.lock:
+            self._stream(robot_id, 'position').add(len(data), seq, latency, stale)
+            prev = self.poses.get(robot_id)
+            speed = 0.0
+            if prev is not None and step_wall > prev[0]:
+                speed = math.hypot(x - prev[1], y - prev[2]) / (step_wall - prev[0])
+            self.poses[robot_id] = (step_wall, x, y, speed)
+            waiting = self.pending.get(robot_id)
+            if waiting:
+                still = []
+                for t_cmd, x0, y0 in waiting:
+                    if step_wall < t_cmd:
+                        still.append((t_cmd, x0, y0))
+                    elif math.hypot(x - x0, y - y0) >= MOTION_EPS:
+                        command = self._stream(robot_id, 'command')
+                        command.total.add(1000.0 * (step_wall - t_cmd))
+                        command.window.add(1000.0 * (step_wall - t_cmd))
+                    elif step_wall - t_cmd > MOTION_TIMEOUT:
+                        self.no_motion += 1
+                    else:
+                        still.append((t_cmd, x0, y0))
+                self.pending[robot_id] = still
+
+    def _on_camera(self, data, now):
+        robot_id = data[0]
+        stamp = unpack_camera_stamp(data) if len(data) > CAMERA_HEADER_SIZE else None
+        seq, latency, _, stale = self._latency(stamp, now)
+        with self.lock:
+            self._stream(robot_id, 'camera').add(len(data), seq, latency, stale)
+
+    def _on_command(self, direction, robot_id, data):
+        now = time.time()
+        with self.lock:
+            if direction != TO_CONTROLLER:
+                self._stream(robot_id, 'reply').add(len(data))
+                return
+            self._stream(robot_id, 'command').add(len(data))
+            text = self.line_buf.get(robot_id, '') + data.decode('utf-8', 'replace')
+            *lines, self.line_buf[robot_id] = text.split('\n')
+            for line in lines:
+                verb = line.split(' ', 1)[0].strip()
+                if verb not in MOTION_VERBS:
+                    continue
+                pose = self.poses.get(robot_id)
+                if pose is None:
+                    continue
+                if pose[3] > STILL_SPEED:
+                    self.while_moving += 1
+                    continue
+                self.pending.setdefault(robot_id, []).append((now, pose[1], pose[2]))
+
+    def table(self, window):
+        """Rows (robot, stream, pkt/s, kB/s, drop%, p50, p95, p99, samples, max, stale) for the window or the whole run."""
+        with self.lock:
+            rows = []
+            elapsed = max(time.time() - (self.window_start if window else self.start_wall), 1e-6)
+            for (robot_id, stream), s in sorted(self.stats.items()):
+                hist = s.window if window else s.total
+                if window:
+                    lost_now = s.lost_total()
+                    lost = lost_now - s.window_lost
+                    drop = 100.0 * lost / (lost + s.window_packets) if s.window_packets and s.stamped else None
+                    packets, nbytes = s.window_packets, s.window_bytes
+                else:
+                    drop = s.drop_pct()
+                    packets, nbytes = s.packets, s.bytes
+                rows.append((robot_id, stream, packets / elapsed, nbytes / elapsed / 1e3, drop,
+                             hist.percentile(0.50), hist.percentile(0.95), hist.percentile(0.99),
+                             hist.n, hist.max, s.stale))
+                if window:
+                    s.window = LatencyHistogram()
+                    s.window_packets = s.window_bytes = 0
+                    s.window_lost = lost_now
+            if window:
+                self.window_start = time.time()
+            return rows
+
+
+def _ms(v):
+    return '—' if v is None else f"{v:.2f}"
+
+
+def print_table(rows, title):
+    print(title)
+    print(f"  {'robot':>5} {'stream':<9} {'pkt/s':>7} {'kB/s':>8} {'drop%':>6} "
+          f"{'p50':>7} {'p95':>7} {'p99':>7}  (ms)")
+    for robot_id, stream, rate, kbs, drop, p50, p95, p99, n, _, stale in rows:
+        note = '  command -> motion' if stream == 'command' and n else ''
+        if stale:
+            note = f'  {stale} stale stamps (replay?), not timed'
+        print(f"  {robot_id:>5} {stream:<9} {rate:>7.1f} {kbs:>8.1f} "
+              f"{'—' if drop is None else f'{drop:.1f}':>6} {_ms(p50):>7} {_ms(p95):>7} {_ms(p99):>7}{note}")
+
+
+def write_report(monitor, rows, path):
+    duration = time.time() - monitor.start_wall
+    report = {
+        "start": monitor.start_wall,
+        "duration_s": duration,
+        "no_motion": monitor.no_motion,
+        "commands_while_moving": monitor.while_moving,
+        "bad_packets": monitor.bad,
+        "streams": [
+            {"robot_id": robot_id, "stream": stream, "packets_per_s": rate, "kbytes_per_s": kbs,
+             "drop_pct": drop, "stale_packets": stale,
+             "latency_ms": {"p50": p50, "p95": p95, "p99": p99, "max": mx, "samples": n}}
+            for robot_id, stream, rate, kbs, drop, p50, p95, p99, n, mx, stale in rows
+        ],
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    args = sys.argv[1:]
+    camera = '--no-camera' not in args
+    proxy_ids = []
+    report_path = None
+    try:
+        if '--proxy' in args:
+            i = args.index('--proxy')
+            proxy_ids = [int(r) for r in args[i + 1].split(',')]
+            del args[i:i + 2]
+        if '--report' in args:
+            i = args.index('--report')
+            report_path = args[i + 1]
+            del args[i:i + 2]
+    except (IndexError, ValueError):
+        print(__doc__)
+        sys.exit(1)
+    if [a for a in args if a != '--no-camera']:
+        print(__doc__)
+        sys.exit(1)
+
+    try:
+        monitor = Monitor(camera=camera, proxy_ids=proxy_ids)
+    except OSError as e:
+        print(f"ERROR: Could not open sockets: {e} (is a viewer or the recorder running?)")
+        sys.exit(1)
+    print(f"Latency monitor on UDP :{POSITION_PORT}" + (f", :{CAMERA_PORT}" if camera else ""))
+    for proxy in monitor.proxies:
+        print(f"  TCP :{proxy.port} -> :{proxy.controller_port} command link of robot {proxy.robot_id}")
+    print("Ctrl+C to stop.")
+
+    monitor.start()
+    try:
+        while True:
+            time.sleep(REPORT_INTERVAL)
+            rows = monitor.table(window=True)
+            if rows:
+                print_table(rows, f"[LATENCY] last {REPORT_INTERVAL:.0f}s")
+            else:
+                print("[LATENCY] No packets yet — is a controller running?")
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        monitor.stop()
+        rows = monitor.table(window=False)
+        print_table(rows, f"Whole run ({time.time() - monitor.start_wall:.0f}s)")
+        if monitor.no_motion or monitor.while_moving:
+            print(f"  commands without motion within {MOTION_TIMEOUT:.0f}s: {monitor.no_motion}, "
+                  f"sent while already moving (not timed): {monitor.while_moving}")
+        if report_path:
+            write_report(monitor, rows, report_path)
+            print(f"Report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
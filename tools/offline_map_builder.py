@@ -0,0 +1,191 @@
+"""Offline map builder: rebuilds an occupancy grid from a recorded session log on all CPU cores.
+
+Usage:
+    python tools/offline_map_builder.py <world> <log> [--out <map_prefix>] [--workers N]
+                                        [--split time|robot] [--robots 0,1] [--start s] [--end s]
+
+The position+LIDAR records of the log are cut into work units and a process
+pool integrates each unit into its own log-odds grid, exactly as slam_viz
+does live. The partial grids are then merged in time order with
+OccupancyGrid.merge_logodds and written to <map_prefix>.npy/.json/.png
+(default maps/<world>_offline), ready for the planners.
+
+--split time   (default) units are consecutive time slices holding equal
+               numbers of records, WORK_UNITS_PER_WORKER per worker so a slow
+               slice does not leave cores idle
+--split robot  one unit per robot; parallelism is capped at the robot count
+--robots       map only these robots (default: every robot in the log;
+               slam_viz itself maps robot 0 only)
+--workers      processes to use (default: all cores); 1 builds sequentially
+
+Freeze rule: a cell stops updating once its log-odds crosses ±2 (see
+OccupancyGrid). Addition commutes but freezing does not, so a merged map can
+differ slightly from a sequential build where a cell reached a threshold
+partway through a unit. --workers 1 is exact.
+"""
+
+import sys
+import os
+import json
+import math
+import time
+import struct
+import multiprocessing
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.protocol import unpack_position
+from utils.occupancy_grid import OccupancyGrid
+from utils.session_log import SessionReader, STREAM_POSITION
+
+GRID_RESOLUTION = 0.15         # meters — same as slam_viz
+LIDAR_ANGLE_MIN = math.pi      # same beam layout as slam_viz
+PNG_SCALE = 4
+WORK_UNITS_PER_WORKER = 4
+
+_job = {}   # per-process build parameters, set by _init_worker
+
+
+def _init_worker(job):
+    _job.update(job)
+
+
+def build_unit(unit):
+    """Integrate one unit's scans into a fresh grid; returns (unit index, log-odds, scans, bad records)."""
+    index, t_start, t_end, robots = unit
+    grid = OccupancyGrid(*_job['bounds'], resolution=_job['resolution'])
+    log = SessionReader(_job['path'])
+    scans = bad = 0
+    try:
+        for t, _, robot_id, data in log.read(start=t_start, end=t_end, robots=robots,
+                                             streams={STREAM_POSITION}):
+            if t_end is not None and t >= t_end:
+                continue   # half-open slices: the next unit owns this record
+            try:
+                _, x, y, heading, ranges = unpack_position(data)
+            except struct.error:
+                bad += 1   # the recorder keeps every datagram, truncated or foreign ones too
+                continue
+            if not ranges:
+                continue
+            grid.update_from_lidar(x, y, heading, ranges,
+                                   angle_min=LIDAR_ANGLE_MIN,
+                                   angle_increment=-(2.0 * math.pi / len(ranges)),
+                                   max_range=_job['max_range'])
+            scans += 1
+    finally:
+        log.close()
+    return index, grid.logodds, scans, bad
+
+
+def plan_units(log, split, workers, robots, start, end):
+    """Work units (index, t_start, t_end, robots); t_end is exclusive, None = end of log."""
+    robot_ids = sorted(robots) if robots is not None else log.robot_ids()
+    if split == 'robot':
+        return [(i, start, end, {r}) for i, r in enumerate(robot_ids)]
+    wanted = set(robot_ids)
+    if workers == 1:
+        return [(0, start, end, wanted)]
+    index = log.index
+    keep = index['t_last'] >= start
+    if end is not None:
+        keep &= index['t_first'] <= end
+    index = index[keep]
+    if not len(index):
+        return [(0, start, end, wanted)]
+    # Cut at chunk starts so that every unit holds about the same number of records
+    count = WORK_UNITS_PER_WORKER * workers
+    cum = np.cumsum(index['records'])
+    cuts = np.searchsorted(cum, cum[-1] * np.arange(1, count) / count) + 1
+    times = sorted({float(index['t_first'][c]) for c in cuts if c < len(index)})
+    bounds = [start] + [t for t in times if t > start and (end is None or t < end)] + [end]
+    return [(i, a, b, wanted) for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+
+def main():
+    args = sys.argv[1:]
+    opts = {'--out': None, '--workers': None, '--split': 'time', '--robots': None,
+            '--start': '0', '--end': None}
+    try:
+        for flag in list(opts):
+            if flag in args:
+                i = args.index(flag)
+                opts[flag] = args[i + 1]
+                del args[i:i + 2]
+        workers = int(opts['--workers'] or os.cpu_count() or 1)
+        robots = {int(r) for r in opts['--robots'].split(',')} if opts['--robots'] else None
+        start = float(opts['--start'])
+        end = float(opts['--end']) if opts['--end'] else None
+    except (IndexError, ValueError):
+        print(__doc__)
+        sys.exit(1)
+    if len(args) != 2 or opts['--split'] not in ('time', 'robot') or workers < 1:
+        print(__doc__)
+        sys.exit(1)
+    world, path = args
+
+    cfg_path = os.path.join(os.path.dirname(__file__), '..', 'world_configs', f'{world}.json')
+    try:
+        with open(cfg_path) as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        print(f"ERROR: No config found for world '{world}' at {cfg_path}")
+        sys.exit(1)
+    try:
+        log = SessionReader(path)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    cx, cy = cfg['floor_center_x'], cfg['floor_center_y']
+    w, h = cfg['floor_width'], cfg['floor_height']
+    job = {'path': path, 'resolution': GRID_RESOLUTION,
+           'bounds': (cx - w / 2, cx + w / 2, cy - h / 2, cy + h / 2),
+           'max_range': cfg.get('lidar_max_range', 3.5)}
+    prefix = opts['--out'] or os.path.join(os.path.dirname(__file__), '..', 'maps', f'{world}_offline')
+
+    units = plan_units(log, opts['--split'], workers, robots, start, end)
+    workers = min(workers, len(units)) or 1
+    print(f"=== Offline Map Builder [{cfg['name']}] ===")
+    print(f"{path}: {log.duration:.1f} s, {log.records} records, robots {log.robot_ids()}")
+    print(f"{len(units)} units split by {opts['--split']} on {workers} worker(s)")
+    log.close()
+
+    merged = OccupancyGrid(*job['bounds'], resolution=GRID_RESOLUTION)
+    scans = bad = 0
+    t0 = time.perf_counter()
+    if workers == 1:
+        _init_worker(job)
+        results = map(build_unit, units)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(job,))
+        results = pool.imap(build_unit, units)   # ordered, so partials merge in time order
+    try:
+        for index, logodds, n, n_bad in results:
+            merged.merge_logodds(logodds)
+            scans += n
+            bad += n_bad
+            print(f"  unit {index + 1}/{len(units)}: {n} scans" + (f", {n_bad} bad records skipped" if n_bad else ""))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - t0
+
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    merged.save_snapshot(prefix)
+    merged.save_png(f"{prefix}.png", scale=PNG_SCALE)
+    free = np.mean(merged.grid < 0.3) * 100
+    occupied = np.mean(merged.grid > 0.7) * 100
+    print(f"Mapped {scans} scans in {elapsed:.1f} s ({scans / max(elapsed, 1e-6):.0f} scans/s): "
+          f"{free:.0f}% free, {occupied:.1f}% occupied")
+    if bad:
+        print(f"Skipped {bad} malformed position records")
+    print(f"Saved {prefix}.npy/.json/.png")
+
+
+if __name__ == '__main__':
+    main()
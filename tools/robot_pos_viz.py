@@ -1,19 +1,39 @@
+"""Robot position viewer: robots on a floor grid with fading trajectory trails. Receives UDP :5555.
+
+Usage:
+    python tools/robot_pos_viz.py <world> [--readout]
+
+--readout adds each robot's speed and heading to the status box.
+"""
 
 import sys
 import os
 import json
+import math
+import time
 import matplotlib
 matplotlib.use('TkAgg')
 
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
-import matplotlib.animation as animation
+import matplotlib.colors as mcolors
+from matplotlib.collections import LineCollection
 import numpy as np
 import socket
 import struct
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.protocol import POSITION_PORT, POSITION_HEADER_FMT, POSITION_HEADER_SIZE
+from utils.blit_manager import BlitManager
+from utils.metrics import make_metrics, tool_port
+
+# ── Command line ───────────────────────────────────────────────────────────────
+READOUT = '--readout' in sys.argv[1:]
+_args = [a for a in sys.argv[1:] if a != '--readout']
+
 # ── Load world config ──────────────────────────────────────────────────────────
-_world = sys.argv[1] if len(sys.argv) > 1 else 'dal-factory'
+_world = _args[0] if _args else 'dal-factory'
 _cfg_path = os.path.join(os.path.dirname(__file__), '..', 'world_configs', f'{_world}.json')
 
 try:
@@ -37,6 +57,66 @@ X_MAX = FLOOR_CENTER_X + FLOOR_WIDTH  / 2
 Y_MIN = FLOOR_CENTER_Y - FLOOR_HEIGHT / 2
 Y_MAX = FLOOR_CENTER_Y + FLOOR_HEIGHT / 2
 
+FRAME_INTERVAL = 50     # ms between frames
+BLIT_ENABLED   = True   # per frame, blit markers + status over a cached background (floor, grid, legend)
+FPS_SMOOTHING  = 0.1    # weight of the newest frame in the displayed FPS
+STATUS_INTERVAL = 0.5   # seconds between status text refreshes (text is the costliest artist to draw)
+
+TRAIL_CAPACITY = 512    # samples kept per robot (ring buffer, so memory is fixed however long the session)
+TRAIL_INTERVAL = 0.1    # seconds — at most one trail sample per robot per interval
+TRAIL_SECONDS  = 30.0   # trails fade out over this many seconds; older samples are not drawn
+TRAIL_ALPHA    = 0.8    # opacity of the newest trail segment
+TRAIL_BANDS    = 8      # fade steps per trail; each band is one polyline, so a frame draws robots x bands paths
+VEL_WINDOW     = 0.5    # seconds of trail used for the speed readout
+
+LEGACY_FMT = 'Bfff'     # robot_id, x, y, heading — packets from before the LIDAR count was added
+LEGACY_SIZE = struct.calcsize(LEGACY_FMT)
+
+
+class Trail:
+    """Fixed-capacity ring buffer of (t, x, y, heading) samples for one robot."""
+
+    def __init__(self, capacity=TRAIL_CAPACITY):
+        self.buf = np.zeros((capacity, 4), dtype=np.float64)
+        self.head = 0     # next slot to write
+        self.count = 0
+
+    def append(self, t, x, y, heading):
+        self.buf[self.head] = (t, x, y, heading)
+        self.head = (self.head + 1) % len(self.buf)
+        self.count = min(self.count + 1, len(self.buf))
+
+    @property
+    def last_t(self):
+        return self.buf[self.head - 1, 0] if self.count else -math.inf
+
+    def ordered(self):
+        """Samples oldest first, as a (count, 4) array (a copy)."""
+        start = (self.head - self.count) % len(self.buf)
+        return np.take(self.buf, np.arange(start, start + self.count), axis=0, mode='wrap')
+
+    def speed(self, now, window=VEL_WINDOW):
+        """Mean speed in m/s over the last window seconds of samples (0 if fewer than two)."""
+        pts = self.ordered()
+        pts = pts[pts[:, 0] >= now - window]
+        if len(pts) < 2 or pts[-1, 0] <= pts[0, 0]:
+            return 0.0
+        dist = np.hypot(np.diff(pts[:, 1]), np.diff(pts[:, 2])).sum()
+        return float(dist / (pts[-1, 0] - pts[0, 0]))
+
+
+def parse_pose(data):
+    """(robot_id, x, y, heading) from a position packet, or None.
+
+    Reads the position header (as pack_position writes it, extension blocks
+    and LIDAR ignored), or the older bare 'Bfff' packets.
+    """
+    if len(data) >= POSITION_HEADER_SIZE:
+        return struct.unpack_from(POSITION_HEADER_FMT, data)[:4]
+    if len(data) >= LEGACY_SIZE:
+        return struct.unpack_from(LEGACY_FMT, data)
+    return None
+
 # ── Robot definitions from config ─────────────────────────────────────────────
 _robot_cfg = _cfg['robots']
 robots = {
@@ -44,15 +124,16 @@ robots = {
         "name":   r['name'],
         "color":  r['color'],
         "marker": r['marker'],
-        "x": 0.0, "y": 0.0,
+        "x": 0.0, "y": 0.0, "heading": 0.0,
         "active": False,
+        "trail":  Trail(),
     }
     for rid, r in _robot_cfg.items()
 }
 
 # ── UDP socket ────────────────────────────────────────────────────────────────
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind(('localhost', 5555))
+sock.bind(('localhost', POSITION_PORT))
 sock.setblocking(False)
 
 # ── Figure ────────────────────────────────────────────────────────────────────
@@ -68,10 +149,15 @@ floor_rect = patches.Rectangle(
 )
 ax.add_patch(floor_rect)
 
-for x in np.arange(X_MIN, X_MAX + GRID_RESOLUTION, GRID_RESOLUTION):
-    ax.axvline(x, color='lightgray', linewidth=0.3)
-for y in np.arange(Y_MIN, Y_MAX + GRID_RESOLUTION, GRID_RESOLUTION):
-    ax.axhline(y, color='lightgray', linewidth=0.3)
+# Grid overlay as one artist rather than one axvline/axhline per line
+_xs = np.arange(X_MIN, X_MAX + GRID_RESOLUTION, GRID_RESOLUTION)
+_ys = np.arange(Y_MIN, Y_MAX + GRID_RESOLUTION, GRID_RESOLUTION)
+_lo_y, _hi_y = Y_MIN - 0.5, Y_MAX + 0.5
+_lo_x, _hi_x = X_MIN - 0.5, X_MAX + 0.5
+ax.add_collection(LineCollection(
+    [[(x, _lo_y), (x, _hi_y)] for x in _xs] + [[(_lo_x, y), (_hi_x, y)] for y in _ys],
+    colors='lightgray', linewidths=0.3
+))
 
 boundary = patches.Rectangle(
     (X_MIN, Y_MIN), FLOOR_WIDTH, FLOOR_HEIGHT,
@@ -84,10 +170,14 @@ ax.set_ylabel('Y (meters)')
 
 # ── Legend + markers (built from config) ──────────────────────────────────────
 legend_elements = [patches.Patch(facecolor='#f0f0f0', edgecolor='black', label='Floor')]
+# Every robot's trail lives in one collection, so a frame is a single set_segments/set_color
+trail_lines = LineCollection([], linewidths=1.5, zorder=4)
+ax.add_collection(trail_lines)
+trail_rgba = {rid: np.array(mcolors.to_rgba(r['color'])) for rid, r in robots.items()}
 markers = {}
 for rid, r in robots.items():
-    fmt = r['color'][0] + r['marker']
-    line, = ax.plot([], [], fmt, markersize=10, zorder=5, label=r['name'])
+    line, = ax.plot([], [], linestyle='none', marker=r['marker'], color=r['color'],
+                    markersize=10, zorder=5, label=r['name'])
     markers[rid] = line
     legend_elements.append(
         plt.Line2D([0], [0], marker=r['marker'], color='w',
@@ -95,31 +185,54 @@ for rid, r in robots.items():
     )
 
 ax.legend(handles=legend_elements, loc='upper right')
-title_text = ax.set_title(f'{WORLD_NAME} | Waiting for robots...')
+ax.set_title(WORLD_NAME)
+# Status lives inside the axes: blitting restores only the axes area, so a changing title would smear
+status_text = ax.text(
+    0.01, 0.99, 'Waiting for robots...', transform=ax.transAxes, va='top', ha='left',
+    fontsize=8, zorder=6, bbox=dict(facecolor='white', alpha=0.7, edgecolor='none')
+)
 
 plt.tight_layout()
 
 print(f"World: {WORLD_NAME}")
 print(f"Floor bounds: X=[{X_MIN:.2f}, {X_MAX:.2f}], Y=[{Y_MIN:.2f}, {Y_MAX:.2f}]")
 print(f"Grid resolution: {GRID_RESOLUTION}m")
-print("Listening on UDP :5555 for robot positions...")
+print(f"Listening on UDP :{POSITION_PORT} for robot positions...")
 for rid, r in robots.items():
     print(f"  Robot ID {rid} ({r['name']}) = {r['color']} {r['marker']}")
 
 recv_count = 0
+frame_stamp = None
+fps = 0.0
+status_stamp = -math.inf
+
+# Metrics (no-op unless DAL_METRICS is set)
+metrics = make_metrics('robot_pos_viz', tool_port('robot_pos_viz'))
+metrics.counter('dal_packets_received_total', 'Position packets received').set_function(lambda: recv_count)
+metrics.gauge('dal_robots_active', 'Robots seen since start').set_function(
+    lambda: sum(r['active'] for r in robots.values()))
+m_frame = metrics.histogram('dal_frame_seconds', 'Render time per frame')
 
 
-def update(frame):
-    global recv_count
+def update():
+    global recv_count, frame_stamp, fps, status_stamp
+    now = time.perf_counter()
+    if frame_stamp is not None and now > frame_stamp:
+        fps += FPS_SMOOTHING * (1.0 / (now - frame_stamp) - fps)
+    frame_stamp = now
 
+    t = time.monotonic()
     while True:
         try:
-            data, _ = sock.recvfrom(4096)
-            robot_id, x, y, _ = struct.unpack_from('Bfff', data)
-            if robot_id in robots:
-                robots[robot_id]['x'] = x
-                robots[robot_id]['y'] = y
-                robots[robot_id]['active'] = True
+            data, _ = sock.recvfrom(65535)
+            pose = parse_pose(data)
+            if pose is not None and pose[0] in robots:
+                robot_id, x, y, heading = pose
+                r = robots[robot_id]
+                r['x'], r['y'], r['heading'] = x, y, heading
+                r['active'] = True
+                if t - r['trail'].last_t >= TRAIL_INTERVAL:
+                    r['trail'].append(t, x, y, heading)
 
             recv_count += 1
             if recv_count % 400 == 0:
@@ -133,21 +246,69 @@ def update(frame):
         except Exception:
             break
 
+    segments = []
+    colors = []
     for rid, r in robots.items():
-        if r['active']:
-            markers[rid].set_xdata([r['x']])
-            markers[rid].set_ydata([r['y']])
+        if not r['active']:
+            continue
+        markers[rid].set_xdata([r['x']])
+        markers[rid].set_ydata([r['y']])
+        pts = r['trail'].ordered()
+        pts = pts[pts[:, 0] >= t - TRAIL_SECONDS]
+        if len(pts) < 2:
+            continue
+        # Split by age into bands that share one end point, so the trail stays continuous
+        band = np.minimum(((t - pts[:, 0]) * (TRAIL_BANDS / TRAIL_SECONDS)).astype(int), TRAIL_BANDS - 1)
+        cuts = np.flatnonzero(np.diff(band)) + 1
+        starts = np.concatenate(([0], cuts))
+        ends = np.concatenate((cuts, [len(pts)]))
+        for a, b in zip(starts, ends):
+            chunk = pts[max(a - 1, 0):b, 1:3]
+            if len(chunk) < 2:
+                continue
+            segments.append(chunk)
+            rgba = trail_rgba[rid].copy()
+            rgba[3] = TRAIL_ALPHA * (1.0 - band[a] / TRAIL_BANDS)
+            colors.append(rgba)
+    trail_lines.set_segments(segments)
+    if colors:
+        trail_lines.set_color(colors)
+
+    if t - status_stamp < STATUS_INTERVAL:
+        return
+    status_stamp = t
+    if READOUT:
+        parts = [
+            f"{r['name']}: ({r['x']:.2f}, {r['y']:.2f}) {r['trail'].speed(t):.2f} m/s "
+            f"{math.degrees(r['heading']):.0f}°"
+            for r in robots.values() if r['active']
+        ]
+    else:
+        parts = [
+            f"{r['name']}: ({r['x']:.2f}, {r['y']:.2f})"
+            for r in robots.values() if r['active']
+        ]
+    status = ('\n' if READOUT else ' | ').join(parts) if parts else 'Waiting for robots...'
+    status_text.set_text(f"{status}\n{fps:.1f} FPS")
+    blitter.invalidate_overlays()
+
+
+blitter = BlitManager(fig.canvas, [trail_lines] + list(markers.values()), overlays=[status_text])
 
-    parts = [
-        f"{r['name']}: ({r['x']:.2f}, {r['y']:.2f})"
-        for r in robots.values() if r['active']
-    ]
-    title_text.set_text(f"{WORLD_NAME} | {' | '.join(parts)}" if parts else f"{WORLD_NAME} | Waiting for robots...")
 
-    return list(markers.values()) + [title_text]
+def on_frame():
+    t0 = time.perf_counter()
+    update()
+    if BLIT_ENABLED:
+        blitter.update()
+    else:
+        blitter.redraw_background()
+    m_frame.observe(time.perf_counter() - t0)
 
 
-ani = animation.FuncAnimation(fig, update, interval=50, blit=False, cache_frame_data=False)
+timer = fig.canvas.new_timer(interval=FRAME_INTERVAL)
+timer.add_callback(on_frame)
+timer.start()
 
 try:
     plt.show()
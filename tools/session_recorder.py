@@ -0,0 +1,224 @@
+"""Session recorder: captures the position+LIDAR and camera streams (and optionally planner commands) to a log.
+
+Usage:
+    python tools/session_recorder.py [<log_path>] [--no-camera] [--raw] [--proxy <id>[,<id>...]]
+
+Binds UDP :5555 and :5556 like the viewers, so run it instead of them and
+look at the run afterwards with tools/session_replay.py. Every datagram is
+stored unchanged with its receive time; the default log is
+logs/session_<date>_<time>.rlog, with its index next to it (.rlog.idx).
+
+--no-camera   record positions only (camera frames are ~95% of the bytes)
+--raw         store chunks uncompressed (bigger, but replay never inflates)
+--proxy 0,1   also record planner <-> controller traffic for those robots:
+              the recorder listens on PROXY_PORT_BASE + id and forwards to the
+              controller on COMMAND_PORT_BASE + id. Start the planner with
+              DAL_WAYPOINT_PORT=6200 so it connects to the proxy.
+
+Receiver threads only stamp and queue packets; a writer thread takes the
+whole queue every WRITE_INTERVAL and writes it as chunks (utils/session_log.py),
+so compression and disk I/O never hold up a socket.
+"""
+
+import sys
+import os
+import time
+import socket
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.protocol import POSITION_PORT, CAMERA_PORT, COMMAND_PORT_BASE, PROXY_PORT_BASE
+from utils.command_proxy import CommandProxy, TO_CONTROLLER
+from utils.metrics import make_metrics, tool_port
+from utils.session_log import (
+    SessionWriter, index_path, NO_ROBOT, STREAM_NAMES,
+    STREAM_POSITION, STREAM_CAMERA, STREAM_COMMAND, STREAM_REPLY
+)
+
+HOST = 'localhost'
+LOG_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs'))
+
+RECV_BUFFER = 8 << 20      # bytes — kernel socket buffer, absorbs writer stalls
+WRITE_INTERVAL = 0.05      # seconds between writer passes over the queue
+MAX_PENDING = 512 << 20    # bytes queued for the writer before new packets are dropped
+STATS_INTERVAL = 5.0       # seconds between console reports
+SOCKET_TIMEOUT = 0.2       # seconds — how often blocked threads check for shutdown
+
+
+class RecordQueue:
+    """Hand-off between receiver threads and the writer: append under a lock, swap the whole list out."""
+
+    def __init__(self, max_bytes=MAX_PENDING):
+        self.lock = threading.Lock()
+        self.items = []
+        self.bytes = 0
+        self.max_bytes = max_bytes
+        self.dropped = 0
+
+    def put(self, t, stream, robot_id, data):
+        with self.lock:
+            if self.bytes + len(data) > self.max_bytes:
+                self.dropped += 1
+                return
+            self.items.append((t, stream, robot_id, data))
+            self.bytes += len(data)
+
+    def take(self):
+        with self.lock:
+            items, self.items, self.bytes = self.items, [], 0
+        return items
+
+
+class Recorder:
+    def __init__(self, path, camera=True, compress=True, proxy_ids=()):
+        self.t0 = time.monotonic()
+        self.writer = SessionWriter(path, time.time(), compress=compress)
+        self.queue = RecordQueue()
+        self.stop_event = threading.Event()
+        self.counts = {s: 0 for s in STREAM_NAMES}   # updated by the writer thread only
+        self.threads = [threading.Thread(target=self._write, name='writer', daemon=True)]
+        self.sockets = []
+        streams = [(POSITION_PORT, STREAM_POSITION)]
+        if camera:
+            streams.append((CAMERA_PORT, STREAM_CAMERA))
+        for port, stream in streams:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+            sock.bind((HOST, port))
+            sock.settimeout(SOCKET_TIMEOUT)
+            self.sockets.append(sock)
+            self.threads.append(threading.Thread(target=self._receive, args=(sock, stream),
+                                                 name=f'udp-{port}', daemon=True))
+        self.proxies = [CommandProxy(robot_id, self._on_proxy_data, self.stop_event, HOST)
+                        for robot_id in proxy_ids]
+
+        # Metrics (no-op unless DAL_METRICS is set); the recorder's own counters are read when scraped
+        metrics = make_metrics('session_recorder', tool_port('session_recorder'))
+        records = metrics.counter('dal_records_total', 'Packets written to the log', ('stream',))
+        for stream, name in STREAM_NAMES.items():
+            records.labels(name).set_function(lambda stream=stream: self.counts[stream])
+        metrics.counter('dal_packets_dropped_total', 'Packets dropped with MAX_PENDING queued').set_function(
+            lambda: self.queue.dropped)
+        metrics.gauge('dal_queue_bytes', 'Packet bytes waiting for the writer').set_function(lambda: self.queue.bytes)
+        log_bytes = metrics.counter('dal_log_bytes_total', 'Log payload bytes before (raw) and after (stored) '
+                                    'compression', ('kind',))
+        log_bytes.labels('raw').set_function(lambda: self.writer.raw_bytes)
+        log_bytes.labels('stored').set_function(lambda: self.writer.stored_bytes)
+        self.m_write = metrics.histogram('dal_write_seconds', 'Writer pass over the queue')
+
+    def now(self):
+        return time.monotonic() - self.t0
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        for proxy in self.proxies:
+            proxy.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for proxy in self.proxies:
+            proxy.close()
+        for t in self.threads:
+            t.join(timeout=2.0)
+        for sock in self.sockets:
+            sock.close()
+        self.writer.close()
+
+    def _receive(self, sock, stream):
+        while not self.stop_event.is_set():
+            try:
+                data = sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            # Position and camera packets both start with the robot id byte
+            self.queue.put(self.now(), stream, data[0] if data else NO_ROBOT, data)
+
+    def _on_proxy_data(self, direction, robot_id, data):
+        stream = STREAM_COMMAND if direction == TO_CONTROLLER else STREAM_REPLY
+        self.queue.put(self.now(), stream, robot_id, data)
+
+    def _write(self):
+        # Runs until stop, then one last pass so nothing queued is lost
+        while True:
+            stopping = self.stop_event.wait(WRITE_INTERVAL)
+            t0 = time.perf_counter()
+            for t, stream, robot_id, data in self.queue.take():
+                self.writer.append(t, stream, robot_id, data)
+                self.counts[stream] += 1
+            self.m_write.observe(time.perf_counter() - t0)
+            if stopping:
+                return
+
+
+def report(rec, last):
+    """Per-stream record rates since the previous report, log size and drops."""
+    now = time.monotonic()
+    dt = max(now - last.get('time', rec.t0), 1e-6)
+    rates = ' | '.join(f"{STREAM_NAMES[s]} {(n - last.get(s, 0)) / dt:.0f}/s"
+                       for s, n in rec.counts.items() if n)
+    w = rec.writer
+    print(f"[REC] {rec.now():.0f}s | {rates or 'no packets yet'} | {w.records} records in "
+          f"{w.chunks} chunks | {w.raw_bytes / 1e6:.1f} MB -> {w.stored_bytes / 1e6:.1f} MB | "
+          f"dropped {rec.queue.dropped}")
+    last.update(rec.counts)
+    last['time'] = now
+
+
+def main():
+    args = sys.argv[1:]
+    camera = '--no-camera' not in args
+    compress = '--raw' not in args
+    proxy_ids = []
+    if '--proxy' in args:
+        i = args.index('--proxy')
+        try:
+            proxy_ids = [int(r) for r in args[i + 1].split(',')]
+        except (IndexError, ValueError):
+            print(__doc__)
+            sys.exit(1)
+        del args[i:i + 2]
+    args = [a for a in args if a not in ('--no-camera', '--raw')]
+    if len(args) > 1:
+        print(__doc__)
+        sys.exit(1)
+    if args:
+        path = args[0]
+    else:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        path = os.path.join(LOG_DIR, time.strftime('session_%Y%m%d_%H%M%S.rlog'))
+
+    try:
+        rec = Recorder(path, camera=camera, compress=compress, proxy_ids=proxy_ids)
+    except OSError as e:
+        print(f"ERROR: Could not open sockets: {e} (is a viewer or another recorder running?)")
+        sys.exit(1)
+    print(f"Recording to {path} (index {index_path(path)})")
+    print(f"  UDP :{POSITION_PORT} position+LIDAR" + (f", :{CAMERA_PORT} camera" if camera else ""))
+    for robot_id in proxy_ids:
+        print(f"  TCP :{PROXY_PORT_BASE + robot_id} -> :{COMMAND_PORT_BASE + robot_id} commands for robot {robot_id}")
+    if proxy_ids:
+        print(f"  Start planners with DAL_WAYPOINT_PORT={PROXY_PORT_BASE}")
+    print("Ctrl+C to stop.")
+
+    rec.start()
+    last = {}
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            report(rec, last)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        rec.stop()
+        w = rec.writer
+        print(f"Saved {w.records} records ({rec.now():.1f} s) to {path}: "
+              f"{w.raw_bytes / 1e6:.1f} MB of packets in {w.stored_bytes / 1e6:.1f} MB, "
+              f"{rec.queue.dropped} dropped")
+
+
+if __name__ == '__main__':
+    main()
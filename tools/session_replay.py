@@ -0,0 +1,166 @@
+"""Session replay: re-sends a recorded session log on the standard UDP ports, so the viewers run unchanged.
+
+Usage:
+    python tools/session_replay.py <log> [--speed N | --max] [--start s] [--end s]
+                                   [--robots 0,2] [--no-camera] [--info]
+
+--speed N     play N times faster than recorded (default 1 = real time)
+--max         send as fast as possible, e.g. to benchmark slam_viz --headless
+--start/--end play only this part of the session (seconds since recording began);
+              --start seeks through the log's index, no earlier chunk is read
+--robots      replay only these robot ids
+--no-camera   skip camera frames (UDP 5556)
+--info        print the log's duration, robots and record counts, then exit
+
+Position+LIDAR records go to UDP :5555 and camera frames to :5556, exactly
+as recorded. Proxied command traffic is in the log but is not replayed
+(the viewers never see it). The log is memory-mapped, so even a multi-GB
+session starts immediately and only the chunks being played are read.
+"""
+
+import sys
+import os
+import time
+import socket
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.protocol import POSITION_PORT, CAMERA_PORT
+from utils.session_log import (
+    SessionReader, STREAM_NAMES, STREAM_POSITION, STREAM_CAMERA
+)
+from utils.metrics import make_metrics, tool_port, NullRegistry
+
+HOST = 'localhost'
+STATS_INTERVAL = 5.0    # seconds between console reports
+MIN_SLEEP = 0.001       # seconds — closer deadlines are sent at once instead of sleeping
+
+PORTS = {STREAM_POSITION: POSITION_PORT, STREAM_CAMERA: CAMERA_PORT}
+
+
+def parse_args(argv):
+    opts = {'speed': 1.0, 'start': 0.0, 'end': None, 'robots': None,
+            'camera': True, 'info': False}
+    args = list(argv)
+    try:
+        for flag in ('--speed', '--start', '--end', '--robots'):
+            if flag in args:
+                i = args.index(flag)
+                value = args[i + 1]
+                del args[i:i + 2]
+                if flag == '--robots':
+                    opts['robots'] = {int(r) for r in value.split(',')}
+                else:
+                    opts[flag[2:]] = float(value)
+    except (IndexError, ValueError):
+        return None
+    if '--max' in args:
+        opts['speed'] = None
+    opts['camera'] = '--no-camera' not in args
+    opts['info'] = '--info' in args
+    args = [a for a in args if a not in ('--max', '--no-camera', '--info')]
+    if len(args) != 1 or (opts['speed'] is not None and opts['speed'] <= 0):
+        return None
+    opts['path'] = args[0]
+    return opts
+
+
+def print_info(log):
+    index = log.index
+    stored = os.path.getsize(log.path)
+    print(f"{log.path}")
+    print(f"  recorded {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(log.start_wall))}, "
+          f"{log.duration:.1f} s, {log.records} records in {len(index)} chunks, {stored / 1e6:.1f} MB")
+    print(f"  robots: {', '.join(map(str, log.robot_ids())) or 'none'}")
+    # The index has no per-stream counts, so this pass reads the whole log
+    counts = {}
+    for _, stream, _, _ in log.read():
+        counts[stream] = counts.get(stream, 0) + 1
+    for stream, n in sorted(counts.items()):
+        print(f"  {STREAM_NAMES.get(stream, stream)}: {n}")
+
+
+def replay(log, speed=1.0, start=0.0, end=None, robots=None, camera=True, metrics=None):
+    """Send the selected records, paced by their receive times.
+
+    Returns ({stream: packets sent}, bytes sent, wall seconds, session seconds covered).
+    """
+    streams = {STREAM_POSITION, STREAM_CAMERA} if camera else {STREAM_POSITION}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sent = {s: 0 for s in streams}
+    sent_bytes = 0
+    metrics = metrics or NullRegistry()
+    m_packets = metrics.counter('dal_packets_sent_total', 'Packets sent', ('stream',))
+    m_bytes = metrics.counter('dal_bytes_sent_total', 'Packet bytes sent', ('stream',))
+    for s in streams:
+        m_packets.labels(STREAM_NAMES[s]).set_function(lambda s=s: sent[s])
+    count_bytes = {s: m_bytes.labels(STREAM_NAMES[s]).inc for s in streams}
+    m_session_time = metrics.gauge('dal_session_time_seconds', 'Receive time of the last packet sent')
+    wall0 = time.monotonic()
+    t_first = None
+    last_report = wall0
+    try:
+        for t, stream, robot_id, data in log.read(start=start, end=end, robots=robots, streams=streams):
+            if t_first is None:
+                t_first = t
+            if speed is not None:
+                delay = wall0 + (t - t_first) / speed - time.monotonic()
+                if delay > MIN_SLEEP:
+                    time.sleep(delay)
+            sock.sendto(data, (HOST, PORTS[stream]))
+            sent[stream] += 1
+            sent_bytes += len(data)
+            count_bytes[stream](len(data))
+            m_session_time.set(t)
+            now = time.monotonic()
+            if now - last_report >= STATS_INTERVAL:
+                last_report = now
+                behind = 0.0 if speed is None else now - (wall0 + (t - t_first) / speed)
+                print(f"[REPLAY] session {t:.1f}s | "
+                      + ' | '.join(f"{STREAM_NAMES[s]} {n}" for s, n in sent.items())
+                      + f" | {sent_bytes / 1e6 / (now - wall0):.1f} MB/s"
+                      + (f" | {1000 * behind:.0f} ms behind" if behind > 0.05 else ""))
+    finally:
+        sock.close()
+    elapsed = time.monotonic() - wall0
+    return sent, sent_bytes, elapsed, (t - t_first if t_first is not None else 0.0)
+
+
+def main():
+    opts = parse_args(sys.argv[1:])
+    if opts is None:
+        print(__doc__)
+        sys.exit(1)
+    try:
+        log = SessionReader(opts['path'])
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    if opts['info']:
+        print_info(log)
+        log.close()
+        return
+
+    speed = opts['speed']
+    print(f"Replaying {opts['path']} ({log.duration:.1f} s, robots "
+          f"{', '.join(map(str, sorted(opts['robots'] or log.robot_ids())))}) at "
+          f"{'max speed' if speed is None else f'{speed:g}x'} from {opts['start']:.1f} s")
+    print(f"  -> UDP :{POSITION_PORT}" + (f", :{CAMERA_PORT}" if opts['camera'] else ""))
+    try:
+        sent, sent_bytes, elapsed, span = replay(log, speed, opts['start'], opts['end'],
+                                                 opts['robots'], opts['camera'],
+                                                 make_metrics('session_replay', tool_port('session_replay')))
+    except KeyboardInterrupt:
+        print("\nStopped by user")
+        log.close()
+        return
+    total = sum(sent.values())
+    print(f"Sent {total} packets ({sent_bytes / 1e6:.1f} MB) covering {span:.1f} s of session in "
+          f"{elapsed:.1f} s: {total / max(elapsed, 1e-6):.0f} packets/s, "
+          f"{span / max(elapsed, 1e-6):.1f}x real time")
+    log.close()
+
+
+if __name__ == '__main__':
+    main()
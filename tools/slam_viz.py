@@ -1,27 +1,56 @@
-"""SLAM Viz — 2D occupancy grid + robot positions. Receives position + LIDAR via UDP from waypoint_controller."""
+"""SLAM Viz — 2D occupancy grid + robot positions. Receives position + LIDAR via UDP from waypoint_controller.
+
+Packets are received on their own thread and scans are ray cast into the
+grid on a mapping thread, so a slow frame never stalls ingestion. The window
+redraws from a double-buffered snapshot of the grid at its own frame rate.
+
+Usage:
+    python tools/slam_viz.py <world>
+    python tools/slam_viz.py <world> --headless [--out <map_prefix>] [--interval <seconds>]
+
+--headless builds the map without a window (matplotlib is never imported)
+and writes <map_prefix>.npy/.json/.png every --interval seconds and at exit.
+The default prefix is maps/<world>.
+"""
 
 import sys
 import os
 import math
 import json
+import time
+import queue
+import threading
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-import matplotlib
-matplotlib.use('TkAgg')
-
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import matplotlib.animation as animation
-import matplotlib.colors as mcolors
 import numpy as np
 import socket
 
 from utils.protocol import POSITION_PORT, unpack_position
 from utils.occupancy_grid import OccupancyGrid
+from utils.blit_manager import BlitManager
+from utils.metrics import make_metrics, tool_port
+
+# ── Command line ───────────────────────────────────────────────────────────────
+_args = sys.argv[1:]
+HEADLESS = '--headless' in _args
+_out = None
+_interval = None
+for _flag in ('--out', '--interval'):
+    if _flag in _args:
+        _i = _args.index(_flag)
+        if _i + 1 >= len(_args):
+            print(__doc__)
+            sys.exit(1)
+        if _flag == '--out':
+            _out = _args[_i + 1]
+        else:
+            _interval = float(_args[_i + 1])
+        del _args[_i:_i + 2]
+_args = [a for a in _args if a != '--headless']
 
 # ── Load world config ──────────────────────────────────────────────────────────
-_world = sys.argv[1] if len(sys.argv) > 1 else 'dal-factory'
+_world = _args[0] if _args else 'dal-factory'
 _cfg_path = os.path.join(os.path.dirname(__file__), '..', 'world_configs', f'{_world}.json')
 
 try:
@@ -48,6 +77,22 @@ GRID_RESOLUTION = 0.15
 LIDAR_ANGLE_MIN = math.pi
 LIDAR_MAX_RANGE = _cfg.get('lidar_max_range', 3.5)
 
+QUEUE_SIZE       = 256      # scans buffered between receiver and mapper; the oldest is dropped when full
+PUBLISH_INTERVAL = 0.05     # seconds — how often the mapper publishes a grid snapshot
+STATS_INTERVAL   = 5.0      # seconds between ingest / render reports
+RECV_BUFFER      = 4 << 20  # bytes — kernel receive buffer, absorbs bursts while the receiver is descheduled
+
+# Rendering
+FRAME_INTERVAL   = 80       # ms between frames
+BLIT_ENABLED     = True     # per frame, blit robots + status over a cached background (axes, legend, map)
+MAP_REFRESH      = 0.5      # seconds — the cached background (with the map) is redrawn at most this often
+FPS_SMOOTHING    = 0.1      # weight of the newest frame in the displayed FPS
+
+# Headless mode
+SAVE_INTERVAL = _interval if _interval is not None else 10.0   # seconds between map exports
+SAVE_PREFIX   = _out or os.path.join(os.path.dirname(__file__), '..', 'maps', _world)
+PNG_SCALE     = 4                                               # pixels per cell in the exported PNG
+
 # ── Socket + occupancy grid ────────────────────────────────────────────────────
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 try:
@@ -57,7 +102,8 @@ except OSError as e:
     print(f"[DEBUG] SOCKET BIND FAILED on port {POSITION_PORT}: {e}")
     print(f"[DEBUG] Is grid_visualization.py or another tool already running on this port?")
     sys.exit(1)
-sock.setblocking(False)
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+sock.settimeout(0.2)  # lets the receiver thread notice shutdown
 
 occ_grid = OccupancyGrid(X_MIN, X_MAX, Y_MIN, Y_MAX, resolution=GRID_RESOLUTION)
 
@@ -67,13 +113,215 @@ robots = {
         "name":    r['name'],
         "color":   r['color'],
         "marker":  r['marker'],
-        "x": 0.0, "y": 0.0, "heading": 0.0,
+        "pose":    (0.0, 0.0, 0.0),   # (x, y, heading), replaced as a whole by the receiver thread
         "active":  False,
     }
     for rid, r in _cfg['robots'].items()
 }
 
+
+class MapSnapshot:
+    """Double-buffered copy of occ_grid.grid: the mapper fills back and swaps, readers take front."""
+
+    def __init__(self, grid):
+        self.lock = threading.Lock()
+        self.front = grid.copy()
+        self._back = grid.copy()
+        self.version = 0
+
+    def publish(self, grid):
+        np.copyto(self._back, grid)      # outside the lock: readers only ever touch front
+        with self.lock:
+            self.front, self._back = self._back, self.front
+            self.version += 1
+
+
+class Ingest:
+    """Receiver thread (UDP -> robot poses + scan queue) and mapping thread (scan queue -> occ_grid)."""
+
+    def __init__(self, sock, grid, robots):
+        self.sock = sock
+        self.grid = grid
+        self.robots = robots
+        self.snapshot = MapSnapshot(grid.grid)
+        self.scans = queue.Queue(maxsize=QUEUE_SIZE)
+        self.stop_event = threading.Event()
+        self.received = 0    # datagrams read from the socket
+        self.mapped = 0      # scans ray cast into the grid
+        self.dropped = 0     # scans dropped because the mapper fell QUEUE_SIZE behind
+        self.bad = 0         # datagrams that failed to unpack
+        self.threads = [threading.Thread(target=self._receive, name='receiver', daemon=True),
+                        threading.Thread(target=self._map, name='mapper', daemon=True)]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for t in self.threads:
+            t.join(timeout=1.0)
+
+    def _receive(self):
+        while not self.stop_event.is_set():
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.received += 1
+
+            # First 5 packets — print raw info
+            if self.received <= 5:
+                print(f"[DEBUG] Packet #{self.received}: {len(data)} bytes from {addr}")
+            try:
+                robot_id, x, y, heading, lidar_ranges = unpack_position(data)
+            except Exception as e:
+                self.bad += 1
+                print(f"[DEBUG] unpack error: {e}")
+                continue
+
+            # First 5 packets — print parsed content
+            if self.received <= 5:
+                print(f"[DEBUG]   robot_id={robot_id}  x={x:.2f}  y={y:.2f}  lidar_pts={len(lidar_ranges)}")
+
+            r = self.robots.get(robot_id)
+            if r is None:
+                if self.received <= 10:
+                    print(f"[DEBUG]   robot_id={robot_id} NOT in robots dict {list(self.robots.keys())}")
+                continue
+            r['pose'] = (x, y, heading)   # one assignment, so readers never see a torn pose
+            r['active'] = True
+
+            if len(lidar_ranges) > 0 and robot_id == 0:
+                scan = (x, y, heading, lidar_ranges)
+                try:
+                    self.scans.put_nowait(scan)
+                except queue.Full:
+                    # Keep the newest scans: a stale scan is worth less than a fresh one
+                    try:
+                        self.scans.get_nowait()
+                    except queue.Empty:
+                        pass
+                    self.dropped += 1
+                    self.scans.put_nowait(scan)
+
+    def _map(self):
+        dirty = False
+        last_publish = 0.0
+        while not self.stop_event.is_set():
+            try:
+                x, y, heading, lidar_ranges = self.scans.get(timeout=PUBLISH_INTERVAL)
+                inc = -(2.0 * math.pi / len(lidar_ranges))
+                t0 = time.perf_counter()
+                self.grid.update_from_lidar(
+                    x, y, heading, lidar_ranges,
+                    angle_min=LIDAR_ANGLE_MIN,
+                    angle_increment=inc,
+                    max_range=LIDAR_MAX_RANGE
+                )
+                m_grid_update.observe(time.perf_counter() - t0)
+                self.mapped += 1
+                dirty = True
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if dirty and now - last_publish >= PUBLISH_INTERVAL:
+                self.snapshot.publish(self.grid.grid)
+                last_publish = now
+                dirty = False
+
+ingest = Ingest(sock, occ_grid, robots)
+
+# Metrics (no-op unless DAL_METRICS is set); Ingest's own counters are read only when scraped
+metrics = make_metrics('slam_viz', tool_port('slam_viz'))
+metrics.counter('dal_packets_received_total', 'Position packets received').set_function(lambda: ingest.received)
+metrics.counter('dal_scans_mapped_total', 'Scans ray cast into the grid').set_function(lambda: ingest.mapped)
+metrics.counter('dal_scans_dropped_total', 'Scans dropped because the mapper fell behind').set_function(lambda: ingest.dropped)
+metrics.counter('dal_bad_packets_total', 'Packets that failed to unpack').set_function(lambda: ingest.bad)
+metrics.gauge('dal_queue_depth', 'Scans waiting for the mapper').set_function(lambda: ingest.scans.qsize())
+m_grid_update = metrics.histogram('dal_grid_update_seconds', 'OccupancyGrid.update_from_lidar per scan')
+m_frame = metrics.histogram('dal_frame_seconds', 'Render time per frame')
+frame_count = 0
+last_stats = {'t': time.monotonic(), 'frames': 0, 'received': 0, 'mapped': 0}
+
+
+def report_stats():
+    """Print ingest (and, with a window, render) throughput since the last report."""
+    now = time.monotonic()
+    dt = now - last_stats['t']
+    rx = (ingest.received - last_stats['received']) / dt
+    mapped = (ingest.mapped - last_stats['mapped']) / dt
+    fps = (frame_count - last_stats['frames']) / dt
+    last_stats.update(t=now, frames=frame_count, received=ingest.received, mapped=ingest.mapped)
+
+    free_pct = np.sum(ingest.snapshot.front < 0.3) / ingest.snapshot.front.size * 100
+    print(f"[INGEST] {rx:.0f} pkt/s | mapped {mapped:.0f} scans/s | "
+          f"queue {ingest.scans.qsize()}/{QUEUE_SIZE} | dropped {ingest.dropped} | mapped: {free_pct:.0f}% free")
+    if not HEADLESS:
+        print(f"[RENDER] {fps:.1f} FPS")
+
+
+def save_map(export):
+    """Write the latest snapshot to SAVE_PREFIX.{npy,json,png}; each file is replaced atomically."""
+    t0 = time.perf_counter()
+    with ingest.snapshot.lock:
+        np.copyto(export.grid, ingest.snapshot.front)
+    tmp = f"{SAVE_PREFIX}.{os.getpid()}.tmp"
+    export.save_snapshot(tmp)
+    export.save_png(f"{tmp}.png", scale=PNG_SCALE)
+    for ext in ('npy', 'json', 'png'):
+        os.replace(f"{tmp}.{ext}", f"{SAVE_PREFIX}.{ext}")
+    return 1000 * (time.perf_counter() - t0)
+
+
+def run_headless():
+    """Map without a window: export every SAVE_INTERVAL seconds and log throughput every STATS_INTERVAL."""
+    os.makedirs(os.path.dirname(os.path.abspath(SAVE_PREFIX)), exist_ok=True)
+    export = OccupancyGrid(X_MIN, X_MAX, Y_MIN, Y_MAX, resolution=GRID_RESOLUTION)
+    print(f"Headless: saving {SAVE_PREFIX}.npy/.json/.png every {SAVE_INTERVAL:.0f}s")
+    ingest.start()
+    next_save = time.monotonic() + SAVE_INTERVAL
+    try:
+        while True:
+            time.sleep(0.25)
+            now = time.monotonic()
+            if now - last_stats['t'] >= STATS_INTERVAL:
+                if ingest.received == 0:
+                    last_stats['t'] = now
+                    print("[DEBUG] No UDP packets received yet — is controller running?")
+                else:
+                    report_stats()
+            if now >= next_save:
+                next_save = now + SAVE_INTERVAL
+                print(f"[SAVE] {SAVE_PREFIX} ({ingest.mapped} scans) in {save_map(export):.0f} ms")
+    except KeyboardInterrupt:
+        print("\nStopped by user")
+    finally:
+        ingest.stop()
+        sock.close()
+        print(f"[SAVE] {SAVE_PREFIX} ({ingest.mapped} scans) in {save_map(export):.0f} ms")
+
+
+print(f"World: {WORLD_NAME}")
+print(f"Occupancy grid: {occ_grid.width}x{occ_grid.height} cells at {GRID_RESOLUTION}m resolution")
+print(f"Floor bounds: X=[{X_MIN:.2f}, {X_MAX:.2f}], Y=[{Y_MIN:.2f}, {Y_MAX:.2f}]")
+print(f"Listening on UDP :{POSITION_PORT} for position + LIDAR data...")
+
+if HEADLESS:
+    run_headless()
+    sys.exit(0)
+
 # ── Figure ────────────────────────────────────────────────────────────────────
+# Imported here so --headless never loads the plotting stack
+import matplotlib
+matplotlib.use('TkAgg')
+
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+import matplotlib.colors as mcolors
+
 fig, ax = plt.subplots(figsize=FIGURE_SIZE)
 
 ax.set_xlim(X_MIN - 0.3, X_MAX + 0.3)
@@ -111,8 +359,8 @@ legend_elements = [
     patches.Patch(facecolor=(0.8, 0.2, 0.2),    label='Obstacle'),
 ]
 for rid, r in robots.items():
-    fmt = r['color'][0] + r['marker']
-    line, = ax.plot([], [], fmt, markersize=8, zorder=5, label=r['name'])
+    line, = ax.plot([], [], linestyle='none', marker=r['marker'], color=r['color'],
+                    markersize=8, zorder=5, label=r['name'])
     hline, = ax.plot([], [], color=r['color'], linewidth=2, zorder=5)
     markers[rid]       = line
     heading_lines[rid] = hline
@@ -122,103 +370,123 @@ for rid, r in robots.items():
     )
 
 ax.legend(handles=legend_elements, loc='upper right', fontsize=7)
-title_text = ax.set_title(f'{WORLD_NAME} Visualizer | Waiting for data...')
+ax.set_title(f'{WORLD_NAME} Visualizer')
+# Status lives inside the axes: blitting restores only the axes area, so a changing title would smear
+status_text = ax.text(
+    0.01, 0.99, 'Waiting for data...', transform=ax.transAxes, va='top', ha='left',
+    fontsize=8, zorder=6, bbox=dict(facecolor='white', alpha=0.7, edgecolor='none')
+)
 
 plt.tight_layout()
 
-print(f"World: {WORLD_NAME}")
-print(f"Occupancy grid: {occ_grid.width}x{occ_grid.height} cells at {GRID_RESOLUTION}m resolution")
-print(f"Floor bounds: X=[{X_MIN:.2f}, {X_MAX:.2f}], Y=[{Y_MIN:.2f}, {Y_MAX:.2f}]")
-print(f"Listening on UDP :{POSITION_PORT} for position + LIDAR data...")
-
-recv_count = 0
-frame_count = 0
-
-
-def update(frame):
-    global recv_count, frame_count
+shown_version = -1
+shown_factor = 0
+frame_stamp = None
+fps = 0.0
+map_drawn = 0.0    # time.monotonic() of the last background (map) redraw
+
+
+def display_factor():
+    """Grid cells per screen pixel (rounded up), so the image is never larger than the axes on screen."""
+    box = ax.get_window_extent()
+    if box.width < 1 or box.height < 1:
+        return 1
+    return max(1, math.ceil(max(occ_grid.width / box.width, occ_grid.height / box.height)))
+
+
+def downsample_for_display(grid, factor):
+    """Shrink grid by factor, keeping in each block the cell most certain to be free or occupied.
+
+    Returns (image, extent). Blocks keep their strongest evidence, so thin walls survive;
+    the grid is padded with unknown (0.5) to a multiple of factor.
+    """
+    if factor == 1:
+        return grid, [X_MIN, X_MAX, Y_MIN, Y_MAX]
+    rows, cols = grid.shape
+    padded = np.pad(grid, ((0, (-rows) % factor), (0, (-cols) % factor)), constant_values=0.5)
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    hi = blocks.max(axis=(1, 3))
+    lo = blocks.min(axis=(1, 3))
+    image = np.where(hi - 0.5 >= 0.5 - lo, hi, lo)
+    cell = GRID_RESOLUTION * factor
+    return image, [X_MIN, X_MIN + image.shape[1] * cell, Y_MIN, Y_MIN + image.shape[0] * cell]
+
+
+def update():
+    """Refresh artists from the latest snapshot and poses. Returns True when the map image changed."""
+    global frame_count, shown_version, shown_factor, frame_stamp, fps
     frame_count += 1
-
-    packets_this_frame = 0
-    while True:
-        try:
-            data, addr = sock.recvfrom(65535)
-            packets_this_frame += 1
-            recv_count += 1
-
-            # First 5 packets — print raw info
-            if recv_count <= 5:
-                print(f"[DEBUG] Packet #{recv_count}: {len(data)} bytes from {addr}")
-
-            robot_id, x, y, heading, lidar_ranges = unpack_position(data)
-
-            # First 5 packets — print parsed content
-            if recv_count <= 5:
-                print(f"[DEBUG]   robot_id={robot_id}  x={x:.2f}  y={y:.2f}  lidar_pts={len(lidar_ranges)}")
-
-            if robot_id in robots:
-                robots[robot_id]['x']       = x
-                robots[robot_id]['y']       = y
-                robots[robot_id]['heading'] = heading
-                robots[robot_id]['active']  = True
-
-                if len(lidar_ranges) > 0 and robot_id == 0:
-                    inc = -(2.0 * math.pi / len(lidar_ranges))
-                    occ_grid.update_from_lidar(
-                        x, y, heading, lidar_ranges,
-                        angle_min=LIDAR_ANGLE_MIN,
-                        angle_increment=inc,
-                        max_range=LIDAR_MAX_RANGE
-                    )
-            else:
-                if recv_count <= 10:
-                    print(f"[DEBUG]   robot_id={robot_id} NOT in robots dict {list(robots.keys())}")
-
-        except BlockingIOError:
-            break
-        except Exception as e:
-            print(f"[DEBUG] unpack error: {e}")
-            break
+    now = time.perf_counter()
+    if frame_stamp is not None and now > frame_stamp:
+        fps += FPS_SMOOTHING * (1.0 / (now - frame_stamp) - fps)
+    frame_stamp = now
 
     # Print every 20 frames if nothing is arriving
-    if frame_count % 20 == 0 and recv_count == 0:
+    if frame_count % 20 == 0 and ingest.received == 0:
         print(f"[DEBUG] Frame {frame_count}: no UDP packets received yet — is controller running?")
 
-    if recv_count > 0 and recv_count % 500 == 0:
-        active = [
-            f"{r['name']}: ({r['x']:.1f},{r['y']:.1f})"
-            for r in robots.values() if r['active']
-        ]
-        free_pct = np.sum(occ_grid.grid < 0.3) / occ_grid.grid.size * 100
-        print(f"  {' | '.join(active)} | mapped: {free_pct:.0f}% free")
-
-    grid_img.set_data(occ_grid.grid)
+    if time.monotonic() - last_stats['t'] >= STATS_INTERVAL and ingest.received > 0:
+        report_stats()
+
+    # Re-render the image for a window resize, or for a new snapshot at most every MAP_REFRESH;
+    # set_data copies, so the lock is held only while the (downsampled) image is built
+    factor = display_factor()
+    map_changed = False
+    if factor != shown_factor or (ingest.snapshot.version != shown_version
+                                  and time.monotonic() - map_drawn >= MAP_REFRESH):
+        map_changed = True
+        with ingest.snapshot.lock:
+            shown_version = ingest.snapshot.version
+            image, extent = downsample_for_display(ingest.snapshot.front, factor)
+            grid_img.set_data(image)
+        if factor != shown_factor:
+            shown_factor = factor
+            grid_img.set_extent(extent)
 
     hlen = 0.3
     for rid, r in robots.items():
         if r['active']:
-            markers[rid].set_xdata([r['x']])
-            markers[rid].set_ydata([r['y']])
-            heading_lines[rid].set_xdata([r['x'], r['x'] + hlen * math.cos(r['heading'])])
-            heading_lines[rid].set_ydata([r['y'], r['y'] + hlen * math.sin(r['heading'])])
+            x, y, heading = r['pose']
+            markers[rid].set_xdata([x])
+            markers[rid].set_ydata([y])
+            heading_lines[rid].set_xdata([x, x + hlen * math.cos(heading)])
+            heading_lines[rid].set_ydata([y, y + hlen * math.sin(heading)])
 
     parts = [
-        f"{r['name']}: ({r['x']:.1f},{r['y']:.1f})"
+        f"{r['name']}: ({r['pose'][0]:.1f},{r['pose'][1]:.1f})"
         for r in robots.values() if r['active']
     ]
-    title_text.set_text(
-        f"{WORLD_NAME} Visualizer | {' | '.join(parts)}"
-        if parts else f"{WORLD_NAME} Visualizer | Waiting for data..."
-    )
+    rows, cols = grid_img.get_array().shape
+    status = ' | '.join(parts) if parts else 'Waiting for data...'
+    status_text.set_text(f"{status}\n{fps:.1f} FPS | map {cols}x{rows}")
+    return map_changed
+
+
+blitter = BlitManager(fig.canvas, list(markers.values()) + list(heading_lines.values()) + [status_text])
+
 
-    return [grid_img] + list(markers.values()) + list(heading_lines.values()) + [title_text]
+def on_frame():
+    global map_drawn
+    t0 = time.perf_counter()
+    if update():
+        map_drawn = time.monotonic()
+        blitter.redraw_background()
+    elif BLIT_ENABLED:
+        blitter.update()
+    else:
+        blitter.redraw_background()
+    m_frame.observe(time.perf_counter() - t0)
 
 
-ani = animation.FuncAnimation(fig, update, interval=80, blit=False, cache_frame_data=False)
+timer = fig.canvas.new_timer(interval=FRAME_INTERVAL)
+timer.add_callback(on_frame)
+timer.start()
 
+ingest.start()
 try:
     plt.show()
 except KeyboardInterrupt:
     print("\nStopped by user")
 finally:
+    ingest.stop()
     sock.close()
@@ -0,0 +1,125 @@
+"""Summarize controller step timing written by utils/step_profiler.py.
+
+Usage:
+    python tools/step_timing_summary.py prof.jsonl [more.jsonl ...]   # read files
+    python tools/step_timing_summary.py --listen                      # live, UDP :5557, Ctrl+C to print
+"""
+
+import sys
+import os
+import json
+import socket
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.protocol import TELEMETRY_PORT
+
+
+class PhaseStats:
+    def __init__(self, nbuckets):
+        self.hist = [0] * nbuckets
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+    def add(self, rec):
+        for i, c in enumerate(rec['hist']):
+            self.hist[i] += c
+        self.total_us += rec['total_us']
+        self.max_us = max(self.max_us, rec['max_us'])
+
+    def percentile(self, edges_us, q):
+        """Upper bucket edge containing the q-th percentile (inf for the overflow bucket)."""
+        n = sum(self.hist)
+        if n == 0:
+            return 0.0
+        target = q * n
+        seen = 0
+        for i, c in enumerate(self.hist):
+            seen += c
+            if seen >= target:
+                return edges_us[i] if i < len(edges_us) else float('inf')
+        return float('inf')
+
+
+robots = {}  # robot_id -> {"name", "steps", "wall_s", "edges", "phases": {phase: PhaseStats}}
+
+
+def ingest(record):
+    r = robots.setdefault(record['robot_id'], {
+        "name": record['name'], "steps": 0, "wall_s": 0.0,
+        "edges": record['edges_us'], "phases": {},
+    })
+    r['steps'] += record['steps']
+    r['wall_s'] += record['wall_s']
+    for phase, rec in record['phases'].items():
+        if phase not in r['phases']:
+            r['phases'][phase] = PhaseStats(len(rec['hist']))
+        r['phases'][phase].add(rec)
+
+
+def fmt_us(v):
+    return ">max" if v == float('inf') else f"{v:.0f}"
+
+
+def report():
+    if not robots:
+        print("No timing records.")
+        return
+    for rid in sorted(robots):
+        r = robots[rid]
+        steps = max(1, r['steps'])
+        step_us = sum(p.total_us for p in r['phases'].values()) / steps
+        rate = r['steps'] / r['wall_s'] if r['wall_s'] > 0 else 0.0
+        print(f"\nRobot {rid} ({r['name']}): {r['steps']} steps, {rate:.1f} steps/s, "
+              f"{step_us:.0f} us/step")
+        print(f"  {'phase':<10} {'mean_us':>9} {'p50':>7} {'p95':>7} {'p99':>7} {'max_us':>9} {'share':>6}")
+        for phase, p in sorted(r['phases'].items(), key=lambda kv: -kv[1].total_us):
+            mean = p.total_us / steps
+            share = 100.0 * mean / step_us if step_us > 0 else 0.0
+            print(f"  {phase:<10} {mean:>9.1f} {fmt_us(p.percentile(r['edges'], 0.50)):>7} "
+                  f"{fmt_us(p.percentile(r['edges'], 0.95)):>7} {fmt_us(p.percentile(r['edges'], 0.99)):>7} "
+                  f"{p.max_us:>9.0f} {share:>5.1f}%")
+    print("\nPercentiles are bucket upper edges (us). 'sim' is time spent inside robot.step().")
+
+
+def read_files(paths):
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    ingest(json.loads(line))
+
+
+def listen():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('localhost', TELEMETRY_PORT))
+    print(f"Listening on UDP :{TELEMETRY_PORT} for step timing... Ctrl+C to summarize")
+    count = 0
+    try:
+        while True:
+            data, _ = sock.recvfrom(65535)
+            ingest(json.loads(data.decode('utf-8')))
+            count += 1
+            if count % 20 == 0:
+                print(f"  {count} telemetry packets from {len(robots)} robots")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    if args[0] == '--listen':
+        listen()
+    else:
+        read_files(args)
+    report()
+
+
+if __name__ == '__main__':
+    main()
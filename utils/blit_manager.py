@@ -0,0 +1,73 @@
+"""Matplotlib blitting for the viewers: redraw only the moving artists over a cached background."""
+
+
+class BlitManager:
+    """Keeps a copy of everything that is not animated and blits the animated artists over it.
+
+    The background is captured after every full draw (first show, window resize,
+    or redraw_background), so static layers such as axes, legend and the map
+    image cost nothing per frame. Works with any canvas that supports blitting
+    (TkAgg, QtAgg, Agg); imports nothing, so it is cheap for tools that may
+    never open a window.
+
+    overlays are artists that change less often than every frame (status text):
+    they are drawn on top of the animated artists once, their pixels are kept,
+    and later frames paste those pixels back until invalidate_overlays() is
+    called. Text rendering is the most expensive thing a viewer draws, so a
+    long status box costs a copy instead of a layout per frame.
+    """
+
+    def __init__(self, canvas, artists, overlays=()):
+        self.canvas = canvas
+        self.artists = list(artists)
+        self.overlays = list(overlays)
+        self.background = None
+        self.overlay_pixels = None
+        for a in self.artists + self.overlays:
+            a.set_animated(True)
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.overlay_pixels = None
+        self._draw_animated()
+
+    def _draw_animated(self):
+        fig = self.canvas.figure
+        for a in self.artists:
+            fig.draw_artist(a)
+        if not self.overlays:
+            return
+        if self.overlay_pixels is not None:
+            self.canvas.restore_region(self.overlay_pixels)
+            return
+        renderer = self.canvas.get_renderer()
+        boxes = []
+        for a in self.overlays:
+            fig.draw_artist(a)
+            boxes.append(a.get_window_extent(renderer))
+            patch = getattr(a, 'get_bbox_patch', lambda: None)()
+            if patch is not None:
+                boxes.append(patch.get_window_extent(renderer))
+        bbox_cls = type(fig.bbox)
+        area = bbox_cls.intersection(bbox_cls.union(boxes).padded(1), fig.bbox)
+        if area is not None:
+            self.overlay_pixels = self.canvas.copy_from_bbox(area)
+
+    def invalidate_overlays(self):
+        """Re-render the overlays on the next frame (call after changing one of them)."""
+        self.overlay_pixels = None
+
+    def redraw_background(self):
+        """Full redraw after a static artist changed; the draw_event re-captures the background."""
+        self.canvas.draw()
+
+    def update(self):
+        """Restore the background, draw the animated artists and push the pixels to the screen."""
+        if self.background is None:
+            self.redraw_background()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_animated()
+        self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
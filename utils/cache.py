@@ -0,0 +1,66 @@
+"""On-disk cache shared by controllers, planners and tools (project_root/cache/)."""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'cache'))
+
+
+def cache_path(name):
+    """Absolute path of a cache entry; name may include a subdirectory, which is created."""
+    path = os.path.join(CACHE_DIR, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def file_digest(*paths):
+    """SHA-1 over the contents of one or more files (missing files hash as empty)."""
+    h = hashlib.sha1()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+        except OSError:
+            pass
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def load_json(name):
+    """Return the cached JSON object, or None if missing or unreadable."""
+    try:
+        with open(cache_path(name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_json(name, obj):
+    """Write atomically so concurrent controllers never read a partial file."""
+    path = cache_path(name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def load_arrays(name):
+    """Return the cached .npz as a dict of arrays, or None if missing or unreadable."""
+    try:
+        with np.load(cache_path(name)) as data:
+            return {k: data[k] for k in data.files}
+    except (OSError, ValueError):
+        return None
+
+
+def save_arrays(name, **arrays):
+    """np.savez (uncompressed, so loads are a memcpy) with the same atomic replace as save_json."""
+    path = cache_path(name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
@@ -0,0 +1,95 @@
+"""TCP pass-through between planners and a controller's command port, for tools that observe command traffic.
+
+Planners reach a proxy by starting with DAL_WAYPOINT_PORT=6200 (PROXY_PORT_BASE),
+see utils/protocol.py.
+"""
+
+import socket
+import threading
+
+from utils.protocol import COMMAND_PORT_BASE, PROXY_PORT_BASE
+
+TO_CONTROLLER = 'command'   # planner -> controller bytes
+TO_PLANNER = 'reply'        # controller -> planner bytes (REACHED, PROGRESS, ...)
+
+SOCKET_TIMEOUT = 0.2        # seconds — how often blocked threads check for shutdown
+
+
+class CommandProxy:
+    """Listens on PROXY_PORT_BASE + robot_id and forwards each connection to COMMAND_PORT_BASE + robot_id.
+
+    on_data(direction, robot_id, data) is called from the proxy's threads for
+    every read, before the bytes are forwarded, so it must be quick and
+    thread-safe. Reads are TCP segments, not lines.
+    """
+
+    def __init__(self, robot_id, on_data, stop_event, host='localhost'):
+        self.robot_id = robot_id
+        self.on_data = on_data
+        self.stop_event = stop_event
+        self.host = host
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, PROXY_PORT_BASE + robot_id))
+        self.server.listen(1)
+        self.server.settimeout(SOCKET_TIMEOUT)
+        self.thread = threading.Thread(target=self._accept, name=f'proxy-{robot_id}', daemon=True)
+
+    @property
+    def port(self):
+        return PROXY_PORT_BASE + self.robot_id
+
+    @property
+    def controller_port(self):
+        return COMMAND_PORT_BASE + self.robot_id
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.thread.join(timeout=2.0)
+        self.server.close()
+
+    def _accept(self):
+        while not self.stop_event.is_set():
+            try:
+                planner, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                controller = socket.create_connection((self.host, self.controller_port))
+            except OSError as e:
+                print(f"[PROXY] robot {self.robot_id}: controller not reachable ({e}) — closing planner connection")
+                planner.close()
+                continue
+            print(f"[PROXY] robot {self.robot_id}: planner connected")
+            for src, dst, direction in ((planner, controller, TO_CONTROLLER),
+                                        (controller, planner, TO_PLANNER)):
+                threading.Thread(target=self._pump, args=(src, dst, direction), daemon=True).start()
+
+    def _pump(self, src, dst, direction):
+        """Copy one direction of a connection; closes both ends when either side is done."""
+        src.settimeout(SOCKET_TIMEOUT)
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    data = src.recv(65536)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                self.on_data(direction, self.robot_id, data)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                s.close()
+            if direction == TO_CONTROLLER:
+                print(f"[PROXY] robot {self.robot_id}: planner disconnected")
@@ -0,0 +1,56 @@
+"""Cached heading offsets so controllers skip the forward-drive calibration.
+
+The offset between atan2(R10, R00) and the direction the robot actually drives
+is a property of the robot model, so it is stored per robot name, PROTO type and
+PROTO version (the EXTERNPROTO URL in the world file, which pins the Webots release).
+Each key has its own file, so robots calibrating at the same start cannot
+overwrite each other's entries.
+"""
+
+import math
+import hashlib
+
+from utils.cache import load_json, save_json
+
+CACHE_DIR_NAME = 'heading_offsets'   # under cache/, one <sha1(key)>.json per key
+CACHE_VERSION = 1
+MIN_CALIBRATION_DISPLACEMENT = 0.02  # meters — less than this means the robot was blocked
+
+
+def proto_version(robot, model):
+    try:
+        world_path = robot.getWorldPath()
+        with open(world_path) as f:
+            for line in f:
+                if line.startswith('EXTERNPROTO') and f'/{model}.proto' in line:
+                    return line.split('"')[1]
+    except Exception:
+        pass
+    return 'unknown'
+
+
+def heading_cache_key(robot, robot_node):
+    model = robot_node.getTypeName()
+    return f"{robot.getName()}|{model}|{proto_version(robot, model)}"
+
+
+def _entry_name(key):
+    return f"{CACHE_DIR_NAME}/{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json"
+
+
+def load_heading_offset(key):
+    """Return the cached offset in radians, or None if missing or invalid."""
+    entry = load_json(_entry_name(key))
+    if not isinstance(entry, dict) or entry.get('version') != CACHE_VERSION or entry.get('key') != key:
+        return None
+    offset = entry.get('offset')
+    if not isinstance(offset, (int, float)) or not math.isfinite(offset) or abs(offset) > math.pi:
+        return None
+    return float(offset)
+
+
+def save_heading_offset(key, offset):
+    try:
+        save_json(_entry_name(key), {'version': CACHE_VERSION, 'key': key, 'offset': offset})
+    except OSError as e:
+        print(f"Could not write heading cache: {e}")
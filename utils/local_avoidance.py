@@ -0,0 +1,95 @@
+"""Reactive obstacle avoidance from a single LIDAR scan (binary vector field histogram).
+
+Angles are in the robot frame, radians, CCW positive, 0 = forward. Beam i of a
+Webots range image points at fov/2 - i * step (scan runs left to right).
+"""
+
+import math
+import time
+import numpy as np
+
+
+def _wrap(a):
+    return (a + np.pi) % (2.0 * np.pi) - np.pi
+
+
+class VectorFieldHistogram:
+    ROBOT_RADIUS = 0.30      # meters — obstacle enlargement
+    SAFETY_MARGIN = 0.10     # meters — extra clearance on top of the radius
+    LOOKAHEAD = 1.0          # meters — obstacles further away are ignored
+    STOP_DISTANCE = 0.35     # meters — speed scale reaches MIN_SCALE here
+    SLOW_DISTANCE = 0.9      # meters — full speed beyond this clearance
+    MIN_SCALE = 0.25
+    NUM_SECTORS = 72         # 5 degree sectors
+    BUDGET_FRACTION = 0.05   # share of the timestep the avoider may use
+    MAX_STRIDE = 8           # coarsest beam decimation when over budget
+
+    def __init__(self, num_beams, fov, max_range, timestep_ms):
+        self.num_beams = num_beams
+        self.fov = fov
+        self.max_range = max_range
+        self.budget = self.BUDGET_FRACTION * timestep_ms * 1e-3
+
+        full_circle = fov >= 2.0 * math.pi - 1e-3
+        step = fov / num_beams if full_circle or num_beams < 2 else fov / (num_beams - 1)
+        self._beam_angles = _wrap(fov / 2.0 - np.arange(num_beams) * step)
+        self._sectors = _wrap(np.linspace(-np.pi, np.pi, self.NUM_SECTORS, endpoint=False))
+
+        self.stride = 1
+        self.cost_ema = 0.0
+        self.calls = 0
+
+    def steer(self, ranges, goal_angle, goal_distance):
+        """Return (angle, speed_scale): a collision-free heading near goal_angle and a slowdown in [0, 1]."""
+        t0 = time.perf_counter()
+        result = self._steer(ranges, goal_angle, goal_distance)
+        self._account(time.perf_counter() - t0)
+        return result
+
+    def _steer(self, ranges, goal_angle, goal_distance):
+        if len(ranges) != self.num_beams:
+            return goal_angle, 1.0
+
+        r = np.asarray(ranges, dtype=np.float64)[::self.stride]
+        angles = self._beam_angles[::self.stride]
+        r = np.where(np.isfinite(r) & (r > 0.0), r, self.max_range)
+
+        reach = min(self.LOOKAHEAD, goal_distance + self.ROBOT_RADIUS)
+        near = r < reach
+        if not near.any():
+            return goal_angle, 1.0
+
+        r_near = r[near]
+        a_near = angles[near]
+        clearance = self.ROBOT_RADIUS + self.SAFETY_MARGIN
+        half_width = np.arcsin(np.minimum(1.0, clearance / r_near))
+
+        diff = np.abs(_wrap(self._sectors[:, None] - a_near[None, :]))
+        blocked = (diff < half_width[None, :]).any(axis=1)
+
+        goal_diff = np.abs(_wrap(a_near - goal_angle))
+        if not (goal_diff < half_width).any():
+            angle = goal_angle
+        elif blocked.all():
+            # Boxed in — point at the most open beam and let the caller rotate in place
+            return float(angles[np.argmax(r)]), 0.0
+        else:
+            cost = np.abs(_wrap(self._sectors - goal_angle))
+            cost[blocked] = np.inf
+            angle = float(self._sectors[np.argmin(cost)])
+
+        ahead = np.abs(_wrap(angles - angle)) < math.pi / 4
+        front = float(r[ahead].min()) if ahead.any() else self.max_range
+        scale = (front - self.STOP_DISTANCE) / (self.SLOW_DISTANCE - self.STOP_DISTANCE)
+        return angle, min(1.0, max(self.MIN_SCALE, scale))
+
+    def _account(self, elapsed):
+        """Track per-call cost and decimate beams to stay within the timestep budget."""
+        self.calls += 1
+        self.cost_ema += 0.05 * (elapsed - self.cost_ema)
+        if self.calls % 20:
+            return
+        if self.cost_ema > self.budget and self.stride < self.MAX_STRIDE:
+            self.stride *= 2
+        elif self.cost_ema < self.budget / 4 and self.stride > 1:
+            self.stride //= 2
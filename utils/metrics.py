@@ -0,0 +1,324 @@
+"""Process metrics: counters, gauges and histograms served over HTTP in Prometheus text format.
+
+Enable with the DAL_METRICS environment variable (read when the process starts):
+    DAL_METRICS=1    serve http://localhost:<port>/metrics (ports in utils/protocol.py)
+Unset (default) returns a no-op registry so instrumented code costs one empty call per update.
+
+Updates never take a lock: each thread adds into its own shard of a metric and
+a scrape sums the shards. A value that a single thread already counts (say
+Ingest.received) can be exported with set_function instead, which costs
+nothing until it is scraped.
+"""
+
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.protocol import METRICS_TOOL_PORT_BASE
+
+# Upper bucket edges in seconds, the step_profiler edges; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005,
+                   0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+# Fixed ports for the host tools: METRICS_TOOL_PORT_BASE + offset
+TOOL_PORT_OFFSETS = {
+    'slam_viz': 0,
+    'robot_pos_viz': 1,
+    'camera_viz': 2,
+    'session_recorder': 3,
+    'session_replay': 4,
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def tool_port(name):
+    return METRICS_TOOL_PORT_BASE + TOOL_PORT_OFFSETS[name]
+
+
+def _format_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _Sharded:
+    """Per-thread value lists: only the owning thread writes its shard, so += needs no lock."""
+
+    width = 1
+
+    def __init__(self):
+        self._shards = {}   # thread ident -> [values]
+        self._fn = None
+
+    def _local(self):
+        ident = threading.get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            # A new thread reusing a dead thread's ident carries on in its shard
+            shard = self._shards[ident] = [0] * self.width
+        return shard
+
+    def _sum(self):
+        totals = [0] * self.width
+        for shard in list(self._shards.values()):
+            for i, v in enumerate(shard):
+                totals[i] += v
+        return totals
+
+    def set_function(self, fn):
+        """Report fn() at scrape time instead of the counted value."""
+        self._fn = fn
+
+
+class _CounterValue(_Sharded):
+    def inc(self, n=1):
+        self._local()[0] += n
+
+    def value(self):
+        return self._fn() if self._fn is not None else self._sum()[0]
+
+
+class _GaugeValue:
+    def __init__(self):
+        self._value = 0
+        self._fn = None
+
+    def set(self, v):
+        self._value = v   # a single assignment: readers see the old or the new value
+
+    def set_function(self, fn):
+        self._fn = fn
+
+    def value(self):
+        return self._fn() if self._fn is not None else self._value
+
+
+class _HistogramValue(_Sharded):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.width = len(buckets) + 2   # bucket counts, +Inf count, sum
+        super().__init__()
+
+    def observe(self, v):
+        shard = self._local()
+        shard[bisect_left(self.buckets, v)] += 1
+        shard[-1] += v
+
+    def value(self):
+        return self._sum()
+
+
+class _Metric:
+    """A metric name with a child value per label combination; unlabelled metrics forward to one child."""
+
+    kind = None
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._children = {}
+        if not self.label_names:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """The child for these label values; look it up once, outside the hot loop."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def set_function(self, fn):
+        self._default.set_function(fn)
+
+    def _samples(self, const_labels):
+        for key, child in list(self._children.items()):
+            yield const_labels + tuple(zip(self.label_names, key)), child.value()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, n=1):
+        self._default.inc(n)
+
+    def render(self, const_labels):
+        for labels, v in self._samples(const_labels):
+            yield f"{self.name}{_format_labels(labels)} {_format_value(v)}"
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, v):
+        self._default.set(v)
+
+    def render(self, const_labels):
+        for labels, v in self._samples(const_labels):
+            yield f"{self.name}{_format_labels(labels)} {_format_value(v)}"
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, label_names)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, v):
+        self._default.observe(v)
+
+    def render(self, const_labels):
+        for labels, totals in self._samples(const_labels):
+            cumulative = 0
+            for edge, count in zip(self.buckets + (float('inf'),), totals[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(labels + (('le', _format_value(edge)),))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(totals[-1])}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class Registry:
+    """Named metrics of one process; const_labels (e.g. component, robot) are added to every sample."""
+
+    def __init__(self, const_labels=None):
+        self.const_labels = tuple((const_labels or {}).items())
+        self._metrics = {}
+        self._lock = threading.Lock()   # registration only, never on updates
+        self.server = None
+
+    def _register(self, cls, name, help_text, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        """All metrics in Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.render(self.const_labels))
+            except Exception as e:   # a failing set_function must not break the whole scrape
+                lines.append(f"# ERROR {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='localhost'):
+        """Answer GET /metrics from a daemon thread; raises OSError if the port is taken."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass   # a scrape every few seconds would flood the console
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        return self.server.server_address[1]
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class _NullMetric:
+    def labels(self, *values):
+        return self
+
+    def inc(self, n=1):
+        pass
+
+    def set(self, v):
+        pass
+
+    def observe(self, v):
+        pass
+
+    def set_function(self, fn):
+        pass
+
+
+class NullRegistry:
+    """Stand-in used when metrics are disabled."""
+
+    _metric = _NullMetric()
+
+    def counter(self, name, help_text, labels=()):
+        return self._metric
+
+    def gauge(self, name, help_text, labels=()):
+        return self._metric
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._metric
+
+    def render(self):
+        return ''
+
+    def close(self):
+        pass
+
+
+def make_metrics(component, port, robot_id=None):
+    """Registry for this process, serving on port when DAL_METRICS is set, else a NullRegistry."""
+    mode = os.environ.get('DAL_METRICS', '').strip()
+    if not mode or mode == '0':
+        return NullRegistry()
+    labels = {'component': component}
+    if robot_id is not None:
+        labels['robot'] = robot_id
+    registry = Registry(labels)
+    try:
+        registry.serve(port)
+        print(f"[METRICS] http://localhost:{port}/metrics")
+    except OSError as e:
+        print(f"[METRICS] Could not serve on :{port}: {e} — counting without an endpoint")
+    return registry
@@ -1,13 +1,37 @@
 """Occupancy grid from LIDAR: log-odds internally, probability in self.grid [0,1]."""
 
 import math
+import json
+import zlib
+import struct
 import numpy as np
 
+# Map image colours (RGB 0-255) at probability 0, 0.5 and 1 — the same ramp as slam_viz
+PNG_FREE = (51, 204, 51)
+PNG_UNKNOWN = (217, 217, 217)
+PNG_OCCUPIED = (204, 51, 51)
+
 
 def _logodds_to_prob(l):
     return 1.0 - 1.0 / (1.0 + np.exp(l))
 
 
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def write_png(path, rgb):
+    """Write an (H, W, 3) uint8 array as an 8-bit RGB PNG using only zlib (no imaging library)."""
+    h, w, _ = rgb.shape
+    raw = np.zeros((h, 1 + 3 * w), dtype=np.uint8)   # leading 0 per row = no filter
+    raw[:, 1:] = rgb.reshape(h, 3 * w)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0)))
+        f.write(_png_chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(_png_chunk(b'IEND', b''))
+
+
 class OccupancyGrid:
     L_FREE = 0.2
     L_OCC = 0.7
@@ -29,6 +53,9 @@ class OccupancyGrid:
         self._logodds = np.zeros((self.height, self.width), dtype=np.float32)
         self._frozen = np.zeros((self.height, self.width), dtype=bool)
         self.grid = np.full((self.height, self.width), 0.5, dtype=np.float32)
+        # (row_min, row_max, col_min, col_max), inclusive, of cells touched by the last
+        # update_from_lidar call, or None — lets consumers refresh derived maps incrementally
+        self.last_update_bbox = None
 
     def world_to_grid(self, wx, wy):
         col = int((wx - self.x_min) / self.resolution)
@@ -42,8 +69,78 @@ class OccupancyGrid:
         wy = self.y_min + (row + 0.5) * self.resolution
         return wx, wy
 
+    def save_snapshot(self, prefix):
+        """Write <prefix>.npy (probabilities) and <prefix>.json (bounds, resolution)."""
+        np.save(f"{prefix}.npy", self.grid.astype(np.float32))
+        meta = {
+            "x_min": self.x_min, "x_max": self.x_max,
+            "y_min": self.y_min, "y_max": self.y_max,
+            "resolution": self.resolution,
+            "width": self.width, "height": self.height,
+        }
+        with open(f"{prefix}.json", 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    def save_png(self, path, scale=1):
+        """Write the probability grid as a PNG (free green, unknown gray, occupied red), north up.
+
+        scale repeats each cell scale x scale pixels so coarse maps stay legible.
+        """
+        p = np.clip(self.grid, 0.0, 1.0)[::-1, :, None]   # row 0 is y_min, the bottom of the image
+        lo = np.array(PNG_FREE, dtype=np.float32)
+        mid = np.array(PNG_UNKNOWN, dtype=np.float32)
+        hi = np.array(PNG_OCCUPIED, dtype=np.float32)
+        rgb = np.where(p < 0.5, lo + (mid - lo) * (p * 2.0), mid + (hi - mid) * (p * 2.0 - 1.0))
+        rgb = np.rint(rgb).astype(np.uint8)
+        if scale > 1:
+            rgb = rgb.repeat(scale, axis=0).repeat(scale, axis=1)
+        write_png(path, rgb)
+
+    @classmethod
+    def load_snapshot(cls, prefix):
+        """Rebuild a grid from save_snapshot output (prefix may include the .npy/.json suffix)."""
+        if prefix.endswith('.npy') or prefix.endswith('.json'):
+            prefix = prefix.rsplit('.', 1)[0]
+        with open(f"{prefix}.json") as f:
+            meta = json.load(f)
+        grid = cls(meta['x_min'], meta['x_max'], meta['y_min'], meta['y_max'], meta['resolution'])
+        prob = np.load(f"{prefix}.npy").astype(np.float32)
+        if prob.shape != (grid.height, grid.width):
+            raise ValueError(f"Snapshot shape {prob.shape} does not match metadata "
+                             f"({grid.height}, {grid.width})")
+        p = np.clip(prob, 1e-6, 1.0 - 1e-6)
+        grid._logodds = np.clip(np.log(p / (1.0 - p)), cls.L_MIN, cls.L_MAX).astype(np.float32)
+        grid._frozen = (grid._logodds <= cls.L_FREEZE_FREE) | (grid._logodds >= cls.L_FREEZE_OCC)
+        grid.grid = prob
+        return grid
+
+    @property
+    def logodds(self):
+        """The log-odds array behind self.grid (treat as read-only)."""
+        return self._logodds
+
+    def merge_logodds(self, logodds):
+        """Add a partial map's log-odds, built from zero out of later scans, into this grid.
+
+        Log-odds addition commutes, the freeze rule does not: a cell that is
+        frozen here keeps its value and ignores the partial, and a cell that
+        crosses a freeze threshold in the sum is frozen at the clipped sum.
+        Merging partials in time order therefore matches a sequential build,
+        except for cells that would have crossed a threshold partway through a
+        partial from a non-zero start (the partial's own updates after its
+        freeze point are already missing). See tools/offline_map_builder.py.
+        """
+        total = self._logodds + logodds
+        open_cells = ~self._frozen
+        self._logodds = np.where(open_cells, np.clip(total, self.L_MIN, self.L_MAX),
+                                 self._logodds).astype(np.float32)
+        self._frozen |= open_cells & ((total <= self.L_FREEZE_FREE) | (total >= self.L_FREEZE_OCC))
+        self.grid = _logodds_to_prob(self._logodds).astype(np.float32)
+        self.last_update_bbox = None
+
     def update_from_lidar(self, robot_x, robot_y, robot_heading, ranges,
                           angle_min=0.0, angle_increment=None, max_range=3.5):
+        self.last_update_bbox = None
         if len(ranges) == 0:
             return
 
@@ -51,6 +148,9 @@ class OccupancyGrid:
             angle_increment = 2.0 * math.pi / len(ranges)
 
         robot_col, robot_row = self.world_to_grid(robot_x, robot_y)
+        row_min = row_max = robot_row
+        col_min = col_max = robot_col
+        cast = False
 
         for i, r in enumerate(ranges):
             beam_angle = robot_heading + angle_min + i * angle_increment
@@ -64,6 +164,12 @@ class OccupancyGrid:
             end_x = robot_x + cast_range * math.cos(beam_angle)
             end_y = robot_y + cast_range * math.sin(beam_angle)
             end_col, end_row = self.world_to_grid(end_x, end_y)
+            # Bresenham stays inside the box spanned by its endpoints
+            row_min = min(row_min, end_row)
+            row_max = max(row_max, end_row)
+            col_min = min(col_min, end_col)
+            col_max = max(col_max, end_col)
+            cast = True
 
             cells = self._ray_to_cells(robot_col, robot_row, end_col, end_row)
             for col, row in cells[:-1]:
@@ -90,7 +196,12 @@ class OccupancyGrid:
                         if val <= self.L_FREEZE_FREE:
                             self._frozen[end_row, end_col] = True
 
-        self.grid = _logodds_to_prob(self._logodds)
+        if not cast:
+            return
+        self.last_update_bbox = (row_min, row_max, col_min, col_max)
+        rows = slice(row_min, row_max + 1)
+        cols = slice(col_min, col_max + 1)
+        self.grid[rows, cols] = _logodds_to_prob(self._logodds[rows, cols])
 
     @staticmethod
     def _ray_to_cells(x0, y0, x1, y1):
@@ -1,11 +1,20 @@
+import os
 import struct
 
 POSITION_PORT = 5555
 CAMERA_PORT = 5556
+TELEMETRY_PORT = 5557
 COMMAND_PORT_BASE = 6000
+PROXY_PORT_BASE = 6200   # command proxies (session_recorder, latency_monitor) listen on + robot id
+
+# HTTP /metrics endpoints when DAL_METRICS is set (utils/metrics.py)
+METRICS_PORT_BASE = 9100          # controllers, + robot id
+METRICS_PLANNER_PORT_BASE = 9150  # planners, + robot id
+METRICS_TOOL_PORT_BASE = 9190     # host tools, + a fixed offset per tool
 
 ROBOT_YOUBOT = 0
 ROBOT_PIONEER = 1
+ROBOT_MAVIC = 2
 
 POSITION_HEADER_FMT = 'BfffH'
 POSITION_HEADER_SIZE = struct.calcsize(POSITION_HEADER_FMT)
@@ -31,6 +40,70 @@ def unpack_position(data):
     return robot_id, x, y, heading, lidar_ranges
 
 
+# Optional extension blocks appended after the LIDAR ranges (or, in camera packets, after
+# the image): tag, payload length, payload. unpack_position ignores them, so existing
+# tools keep reading these packets unchanged.
+EXT_HEADER_FMT = 'BH'
+EXT_HEADER_SIZE = struct.calcsize(EXT_HEADER_FMT)
+EXT_POSE3D = 1
+POSE3D_FMT = 'fff'  # z, roll, pitch (the 2D heading field carries yaw)
+EXT_STAMP = 2
+STAMP_FMT = 'Idd'   # sequence number, wall time robot.step returned (time.time()), simulation time
+
+
+def pack_extension(tag, payload):
+    return struct.pack(EXT_HEADER_FMT, tag, len(payload)) + payload
+
+
+def unpack_extensions(data):
+    """Return {tag: payload} for the extension blocks after the LIDAR ranges."""
+    num = struct.unpack_from(POSITION_HEADER_FMT, data)[4]
+    return _unpack_extensions_from(data, POSITION_HEADER_SIZE + num * 4)
+
+
+def _unpack_extensions_from(data, offset):
+    blocks = {}
+    while offset + EXT_HEADER_SIZE <= len(data):
+        tag, length = struct.unpack_from(EXT_HEADER_FMT, data, offset)
+        offset += EXT_HEADER_SIZE
+        blocks[tag] = data[offset:offset + length]
+        offset += length
+    return blocks
+
+
+def pack_stamp(seq, step_wall_time, sim_time):
+    """STAMP extension: lets receivers measure step-to-receive latency and count lost packets."""
+    return pack_extension(EXT_STAMP, struct.pack(STAMP_FMT, seq & 0xFFFFFFFF, step_wall_time, sim_time))
+
+
+def _unpack_stamp(blocks):
+    payload = blocks.get(EXT_STAMP)
+    if payload is None or len(payload) < struct.calcsize(STAMP_FMT):
+        return None
+    return struct.unpack_from(STAMP_FMT, payload)
+
+
+def unpack_position_stamp(data):
+    """-> (seq, step_wall_time, sim_time) from a position packet, or None if it carries no STAMP."""
+    return _unpack_stamp(unpack_extensions(data))
+
+
+def pack_position3d(robot_id, x, y, z, roll, pitch, yaw, lidar_ranges=None):
+    """Position packet readable as 2D (x, y, heading=yaw) plus a POSE3D extension."""
+    base = pack_position(robot_id, x, y, yaw, lidar_ranges)
+    return base + pack_extension(EXT_POSE3D, struct.pack(POSE3D_FMT, z, roll, pitch))
+
+
+def unpack_position3d(data):
+    """-> (robot_id, x, y, z, roll, pitch, yaw, lidar_ranges); z/roll/pitch are 0.0 for 2D packets"""
+    robot_id, x, y, yaw, lidar_ranges = unpack_position(data)
+    z = roll = pitch = 0.0
+    pose = unpack_extensions(data).get(EXT_POSE3D)
+    if pose is not None and len(pose) >= struct.calcsize(POSE3D_FMT):
+        z, roll, pitch = struct.unpack_from(POSE3D_FMT, pose)
+    return robot_id, x, y, z, roll, pitch, yaw, lidar_ranges
+
+
 CAMERA_HEADER_FMT = 'BHH'
 CAMERA_HEADER_SIZE = struct.calcsize(CAMERA_HEADER_FMT)
 
@@ -44,12 +117,23 @@ def unpack_camera_header(data):
     return struct.unpack_from(CAMERA_HEADER_FMT, data)
 
 
+def unpack_camera_stamp(data):
+    """-> (seq, step_wall_time, sim_time) from extension blocks after the image, or None."""
+    _, width, height = unpack_camera_header(data)
+    return _unpack_stamp(_unpack_extensions_from(data, CAMERA_HEADER_SIZE + width * height * 3))
+
+
 # Waypoint command protocol (TCP, text-based)
-WAYPOINT_PORT = 6000
+# DAL_WAYPOINT_PORT, set in a planner's shell, points it somewhere else —
+# e.g. at session_recorder's command proxy. Controllers listen on COMMAND_PORT_BASE + id.
+WAYPOINT_PORT = int(os.environ.get('DAL_WAYPOINT_PORT', COMMAND_PORT_BASE))
 
-def send_waypoint_command(sock, x, y):
-    """Send waypoint command to controller: 'WAYPOINT x y\\n'"""
-    msg = f"WAYPOINT {x} {y}\n"
+def send_waypoint_command(sock, x, y, z=None):
+    """Send waypoint command to controller: 'WAYPOINT x y\\n' (or 'WAYPOINT x y z\\n' for drones)"""
+    if z is None:
+        msg = f"WAYPOINT {x} {y}\n"
+    else:
+        msg = f"WAYPOINT {x} {y} {z}\n"
     sock.sendall(msg.encode('utf-8'))
 
 def send_reached_ack(sock, x, y):
@@ -67,6 +151,17 @@ def parse_waypoint_command(line):
             return None
     return None
 
+def parse_waypoint3d_command(line):
+    """Parse 'WAYPOINT x y [z]' -> (x, y, z) or None if invalid; z is None when omitted"""
+    parts = line.strip().split()
+    if len(parts) in (3, 4) and parts[0] == "WAYPOINT":
+        try:
+            z = float(parts[3]) if len(parts) == 4 else None
+            return (float(parts[1]), float(parts[2]), z)
+        except ValueError:
+            return None
+    return None
+
 def parse_reached_ack(line):
     """Parse 'REACHED x y' -> (x, y) or None if invalid"""
     parts = line.strip().split()
@@ -98,3 +193,145 @@ def parse_path_command(line):
         except (ValueError, IndexError):
             pass
     return None
+
+
+# Path streaming: grow, re-plan or drop the path being followed without stopping.
+# Indices count from 0 over the current path (PATH plus everything appended since).
+
+def _parse_points(parts):
+    """Parse ['n', 'x1', 'y1', ...] -> [(x1,y1), ...] or None if the count does not match"""
+    try:
+        n = int(parts[0])
+        coords = [float(p) for p in parts[1:]]
+    except (ValueError, IndexError):
+        return None
+    if n < 1 or len(coords) != n * 2:
+        return None
+    return [(coords[i * 2], coords[i * 2 + 1]) for i in range(n)]
+
+def send_append_command(sock, waypoints):
+    """Append waypoints to the current path: 'APPEND n x1 y1 ...\n' (starts a new path if idle)"""
+    coords = ' '.join(f"{x} {y}" for x, y in waypoints)
+    msg = f"APPEND {len(waypoints)} {coords}\n"
+    sock.sendall(msg.encode('utf-8'))
+
+def parse_append_command(line):
+    """Parse 'APPEND n x1 y1 ...' -> [(x1,y1), ...] or None if invalid"""
+    parts = line.strip().split()
+    if len(parts) >= 4 and parts[0] == "APPEND":
+        return _parse_points(parts[1:])
+    return None
+
+def send_replace_from_command(sock, index, waypoints):
+    """Replace the path from index on: 'REPLACE_FROM index n x1 y1 ...\n'"""
+    coords = ' '.join(f"{x} {y}" for x, y in waypoints)
+    msg = f"REPLACE_FROM {index} {len(waypoints)} {coords}\n"
+    sock.sendall(msg.encode('utf-8'))
+
+def parse_replace_from_command(line):
+    """Parse 'REPLACE_FROM index n x1 y1 ...' -> (index, [(x1,y1), ...]) or None if invalid"""
+    parts = line.strip().split()
+    if len(parts) >= 5 and parts[0] == "REPLACE_FROM":
+        try:
+            index = int(parts[1])
+        except ValueError:
+            return None
+        points = _parse_points(parts[2:])
+        if index >= 0 and points:
+            return (index, points)
+    return None
+
+def send_cancel_command(sock):
+    """Stop and drop the current path: 'CANCEL\n' (no REACHED is sent)"""
+    sock.sendall(b"CANCEL\n")
+
+def parse_cancel_command(line):
+    """True for 'CANCEL'"""
+    return line.strip() == "CANCEL"
+
+def send_progress_interval_command(sock, seconds):
+    """Ask for PROGRESS acks every seconds of simulation time while following a path (0 = off, the default)"""
+    msg = f"PROGRESS_INTERVAL {seconds}\n"
+    sock.sendall(msg.encode('utf-8'))
+
+def parse_progress_interval_command(line):
+    """Parse 'PROGRESS_INTERVAL s' -> s or None if invalid"""
+    parts = line.strip().split()
+    if len(parts) == 2 and parts[0] == "PROGRESS_INTERVAL":
+        try:
+            seconds = float(parts[1])
+        except ValueError:
+            return None
+        return seconds if seconds >= 0.0 else None
+    return None
+
+def send_progress_ack(sock, index, length, x, y):
+    """Report path progress to planner: 'PROGRESS index length x y\n' (index = waypoint being driven to)"""
+    msg = f"PROGRESS {index} {length} {x} {y}\n"
+    sock.sendall(msg.encode('utf-8'))
+
+def parse_progress_ack(line):
+    """Parse 'PROGRESS index length x y' -> (index, length, x, y) or None if invalid"""
+    parts = line.strip().split()
+    if len(parts) == 5 and parts[0] == "PROGRESS":
+        try:
+            return (int(parts[1]), int(parts[2]), float(parts[3]), float(parts[4]))
+        except ValueError:
+            return None
+    return None
+
+
+def send_path3d_command(sock, waypoints):
+    """Send full 3D path to a drone controller: 'PATH3 n x1 y1 z1 x2 y2 z2 ...\\n'"""
+    coords = ' '.join(f"{x} {y} {z}" for x, y, z in waypoints)
+    msg = f"PATH3 {len(waypoints)} {coords}\n"
+    sock.sendall(msg.encode('utf-8'))
+
+def parse_path3d_command(line):
+    """Parse 'PATH3 n x1 y1 z1 ...' -> [(x1,y1,z1), ...] or None if invalid"""
+    parts = line.strip().split()
+    if len(parts) >= 4 and parts[0] == "PATH3":
+        try:
+            n = int(parts[1])
+            coords = [float(p) for p in parts[2:]]
+            if len(coords) == n * 3:
+                return [(coords[i * 3], coords[i * 3 + 1], coords[i * 3 + 2]) for i in range(n)]
+        except (ValueError, IndexError):
+            pass
+    return None
+
+
+# Velocity command protocol (TCP text, or UDP binary for streaming)
+# vx = forward, vy = strafe-left (ignored by differential drive), omega = CCW rotation.
+# Units are wheel speeds (rad/s), the same scale as set_mecanum/set_differential.
+VELOCITY_PORT_BASE = 6100
+
+VELOCITY_FMT = 'Bfff'
+VELOCITY_SIZE = struct.calcsize(VELOCITY_FMT)
+
+
+def send_velocity_command(sock, vx, vy, omega):
+    """Send velocity command to controller over TCP: 'VEL vx vy omega\\n'"""
+    msg = f"VEL {vx} {vy} {omega}\n"
+    sock.sendall(msg.encode('utf-8'))
+
+def parse_velocity_command(line):
+    """Parse 'VEL vx vy omega' -> (vx, vy, omega) or None if invalid"""
+    parts = line.strip().split()
+    if len(parts) == 4 and parts[0] == "VEL":
+        try:
+            return (float(parts[1]), float(parts[2]), float(parts[3]))
+        except ValueError:
+            return None
+    return None
+
+
+def pack_velocity(robot_id, vx, vy, omega):
+    return struct.pack(VELOCITY_FMT, robot_id, vx, vy, omega)
+
+
+def unpack_velocity(data):
+    """Unpack a UDP velocity datagram -> (robot_id, vx, vy, omega) or None if too short"""
+    if len(data) < VELOCITY_SIZE:
+        return None
+    return struct.unpack_from(VELOCITY_FMT, data)
@@ -0,0 +1,249 @@
+"""Session logs: append-only binary recordings of the UDP sensor streams and TCP command traffic.
+
+A log is a file of chunks, each holding many records:
+
+    file header   'RLOG', version, start wall time
+    chunk header  'CHNK', codec, record count, stored size, raw size, first/last record time
+    chunk payload records, zlib-compressed when codec is CODEC_ZLIB
+    record        receive time, stream, robot id, length, then the packet bytes unchanged
+
+Record times are seconds since the session started (time.monotonic at the
+recorder), so replay timing is immune to wall clock jumps. Each chunk also
+gets a fixed-size entry in the sidecar index <log>.idx: file offset, first
+and last record time, record count and a bit mask of the robot ids it
+contains. The index lets a reader seek by time or skip chunks without a
+wanted robot; if it is missing or shorter than the log (recorder killed),
+SessionReader rebuilds it by walking the chunk headers.
+"""
+
+import mmap
+import zlib
+import struct
+
+import numpy as np
+
+FILE_MAGIC = b'RLOG'
+CHUNK_MAGIC = b'CHNK'
+VERSION = 1
+
+FILE_HEADER_FMT = '<4sHxxd'        # magic, version, start wall time (time.time())
+FILE_HEADER_SIZE = struct.calcsize(FILE_HEADER_FMT)
+CHUNK_HEADER_FMT = '<4sBxxxIIIdd'  # magic, codec, records, stored size, raw size, t_first, t_last
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_HEADER_FMT)
+RECORD_HEADER_FMT = '<dBBxxI'      # t, stream, robot_id, length
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FMT)
+
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('t_first', '<f8'), ('t_last', '<f8'),
+                        ('records', '<u4'), ('codec', '<u4'), ('robots', '<u8')])
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+
+# Streams
+STREAM_POSITION = 1   # UDP POSITION_PORT datagrams (position + LIDAR)
+STREAM_CAMERA = 2     # UDP CAMERA_PORT datagrams
+STREAM_COMMAND = 3    # TCP bytes planner -> controller
+STREAM_REPLY = 4      # TCP bytes controller -> planner (REACHED, PROGRESS, ...)
+STREAM_NAMES = {STREAM_POSITION: 'position', STREAM_CAMERA: 'camera',
+                STREAM_COMMAND: 'command', STREAM_REPLY: 'reply'}
+
+NO_ROBOT = 255        # robot id of records that could not be attributed
+
+CHUNK_BYTES = 1 << 20   # raw bytes per chunk before it is written out
+CHUNK_SECONDS = 1.0     # seconds — a chunk is also closed this long after its first record
+ZLIB_LEVEL = 1          # fastest level; camera frames dominate and compress well even at 1
+
+
+def robot_bit(robot_id):
+    """Bit of robot_id in an index entry's robots mask (ids >= 63 share the top bit)."""
+    return 1 << min(robot_id, 63)
+
+
+def index_path(path):
+    return f"{path}.idx"
+
+
+class SessionWriter:
+    """Buffers records into chunks and appends each finished chunk (and its index entry) to disk.
+
+    Not thread-safe: the recorder feeds it from one writer thread.
+    """
+
+    def __init__(self, path, start_wall, compress=True,
+                 chunk_bytes=CHUNK_BYTES, chunk_seconds=CHUNK_SECONDS):
+        self.path = path
+        self.codec = CODEC_ZLIB if compress else CODEC_RAW
+        self.chunk_bytes = chunk_bytes
+        self.chunk_seconds = chunk_seconds
+        self.f = open(path, 'wb')
+        self.idx = open(index_path(path), 'wb')
+        self.f.write(struct.pack(FILE_HEADER_FMT, FILE_MAGIC, VERSION, start_wall))
+        self.f.flush()   # a reader can open the log before the first chunk
+        self.buf = bytearray()
+        self.count = 0
+        self.t_first = self.t_last = 0.0
+        self.robots = 0
+        self.records = 0      # totals for the whole session
+        self.raw_bytes = 0
+        self.stored_bytes = FILE_HEADER_SIZE
+        self.chunks = 0
+
+    def append(self, t, stream, robot_id, data):
+        # Receiver threads stamp records independently, so arrival order can be off by a little
+        if not self.count:
+            self.t_first = self.t_last = t
+        self.buf += struct.pack(RECORD_HEADER_FMT, t, stream, robot_id, len(data))
+        self.buf += data
+        self.count += 1
+        self.t_first = min(self.t_first, t)
+        self.t_last = max(self.t_last, t)
+        self.robots |= robot_bit(robot_id)
+        if len(self.buf) >= self.chunk_bytes or t - self.t_first >= self.chunk_seconds:
+            self.flush()
+
+    def flush(self):
+        """Write the current chunk, if any. Called automatically when a chunk is full."""
+        if not self.count:
+            return
+        raw = bytes(self.buf)
+        payload = zlib.compress(raw, ZLIB_LEVEL) if self.codec == CODEC_ZLIB else raw
+        offset = self.f.tell()
+        self.f.write(struct.pack(CHUNK_HEADER_FMT, CHUNK_MAGIC, self.codec, self.count,
+                                 len(payload), len(raw), self.t_first, self.t_last))
+        self.f.write(payload)
+        self.f.flush()
+        # The index entry goes out after its chunk, so it never points past the end of the log
+        entry = np.array([(offset, self.t_first, self.t_last, self.count, self.codec, self.robots)],
+                         dtype=INDEX_DTYPE)
+        self.idx.write(entry.tobytes())
+        self.idx.flush()
+        self.records += self.count
+        self.raw_bytes += len(raw)
+        self.stored_bytes += CHUNK_HEADER_SIZE + len(payload)
+        self.chunks += 1
+        self.buf.clear()
+        self.count = 0
+        self.robots = 0
+
+    def close(self):
+        self.flush()
+        self.f.close()
+        self.idx.close()
+
+
+def scan_chunks(mm, start=FILE_HEADER_SIZE):
+    """Index entries for every complete chunk in a mapped log, from its chunk headers."""
+    entries = []
+    pos = start
+    while pos + CHUNK_HEADER_SIZE <= len(mm):
+        magic, codec, count, stored, raw, t_first, t_last = struct.unpack_from(CHUNK_HEADER_FMT, mm, pos)
+        end = pos + CHUNK_HEADER_SIZE + stored
+        if magic != CHUNK_MAGIC or end > len(mm):
+            break   # torn tail from a recorder that was killed mid-write
+        robots = 0
+        for _, _, robot_id, _ in _iter_records(_chunk_payload(mm, pos, codec, stored)):
+            robots |= robot_bit(robot_id)
+        entries.append((pos, t_first, t_last, count, codec, robots))
+        pos = end
+    return np.array(entries, dtype=INDEX_DTYPE)
+
+
+def _chunk_payload(mm, offset, codec, stored):
+    """Raw record bytes of the chunk at offset (only this chunk's pages are touched)."""
+    start = offset + CHUNK_HEADER_SIZE
+    data = mm[start:start + stored]
+    return zlib.decompress(data) if codec == CODEC_ZLIB else data
+
+
+def _iter_records(payload):
+    """(t, stream, robot_id, data) for each record in a chunk's raw bytes; data is a memoryview."""
+    view = memoryview(payload)
+    pos = 0
+    end = len(view)
+    while pos < end:
+        t, stream, robot_id, length = struct.unpack_from(RECORD_HEADER_FMT, view, pos)
+        pos += RECORD_HEADER_SIZE
+        yield t, stream, robot_id, view[pos:pos + length]
+        pos += length
+
+
+class SessionReader:
+    """Memory-mapped reader: opening costs only the index, chunks are read and inflated on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.start_wall = struct.unpack_from(FILE_HEADER_FMT, self.mm, 0)
+        if magic != FILE_MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path}: not a version {VERSION} session log")
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(index_path(self.path), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            raw = b''
+        whole = len(raw) - len(raw) % INDEX_DTYPE.itemsize
+        index = np.frombuffer(raw[:whole], dtype=INDEX_DTYPE)
+        index = index[index['offset'] + CHUNK_HEADER_SIZE <= len(self.mm)]
+        # Recover chunks the index does not cover (no .idx, or the recorder died between writes)
+        tail = FILE_HEADER_SIZE
+        if len(index):
+            last = index[-1]
+            stored = struct.unpack_from(CHUNK_HEADER_FMT, self.mm, int(last['offset']))[3]
+            tail = int(last['offset']) + CHUNK_HEADER_SIZE + stored
+        if tail < len(self.mm):
+            index = np.concatenate([index, scan_chunks(self.mm, tail)])
+        return index
+
+    @property
+    def duration(self):
+        return float(self.index['t_last'][-1]) if len(self.index) else 0.0
+
+    @property
+    def records(self):
+        return int(self.index['records'].sum())
+
+    def robot_ids(self):
+        """Robot ids present in the log, from the index masks (63 means 63 or above)."""
+        mask = int(np.bitwise_or.reduce(self.index['robots'])) if len(self.index) else 0
+        return [i for i in range(64) if mask >> i & 1]
+
+    def read(self, start=0.0, end=None, robots=None, streams=None):
+        """Yield (t, stream, robot_id, data) in recorded order; data is a memoryview into the chunk.
+
+        start seeks with a binary search over the index; robots (ids) and
+        streams (STREAM_* values) filter records, and whole chunks without a
+        wanted robot are never inflated.
+        """
+        mask = None
+        if robots is not None:
+            mask = 0
+            for r in robots:
+                mask |= robot_bit(r)
+        first = int(np.searchsorted(self.index['t_last'], start, side='left'))
+        for entry in self.index[first:]:
+            if end is not None and entry['t_first'] > end:
+                return
+            if mask is not None and not int(entry['robots']) & mask:
+                continue
+            offset = int(entry['offset'])
+            stored = struct.unpack_from(CHUNK_HEADER_FMT, self.mm, offset)[3]
+            payload = _chunk_payload(self.mm, offset, int(entry['codec']), stored)
+            for t, stream, robot_id, data in _iter_records(payload):
+                # Threads stamp records independently, so a chunk can hold a few
+                # out-of-order records: filter them here, stop only at chunk level
+                if t < start or (end is not None and t > end):
+                    continue
+                if robots is not None and robot_id not in robots:
+                    continue
+                if streams is not None and stream not in streams:
+                    continue
+                yield t, stream, robot_id, data
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
@@ -0,0 +1,130 @@
+"""Per-step phase timing for controllers: fixed-bucket histograms flushed periodically.
+
+Enable with the DAL_PROFILE environment variable (read when the controller starts):
+    DAL_PROFILE=udp              send JSON telemetry packets to UDP TELEMETRY_PORT
+    DAL_PROFILE=/tmp/prof.jsonl  append JSON lines to a local file
+Unset (default) returns a no-op profiler so the hot path costs one empty call per phase.
+
+Read back with tools/step_timing_summary.py.
+"""
+
+import os
+import json
+import time
+import socket
+from bisect import bisect_left
+
+from utils.protocol import TELEMETRY_PORT
+
+# Upper bucket edges in microseconds; the last bucket counts everything above 50 ms
+BUCKET_EDGES_US = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000)
+_EDGES_NS = tuple(e * 1000 for e in BUCKET_EDGES_US)
+
+FLUSH_EVERY = 500  # steps
+
+
+class StepProfiler:
+    """Laps a monotonic clock between phases of one control step."""
+
+    def __init__(self, robot_id, robot_name, file_path=None, udp_addr=None, flush_every=FLUSH_EVERY):
+        self.robot_id = robot_id
+        self.robot_name = robot_name
+        self.file_path = file_path
+        self.udp_addr = udp_addr
+        self.flush_every = flush_every
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if udp_addr else None
+        self._clock = time.perf_counter_ns
+        self._t = self._clock()
+        self._window_start = time.monotonic()
+        self._reset()
+
+    def _reset(self):
+        self.steps = 0
+        self.hist = {}   # phase -> bucket counts
+        self.total = {}  # phase -> ns
+        self.peak = {}   # phase -> ns
+
+    def start(self):
+        self._t = self._clock()
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to phase."""
+        now = self._clock()
+        dt = now - self._t
+        self._t = now
+        hist = self.hist.get(phase)
+        if hist is None:
+            hist = self.hist[phase] = [0] * (len(_EDGES_NS) + 1)
+            self.total[phase] = 0
+            self.peak[phase] = 0
+        hist[bisect_left(_EDGES_NS, dt)] += 1
+        self.total[phase] += dt
+        if dt > self.peak[phase]:
+            self.peak[phase] = dt
+
+    def end_step(self):
+        self.steps += 1
+        if self.steps >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.steps == 0:
+            return
+        now = time.monotonic()
+        record = {
+            "robot_id": self.robot_id,
+            "name": self.robot_name,
+            "time": time.time(),
+            "steps": self.steps,
+            "wall_s": now - self._window_start,
+            "edges_us": BUCKET_EDGES_US,
+            "phases": {
+                phase: {
+                    "total_us": self.total[phase] / 1000.0,
+                    "max_us": self.peak[phase] / 1000.0,
+                    "hist": hist,
+                }
+                for phase, hist in self.hist.items()
+            },
+        }
+        line = json.dumps(record)
+        if self.file_path:
+            try:
+                with open(self.file_path, 'a') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                print(f"[PROFILE] Could not write {self.file_path}: {e}")
+        if self._sock is not None:
+            try:
+                self._sock.sendto(line.encode('utf-8'), self.udp_addr)
+            except Exception:
+                pass
+        self._window_start = now
+        self._reset()
+
+
+class NullProfiler:
+    """Stand-in used when profiling is disabled."""
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_step(self):
+        pass
+
+    def flush(self):
+        pass
+
+
+def make_profiler(robot_id, robot_name):
+    mode = os.environ.get('DAL_PROFILE', '').strip()
+    if not mode or mode == '0':
+        return NullProfiler()
+    if mode == 'udp':
+        print(f"[PROFILE] Step timing -> UDP :{TELEMETRY_PORT}")
+        return StepProfiler(robot_id, robot_name, udp_addr=('localhost', TELEMETRY_PORT))
+    print(f"[PROFILE] Step timing -> {mode}")
+    return StepProfiler(robot_id, robot_name, file_path=mode)